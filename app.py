@@ -1,50 +1,110 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify
 from flask_cors import CORS
 import json
 import sqlite3
 import os
+import atexit
+import time
 from datetime import datetime
+import config
 from models.qwen_model import QwenMedicalAssistant
 from models.medical_db import MedicalKnowledgeBase
 from models.conversation_manager import ConversationManager
 from models.free_ai_model import FreeAIModel
+from models.response_cache import ResponseCache
+from models.conversation_store import ConversationWriter, ConversationHistory, init_schema
+from models.knowledge_store import get_knowledge_store
+from models.context_builder import ConversationContextBuilder
+from models.metrics import CHAT_STAGE_SECONDS, RATE_LIMITED_TOTAL, REQUEST_SECONDS, get_registry
+from models.rate_limiter import create_rate_limiter, retry_after_header
 
 app = Flask(__name__)
 CORS(app)
 
 # Initialize AI models - Free AI is lightweight and always available
 print("🤖 Initializing AI Models...")
-free_ai = FreeAIModel()  # Free, lightweight AI for general chat
-ai_assistant = QwenMedicalAssistant()  # Optional, heavier model
+response_cache = ResponseCache(config.RESPONSE_CACHE_SIZE, config.RESPONSE_CACHE_TTL) if config.RESPONSE_CACHE_ENABLED else None
+free_ai = FreeAIModel(cache=response_cache)  # Free, lightweight AI for general chat
+ai_assistant = QwenMedicalAssistant(background=config.AI_MODEL_BACKGROUND_LOAD, cache=response_cache)  # Optional, heavier model
+app_started_at = datetime.now()
 
-# Initialize medical knowledge base
+# Initialize medical knowledge base; its snapshot is shared with the conversation manager
 medical_db = MedicalKnowledgeBase()
+knowledge_store = get_knowledge_store()
+knowledge_store.start_watcher()
 
-# Initialize conversation manager with free AI
-conversation_manager = ConversationManager(ai_model=free_ai)
+# Conversation turns are written behind the request path in batches
+conversation_writer = ConversationWriter(
+    config.DATABASE_PATH,
+    batch_size=config.DB_WRITE_BATCH_SIZE,
+    flush_interval=config.DB_WRITE_FLUSH_INTERVAL
+)
+atexit.register(conversation_writer.close)
+conversation_history = ConversationHistory(config.DATABASE_PATH)
+
+# Prior turns for model prompts: kept in memory, read back from the database on a miss
+context_builder = ConversationContextBuilder(
+    conversation_history if config.ENABLE_CONVERSATION_STORAGE else None,
+    max_tokens=config.CONTEXT_MAX_TOKENS,
+    summary_max_tokens=config.CONTEXT_SUMMARY_MAX_TOKENS,
+    turn_max_tokens=config.CONTEXT_TURN_MAX_TOKENS,
+    max_turns=config.CONTEXT_RECENT_TURNS,
+    max_sessions=config.SESSION_MAX_ACTIVE
+) if config.CONTEXT_ENABLED else None
+
+# Initialize conversation manager with free AI; the local model takes over once loaded
+conversation_manager = ConversationManager(ai_model=free_ai, local_model=ai_assistant,
+                                           context_builder=context_builder)
+
+# Chat requests are limited per client IP and per session, before any model work
+rate_limiter = create_rate_limiter() if config.RATE_LIMIT_ENABLED else None
+RATE_LIMITED_ENDPOINTS = ('chat', 'chat_stream')
+
+_STORE_STAGE = CHAT_STAGE_SECONDS.labels('store')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    # Streamed responses are timed until their headers are ready
+    started = g.get('request_started')
+    if started is not None:
+        REQUEST_SECONDS.labels(request.endpoint or 'unmatched', str(response.status_code)).observe(
+            time.perf_counter() - started)
+    return response
+
+def check_rate_limit(client_ip, session_id):
+    """Take a token for the client's IP and session; the denying decision, or None if allowed."""
+    keys = [('ip', client_ip)]
+    if session_id:
+        keys.append(('session', session_id))
+    for key_type, value in keys:
+        decision = rate_limiter.acquire(f"{key_type}:{value}")
+        if not decision.allowed:
+            RATE_LIMITED_TOTAL.labels(key_type).inc()
+            return decision
+    return None
+
+def rate_limited_body(decision):
+    return {'error': 'Too many requests, please slow down', 'retry_after': retry_after_header(decision)}
+
+@app.before_request
+def enforce_rate_limit():
+    if rate_limiter is None or request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
+    data = request.get_json(silent=True)
+    session_id = data.get('session_id') if isinstance(data, dict) else None
+    decision = check_rate_limit(request.remote_addr, session_id)
+    if decision is None:
+        return None
+    return jsonify(rate_limited_body(decision)), 429, {'Retry-After': retry_after_header(decision)}
 
 # Database setup
 def init_db():
-    conn = sqlite3.connect('healthai.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            message TEXT,
-            response TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
-        )
-    ''')
-    conn.commit()
+    conn = sqlite3.connect(config.DATABASE_PATH)
+    init_schema(conn)
     conn.close()
 
 @app.route('/')
@@ -54,8 +114,10 @@ def index():
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
-        data = request.get_json()
-        user_message = data.get('message', '').strip()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        user_message = str(data.get('message', '')).strip()
         session_id = data.get('session_id', 'default')
         
         if not user_message:
@@ -67,21 +129,128 @@ def chat():
         # Store conversation in database
         store_conversation(session_id, user_message, conversation_result.get('response', ''))
         
-        # Prepare response with conversation state
-        response_data = {
-            'response': conversation_result.get('response', ''),
-            'session_id': session_id,
-            'timestamp': datetime.now().isoformat(),
-            'stage': conversation_result.get('stage', 'general'),
-            'next_question': conversation_result.get('next_question'),
-            'medications': conversation_result.get('medications', []),
-            'recommendations': conversation_result.get('recommendations', [])
-        }
+        return jsonify(chat_payload(session_id, conversation_result))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def chat_payload(session_id, conversation_result):
+    """Response body of /api/chat: the reply with the conversation state."""
+    return {
+        'response': conversation_result.get('response', ''),
+        'session_id': session_id,
+        'timestamp': datetime.now().isoformat(),
+        'stage': conversation_result.get('stage', 'general'),
+        'next_question': conversation_result.get('next_question'),
+        'medications': conversation_result.get('medications', []),
+        'recommendations': conversation_result.get('recommendations', []),
+        'knowledge_version': knowledge_store.current.version
+    }
+
+def stream_meta(session_id, conversation_result):
+    """The 'meta' event of /api/chat/stream: conversation state before any tokens."""
+    return {
+        'session_id': session_id,
+        'stage': conversation_result.get('stage', 'general'),
+        'next_question': conversation_result.get('next_question'),
+        'medications': conversation_result.get('medications', []),
+        'recommendations': conversation_result.get('recommendations', []),
+        'knowledge_version': knowledge_store.current.version
+    }
+
+def sse_event(event, data):
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Chat endpoint that streams the response as Server-Sent Events.
+    
+    Emits a 'meta' event with the conversation state, one 'token' event per
+    generated chunk, and a final 'done' event with the full response.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        user_message = str(data.get('message', '')).strip()
+        session_id = data.get('session_id', 'default')
+        
+        if not user_message:
+            return jsonify({'error': 'Message cannot be empty'}), 400
         
-        return jsonify(response_data)
+        conversation_result = conversation_manager.process_message(session_id, user_message, stream=True)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        response = conversation_result.get('response', '')
+        chunks = [response] if isinstance(response, str) else response
+        
+        yield sse_event('meta', stream_meta(session_id, conversation_result))
+        
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event('token', {'text': chunk})
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+        
+        full_response = ''.join(parts)
+        store_conversation(session_id, user_message, full_response)
+        
+        yield sse_event('done', {
+            'response': full_response,
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/healthz')
+def healthz():
+    """Liveness check: the process is up and serving requests."""
+    return jsonify({
+        'status': 'ok',
+        'uptime_seconds': round((datetime.now() - app_started_at).total_seconds(), 3),
+        'free_ai_available': free_ai.is_available(),
+        'free_ai_http': free_ai.get_stats(),
+        'ai_model': ai_assistant.get_load_status(),
+        'ai_batching': ai_assistant.get_batch_stats(),
+        'ai_prefix_cache': ai_assistant.get_prefix_cache_stats(),
+        'ai_coalescing': ai_assistant.get_coalescing_stats(),
+        'response_cache': response_cache.get_stats() if response_cache else {},
+        'triage': conversation_manager.get_triage_stats(),
+        'sessions': conversation_manager.get_session_stats(),
+        'knowledge': knowledge_store.get_stats(),
+        'conversation_writer': conversation_writer.get_stats(),
+        'conversation_context': context_builder.get_stats() if context_builder else {},
+        'rate_limit': rate_limiter.get_stats() if rate_limiter else {}
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Stage latency histograms and response path counters in Prometheus text format."""
+    return Response(get_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/readyz')
+def readyz():
+    """Readiness check: 503 while the AI model is still loading.
+
+    A model that failed to load is reported as ready in fallback mode, since
+    waiting longer will not change what this worker can serve.
+    """
+    model_status = ai_assistant.get_load_status()
+    ready = model_status['state'] in ('ready', 'failed')
+    return jsonify({
+        'ready': ready,
+        'mode': 'ai_model' if ai_assistant.is_ready() else 'fallback',
+        'ai_model': model_status
+    }), 200 if ready else 503
 
 @app.route('/api/medical-info/<symptom>')
 def get_medical_info(symptom):
@@ -91,21 +260,35 @@ def get_medical_info(symptom):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def store_conversation(session_id, message, response):
-    conn = sqlite3.connect('healthai.db')
-    cursor = conn.cursor()
-    
-    # Ensure session exists
-    cursor.execute('INSERT OR IGNORE INTO chat_sessions (session_id) VALUES (?)', (session_id,))
+@app.route('/api/sessions/<session_id>/messages')
+def get_session_messages(session_id):
+    """Page through a session's history, newest page first.
     
-    # Store message and response
-    cursor.execute('''
-        INSERT INTO messages (session_id, message, response)
-        VALUES (?, ?, ?)
-    ''', (session_id, message, response))
-    
-    conn.commit()
-    conn.close()
+    Query parameters: limit (default 50), and either before=<next_cursor>
+    for older messages or after=<prev_cursor> for newer ones.
+    """
+    try:
+        limit = request.args.get('limit', 50, type=int)
+        page = conversation_history.get_messages(
+            session_id,
+            limit=limit,
+            before=request.args.get('before'),
+            after=request.args.get('after')
+        )
+        page['session_id'] = session_id
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def store_conversation(session_id, message, response):
+    with _STORE_STAGE.timer():
+        # Remember the turn for the next prompt before it is queued for the database
+        if context_builder is not None:
+            context_builder.record_turn(session_id, message, response)
+        if config.ENABLE_CONVERSATION_STORAGE:
+            conversation_writer.enqueue(session_id, message, response)
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,192 @@
+"""
+HealthAI ASGI entry point (async serving mode)
+/api/chat and /api/chat/stream run on the event loop, so requests waiting on
+the Inference API hold no thread; blocking local model calls run on a
+dedicated executor, and session, history and rate limit lookups on the
+loop's default one. Every other route is served by the Flask app.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from a2wsgi import WSGIMiddleware
+
+import config
+from app import (app as flask_app, chat_payload, check_rate_limit, conversation_manager, conversation_writer,
+                 free_ai, init_db, rate_limited_body, rate_limiter, sse_event, store_conversation, stream_meta)
+from models.metrics import REQUEST_SECONDS
+from models.rate_limiter import retry_after_header
+
+# Local model generation blocks; it gets its own threads, apart from the loop's default executor
+model_executor = ThreadPoolExecutor(max_workers=config.ASYNC_MODEL_WORKERS, thread_name_prefix="model")
+conversation_manager.model_executor = model_executor
+
+# Routes not handled below run in the Flask app on a thread pool
+wsgi_application = WSGIMiddleware(flask_app)
+
+_CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+async def read_json(receive):
+    """Read the whole request body and parse it as JSON."""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return json.loads(body or b'null')
+
+
+async def send_json(send, status, data, headers=()):
+    body = json.dumps(data).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] +
+                   _CORS_HEADERS + list(headers)
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def parse_chat_request(scope, receive):
+    """(session_id, message) of a chat request, or (None, (status, body, headers)) if it is refused."""
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        data = None
+
+    # Rate limit first, like the Flask app's before_request hook
+    if rate_limiter is not None:
+        client_ip = scope['client'][0] if scope.get('client') else None
+        session_id = data.get('session_id') if isinstance(data, dict) else None
+        # The SQLite backend blocks on its database lock; keep it off the loop
+        loop = asyncio.get_running_loop()
+        decision = await loop.run_in_executor(None, check_rate_limit, client_ip, session_id)
+        if decision is not None:
+            retry_after = retry_after_header(decision).encode()
+            return None, (429, rate_limited_body(decision), [(b'retry-after', retry_after)])
+
+    if not isinstance(data, dict):
+        return None, (400, {'error': 'Request body must be a JSON object'}, [])
+    user_message = str(data.get('message', '')).strip()
+    if not user_message:
+        return None, (400, {'error': 'Message cannot be empty'}, [])
+    return data.get('session_id', 'default'), user_message
+
+
+async def chat(scope, receive, send):
+    """Async /api/chat, same request and response as the Flask route."""
+    started = time.perf_counter()
+    session_id, user_message = await parse_chat_request(scope, receive)
+    headers = []
+    if session_id is None:
+        status, data, headers = user_message
+    else:
+        try:
+            conversation_result = await conversation_manager.process_message_async(session_id, user_message)
+            store_conversation(session_id, user_message, conversation_result.get('response', ''))
+            status, data = 200, chat_payload(session_id, conversation_result)
+        except Exception as e:
+            status, data = 500, {'error': str(e)}
+
+    await send_json(send, status, data, headers)
+    REQUEST_SECONDS.labels('chat', str(status)).observe(time.perf_counter() - started)
+
+
+async def chat_stream(scope, receive, send):
+    """Async /api/chat/stream: 'meta', 'token' per chunk, then 'done' as Server-Sent Events."""
+    started = time.perf_counter()
+    session_id, user_message = await parse_chat_request(scope, receive)
+    if session_id is None:
+        status, data, headers = user_message
+        await send_json(send, status, data, headers)
+        REQUEST_SECONDS.labels('chat_stream', str(status)).observe(time.perf_counter() - started)
+        return
+    try:
+        conversation_result = await conversation_manager.process_message_async(session_id, user_message, stream=True)
+    except Exception as e:
+        await send_json(send, 500, {'error': str(e)})
+        REQUEST_SECONDS.labels('chat_stream', '500').observe(time.perf_counter() - started)
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')] + _CORS_HEADERS
+    })
+    # Timed until the headers are sent, like the Flask route
+    REQUEST_SECONDS.labels('chat_stream', '200').observe(time.perf_counter() - started)
+
+    async def emit(event, payload):
+        await send({'type': 'http.response.body', 'body': sse_event(event, payload).encode('utf-8'),
+                    'more_body': True})
+
+    await emit('meta', stream_meta(session_id, conversation_result))
+
+    response = conversation_result.get('response', '')
+    parts = []
+    try:
+        if isinstance(response, str):
+            parts.append(response)
+            await emit('token', {'text': response})
+        else:
+            async for chunk in response:
+                parts.append(chunk)
+                await emit('token', {'text': chunk})
+    except Exception as e:
+        await emit('error', {'error': str(e)})
+
+    full_response = ''.join(parts)
+    store_conversation(session_id, user_message, full_response)
+    await emit('done', {'response': full_response, 'timestamp': datetime.now().isoformat()})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('POST', '/api/chat/stream'): chat_stream,
+}
+
+
+async def lifespan(receive, send):
+    """Set up the database on startup; close the API client, executor and writer on shutdown."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            init_db()
+            print("🏥 HealthAI Chatbot (async mode) started")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if free_ai._async_http is not None:
+                await free_ai.async_http.close()
+            model_executor.shutdown(wait=False)
+            conversation_writer.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application: async chat routes, everything else through Flask."""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    handler = ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is not None:
+        await handler(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("📱 Access the application at: http://localhost:5000")
+    uvicorn.run(application, host=config.HOST, port=config.PORT)
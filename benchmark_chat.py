@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+HealthAI End-to-End Chat Benchmark
+Replays scripted conversations against /api/chat, through the Flask test
+client and through real HTTP servers (threaded WSGI, and the async ASGI mode
+under uvicorn) under concurrent clients, and reports p50/p95/p99 latency and
+requests/sec per scenario
+
+The Hugging Face Inference API is replaced by a local stub with configurable
+latency and error distributions, so runs are repeatable and offline.
+
+Usage:
+    python benchmark_chat.py --clients 8 --iterations 5 --output chat_bench.json
+    python benchmark_chat.py --stub-latency lognormal:400:0.5 --stub-errors 503:0.05,reset:0.01
+    python benchmark_chat.py --compare chat_bench.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Each scenario is one conversation; every replay runs it in a new session
+SCENARIOS = {
+    'symptom_flow': [
+        "I have a headache",
+        "It started yesterday morning",
+        "About 6 out of 10",
+        "Lots of stress at work makes it worse",
+        "I have tried drinking more water",
+        "Thanks, what else can I do to feel better?",
+    ],
+    'general_questions': [
+        "What is a healthy amount of sleep for an adult?",
+        "How much water should I drink every day?",
+        "Is it okay to exercise when I have a cold?",
+        "What are good habits for a healthy heart?",
+    ],
+    # Both messages take the triage fast path; no model call is made
+    'emergency': [
+        "I have severe chest pain and difficulty breathing",
+        "My father cannot speak properly and his face is drooping",
+    ],
+}
+
+STUB_REPLY = ("Staying hydrated, resting well and eating balanced meals help most people "
+              "recover. Please see a doctor if your symptoms get worse.")
+
+
+def parse_latency(spec):
+    """
+    Latency distribution from a spec string; returns a sampler of seconds.
+
+    fixed:MS, uniform:LOW_MS:HIGH_MS, exponential:MEAN_MS or
+    lognormal:MEDIAN_MS:SIGMA
+    """
+    kind, *values = spec.split(':')
+    values = [float(value) for value in values]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == 'exponential' and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0]) / 1000 if values[0] else 0.0
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda: random.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+def parse_errors(spec):
+    """Error distribution from "STATUS:RATE,..." ("reset" drops the connection); returns a sampler."""
+    outcomes = []
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        outcome, rate = item.rsplit(':', 1)
+        outcomes.append((outcome if outcome == 'reset' else int(outcome), float(rate)))
+    if sum(rate for _, rate in outcomes) > 1:
+        raise ValueError(f"Error rates add up to more than 1: {spec}")
+
+    def sample():
+        draw = random.random()
+        for outcome, rate in outcomes:
+            if draw < rate:
+                return outcome
+            draw -= rate
+        return None
+    return sample
+
+
+class InferenceStub:
+    """
+    Local stand-in for the Hugging Face Inference API.
+
+    Answers text-generation requests (plain and streamed) after a sampled
+    delay, or fails them with a sampled status code or connection reset.
+    """
+
+    def __init__(self, latency="fixed:200", errors="", host="127.0.0.1", port=0):
+        self.sample_latency = parse_latency(latency)
+        self.sample_error = parse_errors(errors)
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+            # Buffer the response so headers and body leave in one write; separate small
+            # writes on a keep-alive connection stall ~40 ms on Nagle plus delayed ACK
+            wbufsize = -1
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+                stub.handle(self, payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/models"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, handler, payload):
+        time.sleep(self.sample_latency())
+        error = self.sample_error()
+        with self._lock:
+            self.requests += 1
+            self.failures += error is not None
+
+        if error == 'reset':
+            handler.close_connection = True
+            handler.connection.shutdown(2)
+            return
+        if error is not None:
+            self._send(handler, error, 'application/json', json.dumps({"error": "stub failure"}).encode())
+            return
+
+        if payload.get('stream'):
+            events = [{"token": {"text": word + " ", "special": False}} for word in STUB_REPLY.split()]
+            events.append({"token": {"text": "</s>", "special": True}, "generated_text": STUB_REPLY})
+            body = "".join(f"data: {json.dumps(event)}\n\n" for event in events).encode()
+            self._send(handler, 200, 'text/event-stream', body)
+        else:
+            self._send(handler, 200, 'application/json', json.dumps([{"generated_text": STUB_REPLY}]).encode())
+
+    @staticmethod
+    def _send(handler, status, content_type, body):
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def get_stats(self):
+        return {'requests': self.requests, 'failures': self.failures}
+
+
+def load_app(args, workdir):
+    """Import the Flask app configured for benchmarking: stubbed API, throwaway database."""
+    import config
+
+    config.HF_API_BASE_URL = args.stub_url
+    config.HF_REQUEST_BUDGET = args.request_budget
+    config.RESPONSE_CACHE_ENABLED = args.response_cache
+    # Every client comes from one IP; the limiter would turn the run into a 429 benchmark
+    config.RATE_LIMIT_ENABLED = args.rate_limit
+    config.DATABASE_PATH = os.path.join(workdir, "bench.db")
+    config.SESSION_STORE_BACKEND = "memory"
+    config.KNOWLEDGE_RELOAD_INTERVAL = 0
+    # Unless a local model is given, point at an empty directory so loading
+    # fails at once and the app serves through the (stubbed) Inference API
+    config.AI_MODEL_NAME = args.local_model or workdir
+
+    import app as healthai
+    healthai.init_db()
+
+    if args.local_model:
+        while healthai.ai_assistant.get_load_status()['state'] == 'loading':
+            time.sleep(0.5)
+    return healthai
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run_scenario(make_sender, scenario, clients, iterations):
+    """Replay a scenario's conversation from concurrent clients and summarize the latencies."""
+    messages = SCENARIOS[scenario]
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def client(number):
+        send = make_sender()
+        local_latencies, local_statuses = [], {}
+        for iteration in range(iterations):
+            session_id = f"bench-{scenario}-{number}-{iteration}-{uuid.uuid4().hex[:8]}"
+            for message in messages:
+                started = time.perf_counter()
+                try:
+                    status = send(session_id, message)
+                except Exception as e:
+                    status = type(e).__name__
+                local_latencies.append(time.perf_counter() - started)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'scenario': scenario,
+        'clients': clients,
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status != 200),
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'requests_per_second': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'duration_seconds': round(elapsed, 3)
+    }
+
+
+def test_client_sender(flask_app):
+    """Sender factory posting through the Flask test client (no network)."""
+    def make_sender():
+        client = flask_app.test_client()
+
+        def send(session_id, message):
+            return client.post('/api/chat', json={'message': message, 'session_id': session_id}).status_code
+        return send
+    return make_sender
+
+
+def http_sender(base_url):
+    """Sender factory posting over HTTP, one keep-alive session per client."""
+    import requests
+
+    def make_sender():
+        session = requests.Session()
+
+        def send(session_id, message):
+            response = session.post(f"{base_url}/api/chat", json={'message': message, 'session_id': session_id},
+                                    timeout=60)
+            response.content  # read the whole body, as a browser would
+            return response.status_code
+        return send
+    return make_sender
+
+
+def start_server(flask_app):
+    """Serve the app from a threaded WSGI server on a free local port."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_asgi_server():
+    """Serve the async mode (asgi.py) from uvicorn on a free local port."""
+    import socket
+    import uvicorn
+    import asgi
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(asgi.application, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, port
+
+
+def compare(results, baseline_path, max_regression):
+    """Print p95 and throughput changes against a saved run; True if within the allowed regression."""
+    with open(baseline_path) as f:
+        baseline = {(row['target'], row['scenario']): row for row in json.load(f)['results']}
+
+    print(f"\nComparison with {baseline_path}:")
+    passed = True
+    for row in results:
+        before = baseline.get((row['target'], row['scenario']))
+        if before is None:
+            continue
+        p95_change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        rps_change = ((row['requests_per_second'] - before['requests_per_second']) / before['requests_per_second']
+                      if before['requests_per_second'] else 0.0)
+        regressed = p95_change > max_regression or rps_change < -max_regression
+        passed = passed and not regressed
+        print(f"{'❌' if regressed else '✅'} {row['target']}/{row['scenario']}: "
+              f"p95 {before['p95_ms']} -> {row['p95_ms']}ms ({p95_change:+.0%}), "
+              f"{before['requests_per_second']} -> {row['requests_per_second']} req/s ({rps_change:+.0%})")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/chat end to end")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument('--targets', default='test_client,server',
+                        help="Comma-separated: test_client, server (threaded WSGI), asgi (uvicorn)")
+    parser.add_argument('--clients', type=int, default=4, help="Concurrent clients per scenario")
+    parser.add_argument('--iterations', type=int, default=3, help="Conversations replayed per client")
+    parser.add_argument('--stub-latency', default='lognormal:250:0.4',
+                        help="fixed:MS, uniform:LOW:HIGH, exponential:MEAN or lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--stub-errors', default='', help="e.g. 503:0.05,500:0.01,reset:0.01")
+    parser.add_argument('--api-url', help="Use this Inference API base URL instead of the local stub")
+    parser.add_argument('--request-budget', type=float, default=10, help="config.HF_REQUEST_BUDGET for the run")
+    parser.add_argument('--response-cache', action='store_true', help="Keep the response cache enabled")
+    parser.add_argument('--rate-limit', action='store_true', help="Keep request rate limiting enabled")
+    parser.add_argument('--local-model', help="Load this local model (path or name) before the run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Compare against a previous --output file")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Allowed fractional p95/throughput regression for --compare")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    targets = [name.strip() for name in args.targets.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS] + \
+              [name for name in targets if name not in ('test_client', 'server', 'asgi')]
+    if unknown:
+        parser.error(f"Unknown scenario or target: {', '.join(unknown)}")
+
+    random.seed(args.seed)
+    print("🩺 HealthAI Chat Benchmark")
+    print("=" * 50)
+
+    stub = None
+    if args.api_url:
+        args.stub_url = args.api_url
+    else:
+        stub = InferenceStub(args.stub_latency, args.stub_errors).start()
+        args.stub_url = stub.base_url
+        print(f"Inference API stub: {args.stub_latency}, errors: {args.stub_errors or 'none'}")
+
+    workdir = tempfile.mkdtemp(prefix="healthai-bench-")
+    healthai = load_app(args, workdir)
+
+    senders = {}
+    server = asgi_server = None
+    if 'test_client' in targets:
+        senders['test_client'] = test_client_sender(healthai.app)
+    if 'server' in targets:
+        server = start_server(healthai.app)
+        senders['server'] = http_sender(f"http://127.0.0.1:{server.server_port}")
+    if 'asgi' in targets:
+        asgi_server, asgi_port = start_asgi_server()
+        senders['asgi'] = http_sender(f"http://127.0.0.1:{asgi_port}")
+
+    results = []
+    try:
+        for target in targets:
+            for scenario in scenarios:
+                result = run_scenario(senders[target], scenario, args.clients, args.iterations)
+                result['target'] = target
+                results.append(result)
+                print(f"{'✅' if not result['errors'] else '⚠️'} {target}/{scenario}: "
+                      f"p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, p99 {result['p99_ms']}ms, "
+                      f"{result['requests_per_second']} req/s ({result['requests']} requests, "
+                      f"{result['errors']} errors)")
+    finally:
+        if server:
+            server.shutdown()
+        if asgi_server:
+            asgi_server.should_exit = True
+        healthai.conversation_writer.close()
+        if stub:
+            stub.stop()
+
+    report = {
+        'settings': {
+            'clients': args.clients,
+            'iterations': args.iterations,
+            'stub_latency': None if args.api_url else args.stub_latency,
+            'stub_errors': None if args.api_url else args.stub_errors,
+            'api_url': args.api_url,
+            'request_budget': args.request_budget,
+            'response_cache': args.response_cache,
+            'rate_limit': args.rate_limit,
+            'local_model': args.local_model
+        },
+        'stub': stub.get_stats() if stub else None,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare and not compare(results, args.compare, args.max_regression):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
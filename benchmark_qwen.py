@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+HealthAI Qwen Precision Benchmark
+Compares load time, resident memory and generation speed of the model
+precisions supported by QwenMedicalAssistant (config.AI_MODEL_PRECISION),
+and prompt prefill time with and without the system-prompt KV cache
+
+Each precision runs in its own process so memory numbers don't overlap.
+
+Usage:
+    python benchmark_qwen.py --modes fp32,bf16,int8 --max-new-tokens 64
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROMPTS = [
+    "What are common causes of a headache?",
+    "How can I bring down a fever at home?",
+    "When should I see a doctor about a cough?",
+    "What helps with mild stomach pain after eating?",
+]
+
+
+def resident_memory_mb():
+    """Current resident set size of this process in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Not Linux: fall back to the peak
+    return peak_memory_mb()
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process so far in MB (ru_maxrss)."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_mode(precision, prompts, max_new_tokens):
+    """Load the model in one precision and time generation on the prompts."""
+    import torch
+    import config
+    from models.qwen_model import QwenMedicalAssistant
+
+    config.AI_BATCHING_ENABLED = False
+    config.AI_MAX_LENGTH = max_new_tokens
+    torch.manual_seed(0)
+
+    baseline_mb = resident_memory_mb()
+    assistant = QwenMedicalAssistant(precision=precision)
+    if not assistant.is_ready():
+        return {'precision': precision, 'error': assistant.load_error}
+    loaded_mb = resident_memory_mb()
+    # Loading can briefly hold more than the loaded model (int8 quantizes from float32 weights)
+    load_peak_mb = peak_memory_mb()
+
+    tokenizer, model = assistant.tokenizer, assistant.model
+    generated_tokens = 0
+    latencies = []
+    for prompt in prompts:
+        inputs = tokenizer(assistant._build_prompt(prompt), return_tensors="pt").to(assistant.device)
+        inputs.pop("token_type_ids", None)
+        started = time.perf_counter()
+        with torch.no_grad():
+            output = model.generate(**inputs, **assistant._generation_kwargs())
+        latencies.append(time.perf_counter() - started)
+        new_tokens = output[0, inputs["input_ids"].shape[1]:]
+        generated_tokens += int((new_tokens != tokenizer.pad_token_id).sum())
+
+    full_prefill, cached_prefill = measure_prefill(assistant, prompts)
+    total_seconds = sum(latencies)
+    return {
+        'precision': assistant.precision,
+        'device': assistant.device,
+        'load_time_seconds': round(assistant.load_time, 3),
+        'rss_mb': round(loaded_mb, 1),
+        'model_rss_mb': round(loaded_mb - baseline_mb, 1),
+        'load_peak_rss_mb': round(load_peak_mb, 1),
+        'model_load_peak_mb': round(load_peak_mb - baseline_mb, 1),
+        'peak_rss_mb': round(peak_memory_mb(), 1),
+        'generated_tokens': generated_tokens,
+        'tokens_per_second': round(generated_tokens / total_seconds, 2) if total_seconds else 0.0,
+        'avg_latency_seconds': round(total_seconds / len(prompts), 3),
+        'prefill_ms_full_prompt': round(full_prefill * 1000, 3),
+        'prefill_ms_prefix_cached': round(cached_prefill * 1000, 3) if cached_prefill is not None else None
+    }
+
+
+def measure_prefill(assistant, prompts, runs=3):
+    """Average prefill time per prompt: whole prompt vs. suffix on top of the cached prefix."""
+    import torch
+
+    prefix_cache = assistant.prefix_cache
+    full_times, cached_times = [], []
+    with torch.no_grad():
+        for prompt in prompts:
+            inputs = assistant.tokenizer(assistant._build_prompt(prompt), return_tensors="pt").to(assistant.device)
+            for _ in range(runs):
+                started = time.perf_counter()
+                assistant.model(input_ids=inputs["input_ids"], use_cache=True)
+                full_times.append(time.perf_counter() - started)
+            if prefix_cache and prefix_cache.ready:
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    prepared, _ = prefix_cache.prepare([assistant._build_prompt(prompt)])
+                    # generate() still runs the last prompt token; count it too
+                    assistant.model(input_ids=prepared['input_ids'][:, -1:],
+                                    past_key_values=prepared['past_key_values'], use_cache=True)
+                    cached_times.append(time.perf_counter() - started)
+
+    full = sum(full_times) / len(full_times)
+    cached = sum(cached_times) / len(cached_times) if cached_times else None
+    return full, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Qwen model precisions")
+    parser.add_argument('--modes', default='fp32,bf16,int8', help="Comma-separated precisions to compare")
+    parser.add_argument('--model', help="Model name or path (defaults to config.AI_MODEL_NAME)")
+    parser.add_argument('--max-new-tokens', type=int, default=64)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.model:
+        os.environ['HEALTHAI_BENCH_MODEL'] = args.model
+
+    if args.worker:
+        # Child process: benchmark one precision and print the result as JSON
+        model = os.environ.get('HEALTHAI_BENCH_MODEL')
+        if model:
+            import config
+            config.AI_MODEL_NAME = model
+        result = run_mode(args.worker, PROMPTS, args.max_new_tokens)
+        print("BENCHMARK_RESULT " + json.dumps(result))
+        return 0
+
+    print("🩺 HealthAI Qwen Precision Benchmark")
+    print("=" * 50)
+
+    results = []
+    for mode in [mode.strip() for mode in args.modes.split(',') if mode.strip()]:
+        print(f"\nBenchmarking {mode}...")
+        completed = subprocess.run(
+            [sys.executable, __file__, '--worker', mode, '--max-new-tokens', str(args.max_new_tokens)],
+            capture_output=True, text=True, env=os.environ.copy()
+        )
+        result = None
+        for line in completed.stdout.splitlines():
+            if line.startswith("BENCHMARK_RESULT "):
+                result = json.loads(line[len("BENCHMARK_RESULT "):])
+        if result is None:
+            result = {'precision': mode, 'error': (completed.stderr.strip().splitlines() or ['no result'])[-1]}
+        results.append(result)
+
+        if 'error' in result:
+            print(f"❌ {mode}: {result['error']}")
+        else:
+            print(f"✅ {result['precision']}: load {result['load_time_seconds']}s, "
+                  f"RSS {result['rss_mb']} MB (model {result['model_rss_mb']} MB, "
+                  f"{result['model_load_peak_mb']} MB at peak while loading), "
+                  f"{result['tokens_per_second']} tokens/sec")
+            if result['prefill_ms_prefix_cached'] is not None:
+                print(f"   prefill {result['prefill_ms_full_prompt']}ms -> "
+                      f"{result['prefill_ms_prefix_cached']}ms with the prefix cache")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    return 0 if all('error' not in result for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,14 +12,67 @@ AI_MODEL_NAME = "Qwen/Qwen-7B-Chat"
 AI_MODEL_DEVICE = "auto"  # auto, cpu, cuda
 AI_MAX_LENGTH = 200
 AI_TEMPERATURE = 0.7
+# Weight precision: "auto" (float16 on GPU, float32 on CPU), "fp32", "bf16", or
+# "int8" (dynamic int8 quantization of linear layers; CPU only, ~4x less memory than fp32
+# once loaded, but loading peaks at the fp32 size since it quantizes from fp32 weights)
+AI_MODEL_PRECISION = "auto"
+AI_PREFIX_CACHE_ENABLED = True  # Prefill the system prompt once and reuse its KV cache
+AI_MODEL_BACKGROUND_LOAD = True  # Load model weights off the startup path; fallbacks serve meanwhile
+AI_BATCHING_ENABLED = True  # Group concurrent generation requests into one model call
+AI_BATCH_MAX_SIZE = 8
+AI_BATCH_MAX_WAIT_MS = 10  # How long a request waits for others to join its batch
+ASYNC_MODEL_WORKERS = 16  # Threads waiting on local model calls in async serving mode (asgi.py)
+
+# Hugging Face Inference API Settings
+HF_API_BASE_URL = "https://api-inference.huggingface.co/models"  # Point at a compatible endpoint or a local stub
+HF_POOL_SIZE = 10  # Keep-alive connections (and background request workers)
+HF_CONNECT_TIMEOUT = 3.05
+HF_READ_TIMEOUT = 15  # Kept under HF_REQUEST_BUDGET so an abandoned request frees its pool worker soon after
+HF_MAX_RETRIES = 2  # Retries on timeouts, connection errors and 429/502/503/504
+HF_BACKOFF_BASE = 0.5  # Seconds; full-jitter exponential backoff
+HF_BACKOFF_MAX = 8
+HF_REQUEST_BUDGET = 20  # Max seconds a request waits on the API before using the fallback
+HF_ASYNC_MAX_CONNECTIONS = 1000  # Concurrent API connections in async serving mode (asgi.py)
+HF_CIRCUIT_BREAKER_ENABLED = True  # Serve the fallback at once while the API keeps failing
+HF_CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failed or timed-out calls that open the circuit
+HF_CIRCUIT_RESET_TIMEOUT = 30  # Seconds the circuit stays open before a trial call
+HF_CIRCUIT_HALF_OPEN_CALLS = 1  # Trial calls allowed at once while half-open
+
+# Response Cache Settings
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_SIZE = 1024  # Maximum cached model answers
+RESPONSE_CACHE_TTL = 3600  # Seconds before a cached answer expires
+REQUEST_COALESCING_ENABLED = True  # Identical prompts in flight at once share one model call
+
+# Knowledge Retrieval Settings
+RETRIEVAL_ENABLED = True  # Ground model prompts in passages from the knowledge base
+RETRIEVAL_TOP_K = 3
+RETRIEVAL_MIN_SCORE = 0.05  # Cosine similarity below which a passage is not used
+RETRIEVAL_FEATURES = 16384  # Width of the hashed TF-IDF vectors
+
+# Conversation Context Settings
+CONTEXT_ENABLED = True  # Give the models prior turns of the conversation
+CONTEXT_MAX_TOKENS = 512  # Budget for prior turns plus the summary of older ones
+CONTEXT_SUMMARY_MAX_TOKENS = 128
+CONTEXT_TURN_MAX_TOKENS = 160  # Longer turns are truncated
+CONTEXT_RECENT_TURNS = 12  # Turns kept in memory per session
 
 # Database Settings
 DATABASE_PATH = "healthai.db"
 MEDICAL_KNOWLEDGE_PATH = "data/medical_knowledge.json"
+KNOWLEDGE_RELOAD_INTERVAL = 5  # Seconds between checks for knowledge file edits (0 disables)
+DB_WRITE_BATCH_SIZE = 64  # Chat turns written per transaction
+DB_WRITE_FLUSH_INTERVAL = 0.5  # Max seconds a queued turn waits before it is written
 
 # Security Settings
 SECRET_KEY = "your-secret-key-change-this-in-production"
 SESSION_TIMEOUT = 3600  # 1 hour in seconds
+SESSION_MAX_ACTIVE = 10000  # Conversation states kept in memory; least recently used are evicted
+# Where conversation states live: "memory" (one process), "sqlite" or "shared_memory"
+# (shared by all worker processes on a host, so no sticky sessions are needed)
+SESSION_STORE_BACKEND = "memory"
+SESSION_DB_PATH = "healthai_sessions.db"
+SESSION_SHM_NAME = "healthai_sessions"
 
 # Privacy Settings
 ENABLE_CONVERSATION_STORAGE = True
@@ -33,12 +86,18 @@ MEDICAL_DISCLAIMER = "⚠️ **Important**: This is preliminary guidance only. P
 EMERGENCY_KEYWORDS = [
     "chest pain", "heart attack", "stroke", "difficulty breathing",
     "severe bleeding", "unconscious", "emergency", "911", "ambulance",
-    "suicidal", "self harm", "overdose", "severe allergic reaction"
+    "suicidal", "self harm", "overdose", "severe allergic reaction",
+    "face drooping", "face is drooping", "drooping face", "slurred speech", "cannot speak", "can't speak"
 ]
 
 # Rate Limiting
-RATE_LIMIT_REQUESTS_PER_MINUTE = 30
+RATE_LIMIT_REQUESTS_PER_MINUTE = 30  # Sustained chat requests per client IP and per session
 RATE_LIMIT_ENABLED = True
+RATE_LIMIT_BURST = 10  # Requests a client may send at once after being idle
+RATE_LIMIT_MAX_KEYS = 100000  # Buckets kept in memory; least recently used are dropped
+# Bucket storage: "memory" (per process) or "sqlite" (shared by worker processes on a host)
+RATE_LIMIT_BACKEND = "memory"
+RATE_LIMIT_DB_PATH = "healthai_rate_limits.db"
 
 # Logging
 LOG_LEVEL = "INFO"
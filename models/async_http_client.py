@@ -0,0 +1,187 @@
+"""
+Asyncio HTTP client for HealthAI's remote model calls
+Requests wait on one event loop instead of a worker thread each
+"""
+import asyncio
+import json as jsonlib
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiohttp
+
+from models.http_client import PooledHTTPClient
+
+
+class AsyncResponse:
+    """Status and fully read body of a response."""
+    __slots__ = ('status_code', 'content')
+
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self) -> Any:
+        return jsonlib.loads(self.content)
+
+
+class AsyncHTTPClient:
+    """
+    Keep-alive aiohttp client with the same retry policy as PooledHTTPClient.
+
+    The aiohttp session is created on first use and belongs to that event
+    loop; called from another loop, the client starts a new session there.
+    """
+
+    RETRY_STATUSES = PooledHTTPClient.RETRY_STATUSES
+
+    def __init__(self, max_connections: int = 1000, connect_timeout: float = 3.05, read_timeout: float = 30.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        """
+        Args:
+            max_connections: Maximum concurrent connections (requests beyond it wait for one)
+            connect_timeout: Seconds allowed to establish a connection
+            read_timeout: Seconds allowed between bytes of the response
+            max_retries: Retries after the first attempt on timeouts, connection errors and RETRY_STATUSES
+            backoff_base: Base of the exponential backoff in seconds
+            backoff_max: Upper bound of a single backoff in seconds
+        """
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._session = None
+        self._loop = None  # event loop the session was created on
+
+        # Counters; only touched from the event loop
+        self.total_requests = 0
+        self.total_attempts = 0
+        self.total_retries = 0
+        self.total_failures = 0
+        self.in_flight = 0
+        self.retry_reasons = {}  # status code or error name -> retries
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._loop is not loop:
+            await self._discard_session()
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._loop = loop
+        return self._session
+
+    async def _discard_session(self):
+        """Drop a session made on another event loop; its connections can't be used from this one."""
+        session, loop = self._session, self._loop
+        self._session = None
+        if session.closed:
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            # Its loop has finished: this only marks it closed; its sockets go when it is collected
+            await session.close()
+
+    async def open(self, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                   deadline: Optional[float] = None) -> aiohttp.ClientResponse:
+        """
+        POST with retries, returning the response with its body unread.
+
+        Args:
+            url: Request URL
+            json: JSON payload
+            headers: Extra request headers
+            deadline: time.monotonic() value after which no further retry starts
+
+        Returns:
+            The last response received (the caller must release it); raises the
+            last network error if none was received
+        """
+        session = await self._get_session()
+        self.total_requests += 1
+        attempt = 0
+
+        while True:
+            self.total_attempts += 1
+            try:
+                response = await session.post(url, json=json, headers=headers)
+                reason = response.status if response.status in self.RETRY_STATUSES else None
+                error = None
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                response = None
+                reason = type(e).__name__
+                error = e
+
+            if reason is None:
+                return response
+
+            delay = self._backoff(attempt)
+            if attempt >= self.max_retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                self.total_failures += 1
+                if error is not None:
+                    raise error
+                return response
+
+            if response is not None:
+                response.release()
+            self.total_retries += 1
+            self.retry_reasons[str(reason)] = self.retry_reasons.get(str(reason), 0) + 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def post(self, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                   deadline: Optional[float] = None) -> AsyncResponse:
+        """POST with retries and read the whole body."""
+        self.in_flight += 1
+        try:
+            response = await self.open(url, json, headers, deadline)
+            try:
+                return AsyncResponse(response.status, await response.read())
+            finally:
+                response.release()
+        finally:
+            self.in_flight -= 1
+
+    async def stream_lines(self, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                           deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """POST with retries and yield the body line by line; yields nothing on a non-200 status."""
+        self.in_flight += 1
+        try:
+            response = await self.open(url, json, headers, deadline)
+            try:
+                if response.status != 200:
+                    print(f"Streaming request failed with status {response.status}")
+                    return
+                async for line in response.content:
+                    yield line.decode("utf-8").rstrip("\r\n")
+            finally:
+                response.release()
+        finally:
+            self.in_flight -= 1
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get in-flight and retry counters."""
+        return {
+            'max_connections': self.max_connections,
+            'in_flight': self.in_flight,
+            'total_requests': self.total_requests,
+            'total_attempts': self.total_attempts,
+            'total_retries': self.total_retries,
+            'total_failures': self.total_failures,
+            'retry_reasons': dict(self.retry_reasons)
+        }
+
+    async def close(self):
+        """Close pooled connections."""
+        if self._session is None:
+            return
+        if self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        else:
+            await self._discard_session()
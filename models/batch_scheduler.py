@@ -0,0 +1,129 @@
+"""
+Dynamic micro-batching for HealthAI model generation
+Collects concurrent requests for a few milliseconds and runs them as one batch
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+
+class _PendingRequest:
+    """A queued prompt waiting for its batch to run."""
+    __slots__ = ('prompt', 'future', 'enqueued_at')
+
+    def __init__(self, prompt: Any):
+        self.prompt = prompt
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """Request queue that groups concurrent prompts into batched model calls."""
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 name: str = "micro-batcher"):
+        """
+        Args:
+            batch_fn: Called with a list of prompts, must return one result per prompt
+            max_batch_size: Largest number of prompts run together
+            max_wait_ms: How long the first prompt of a batch waits for company
+            name: Name of the worker thread
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # Counters
+        self.total_requests = 0
+        self.total_batches = 0
+        self.batch_size_counts = {}  # batch size -> number of batches
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def submit(self, prompt: Any) -> Any:
+        """Queue a prompt and block until its result is ready."""
+        self._ensure_worker()
+        request = _PendingRequest(prompt)
+        self._queue.put(request)
+        return request.future.result()
+
+    def _ensure_worker(self):
+        """Start the worker thread on first use."""
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        """Worker loop: gather a batch, then execute it."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        # Still pick up anything that queued while we waited
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._execute(batch)
+
+    def _execute(self, batch: List[_PendingRequest]):
+        """Run one batch and hand each caller its own result."""
+        started = time.perf_counter()
+        self._record(batch, started)
+
+        try:
+            results = self.batch_fn([request.prompt for request in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} prompts")
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
+
+    def _record(self, batch: List[_PendingRequest], started: float):
+        """Update batch-size and queue-wait counters."""
+        size = len(batch)
+        with self._stats_lock:
+            self.total_requests += size
+            self.total_batches += 1
+            self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+            for request in batch:
+                wait = started - request.enqueued_at
+                self.queue_wait_total += wait
+                if wait > self.queue_wait_max:
+                    self.queue_wait_max = wait
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching counters."""
+        with self._stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': self._queue.qsize(),
+                'total_requests': self.total_requests,
+                'total_batches': self.total_batches,
+                'avg_batch_size': round(self.total_requests / self.total_batches, 3) if self.total_batches else 0.0,
+                'batch_size_distribution': dict(sorted(self.batch_size_counts.items())),
+                'avg_queue_wait_ms': round(self.queue_wait_total / self.total_requests * 1000.0, 3) if self.total_requests else 0.0,
+                'max_queue_wait_ms': round(self.queue_wait_max * 1000.0, 3)
+            }
@@ -0,0 +1,117 @@
+"""
+Circuit breaker for HealthAI's remote model calls
+After repeated failures, calls are refused at once instead of each waiting out
+the request budget, until a trial call shows the endpoint is back
+"""
+import threading
+import time
+from typing import Any, Dict
+
+from models.metrics import CIRCUIT_REJECTED_TOTAL, CIRCUIT_STATE
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker.
+
+    Closed: calls go through; failure_threshold consecutive failures open it.
+    Open: calls are refused for reset_timeout seconds, then it goes half-open.
+    Half-open: up to half_open_calls trial calls go through; a success closes
+    the circuit, a failure opens it again. Trials that never report back are
+    given up on after another reset_timeout, so the circuit cannot stick.
+
+    Every call allowed by allow_request() should report record_success() or
+    record_failure().
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_calls: int = 1):
+        """
+        Args:
+            name: Circuit name for logs and metrics
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+            half_open_calls: Trial calls allowed at once while half-open
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = max(1, half_open_calls)
+        self._lock = threading.Lock()
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._changed_at = time.monotonic()  # when the circuit opened or went half-open
+        self._trials = 0
+
+        # Counters
+        self.opened = 0
+        self.rejected = 0
+        self._state_gauge = CIRCUIT_STATE.labels(name)
+        self._rejected_total = CIRCUIT_REJECTED_TOTAL.labels(name)
+        self._state_gauge.set(0)
+
+    def allow_request(self) -> bool:
+        """Whether a call may be made now; counts it as a trial while half-open."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self._changed_at >= self.reset_timeout:
+                # Open long enough, or the last trials never reported back
+                self._set_state(self.HALF_OPEN, now)
+                self._trials = 0
+            if self.state == self.HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            self.rejected += 1
+        self._rejected_total.inc()
+        return False
+
+    def record_success(self):
+        """A call succeeded: close the circuit."""
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED, time.monotonic())
+                print(f"✅ {self.name} circuit closed, calls resume")
+
+    def record_failure(self):
+        """A call failed or timed out: open the circuit at the threshold, or after a failed trial."""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and
+                                                self.consecutive_failures >= self.failure_threshold):
+                self._set_state(self.OPEN, time.monotonic())
+                self.opened += 1
+                print(f"⚡ {self.name} circuit opened after {self.consecutive_failures} consecutive failures; "
+                      f"serving fallbacks for {self.reset_timeout:g}s")
+
+    def _set_state(self, state: str, now: float):
+        self.state = state
+        self._changed_at = now
+        self._state_gauge.set(self._STATE_VALUES[state])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the state and failure counters."""
+        with self._lock:
+            stats = {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'opened': self.opened,
+                'rejected': self.rejected
+            }
+            if self.state == self.OPEN:
+                stats['retry_in'] = round(max(0.0, self.reset_timeout - (time.monotonic() - self._changed_at)), 3)
+            return stats
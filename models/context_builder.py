@@ -0,0 +1,203 @@
+"""
+Conversation context for HealthAI model prompts
+Recent turns within a token budget, with older turns folded into an
+incrementally maintained summary
+"""
+import math
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English)."""
+    return math.ceil(len(text) / 4)
+
+
+def _truncate(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Cut text to about max_tokens, on a word boundary."""
+    text = " ".join(text.split())
+    if count_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4].rsplit(" ", 1)[0]
+    return cut + "..."
+
+
+class _Turn:
+    __slots__ = ('message', 'response', 'text', 'tokens')
+
+    def __init__(self, message: str, response: str, text: str, tokens: int):
+        self.message = message
+        self.response = response
+        self.text = text
+        self.tokens = tokens
+
+
+class _SessionContext:
+    """Recent turns of one session plus the summary of everything before them."""
+    __slots__ = ('turns', 'total_turns', 'summarized_through', 'summary_points', 'summary_tokens')
+
+    def __init__(self, max_turns: int):
+        self.turns = deque(maxlen=max_turns)
+        self.total_turns = 0  # turns ever recorded; turns[0] has index total_turns - len(turns)
+        self.summarized_through = 0  # turns with a lower index are covered by the summary
+        self.summary_points = deque()
+        self.summary_tokens = 0
+
+
+class ConversationContextBuilder:
+    """
+    Builds the prior-conversation part of a model prompt.
+
+    Recent turns are kept in memory per session (LRU-bounded); a session
+    not in memory is loaded from the stored message history. Turns are
+    added newest first until the token budget is reached; the turns that
+    no longer fit are folded into a short summary once, when they leave
+    the window, so building a context never re-reads a whole conversation.
+    """
+
+    def __init__(self, history=None, max_tokens: int = 512, summary_max_tokens: int = 128,
+                 turn_max_tokens: int = 160, max_turns: int = 12, max_sessions: int = 10000,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        """
+        Args:
+            history: Optional ConversationHistory to load sessions missing from memory
+            max_tokens: Budget for the whole context, summary included
+            summary_max_tokens: Budget for the summary of older turns
+            turn_max_tokens: Longest a single turn may be once rendered
+            max_turns: Recent turns kept in memory per session
+            max_sessions: Sessions kept in memory; least recently used are dropped
+            count_tokens: Token counter; defaults to a character-based estimate
+        """
+        self.history = history
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.turn_max_tokens = turn_max_tokens
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.count_tokens = count_tokens or estimate_tokens
+
+        self._sessions = OrderedDict()  # session_id -> _SessionContext, least recently used first
+        self._lock = threading.Lock()
+
+        # Counters
+        self.memory_hits = 0
+        self.history_loads = 0
+        self.turns_summarized = 0
+
+    def _render_turn(self, message: str, response: str) -> _Turn:
+        text = (f"User: {_truncate(message, self.turn_max_tokens // 2, self.count_tokens)}\n"
+                f"Assistant: {_truncate(response, self.turn_max_tokens // 2, self.count_tokens)}")
+        return _Turn(message, response, text, self.count_tokens(text))
+
+    def _session(self, session_id: str) -> _SessionContext:
+        """Session context from memory, or loaded from history on a miss (call without the lock)."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                self.memory_hits += 1
+                return session
+
+        # Read history outside the lock so a slow load doesn't stall every other session
+        loaded = None
+        if self.history is not None:
+            try:
+                loaded = _SessionContext(self.max_turns)
+                page = self.history.get_messages(session_id, limit=self.max_turns)
+                for row in page['messages']:
+                    self._append(loaded, row['message'], row['response'] or "")
+            except Exception as e:
+                print(f"⚠️ Could not load conversation history: {e}")
+                loaded = None
+
+        with self._lock:
+            # Another thread may have loaded the same session meanwhile; keep the first one in
+            session = self._sessions.setdefault(session_id, loaded or _SessionContext(self.max_turns))
+            self._sessions.move_to_end(session_id)
+            if session is loaded:
+                self.history_loads += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def _append(self, session: _SessionContext, message: str, response: str):
+        if len(session.turns) == session.turns.maxlen:
+            # The oldest turn is about to leave memory; summarize it first
+            oldest_index = session.total_turns - len(session.turns)
+            if oldest_index >= session.summarized_through:
+                self._summarize(session, [session.turns[0]])
+                session.summarized_through = oldest_index + 1
+        session.turns.append(self._render_turn(message, response))
+        session.total_turns += 1
+
+    def record_turn(self, session_id: str, message: str, response: str):
+        """Remember a completed turn for the session's next prompt."""
+        session = self._session(session_id)
+        with self._lock:
+            self._append(session, message, response)
+
+    def _summarize(self, session: _SessionContext, turns: List[_Turn]):
+        """Fold turns into the summary, dropping the oldest points beyond its budget."""
+        for turn in turns:
+            first_sentence = _SENTENCE_END.split(" ".join(turn.message.split()), 1)[0]
+            point = _truncate(first_sentence.rstrip(".!?"), 30, self.count_tokens)
+            session.summary_points.append(point)
+            session.summary_tokens += self.count_tokens(point) + 1
+            self.turns_summarized += 1
+        while session.summary_points and session.summary_tokens > self.summary_max_tokens:
+            session.summary_tokens -= self.count_tokens(session.summary_points.popleft()) + 1
+
+    def build(self, session_id: str, max_tokens: Optional[int] = None) -> str:
+        """Prompt-ready context for a session's next turn, or "" for a new session."""
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        session = self._session(session_id)
+        with self._lock:
+            if not session.turns:
+                return ""
+
+            first_index = session.total_turns - len(session.turns)
+            start = max(session.summarized_through, first_index)
+            turns = list(session.turns)[start - first_index:]
+
+            # Newest turns first until the budget (less room for the summary) runs out
+            available = budget - min(self.summary_max_tokens, budget // 4)
+            window = []
+            for turn in reversed(turns):
+                if turn.tokens > available:
+                    break
+                window.append(turn)
+                available -= turn.tokens
+            window.reverse()
+
+            # Turns that fell out of the window are summarized exactly once
+            dropped = turns[:len(turns) - len(window)]
+            if dropped:
+                self._summarize(session, dropped)
+                session.summarized_through = start + len(dropped)
+
+            parts = []
+            if session.summary_points:
+                parts.append("Earlier in this conversation the user asked about: " +
+                             "; ".join(session.summary_points))
+            if window:
+                parts.append("Recent conversation:\n" + "\n".join(turn.text for turn in window))
+            return "\n".join(parts) + "\n" if parts else ""
+
+    def forget(self, session_id: str):
+        """Drop a session's in-memory context."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get context cache counters."""
+        return {
+            'sessions': len(self._sessions),
+            'max_tokens': self.max_tokens,
+            'memory_hits': self.memory_hits,
+            'history_loads': self.history_loads,
+            'turns_summarized': self.turns_summarized
+        }
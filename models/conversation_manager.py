@@ -1,103 +1,185 @@
-import json
-from typing import Dict, List, Any, Optional
+import asyncio
+import inspect
+import itertools
+from typing import Dict, List, Any, Optional, Iterator, AsyncIterator
 from datetime import datetime
 import sqlite3
+import threading
+import time
+
+import config
+from models.metrics import CHAT_STAGE_SECONDS, RESPONSES_TOTAL, LatencyHistogram
+from models.knowledge_store import get_knowledge_store
+from models.session_store import ConversationState, create_session_store
+
+# Per-stage timers of process_message, resolved once
+_TRIAGE = CHAT_STAGE_SECONDS.labels('triage')
+_STATE_LOAD = CHAT_STAGE_SECONDS.labels('state_load')
+_DETECTION = CHAT_STAGE_SECONDS.labels('detection')
+_SUGGESTIONS = CHAT_STAGE_SECONDS.labels('suggestions')
+_CONTEXT = CHAT_STAGE_SECONDS.labels('context')
+_MODEL = CHAT_STAGE_SECONDS.labels('model')
+_STATE_SAVE = CHAT_STAGE_SECONDS.labels('state_save')
+_TRIAGE_RESPONSES = RESPONSES_TOTAL.labels('rules', 'triage')
+_FLOW_RESPONSES = RESPONSES_TOTAL.labels('rules', 'symptom_flow')
+_FALLBACK_RESPONSES = RESPONSES_TOTAL.labels('fallback', 'conversation')
 
 class ConversationManager:
     """Manages conversational state and tracks symptom analysis flow."""
     
-    def __init__(self, ai_model=None):
-        self.conversation_states = {}  # session_id -> conversation_state
+    def __init__(self, ai_model=None, local_model=None, session_store=None, context_builder=None):
+        # session_id -> ConversationState
+        self.conversation_states = session_store if session_store is not None else create_session_store()
         self.current_session = None
         self.ai_model = ai_model  # Optional AI model for general chat
+        self.local_model = local_model  # Optional local model, preferred once loaded
+        self.context_builder = context_builder  # Optional source of prior turns for model prompts
+        self.model_executor = None  # Executor for blocking model calls in async mode (None: loop default)
         self.load_medical_data()
+        
+        # Emergency triage counters
+        self.triage_short_circuits = 0
+        self.triage_latency = LatencyHistogram()
+        self._triage_lock = threading.Lock()
     
     def load_medical_data(self):
-        """Load medical knowledge for symptom analysis."""
-        try:
-            with open('data/medical_knowledge.json', 'r', encoding='utf-8') as f:
-                self.medical_data = json.load(f)
-        except:
-            self.medical_data = {}
-    
-    def get_state(self, session_id: str) -> Dict[str, Any]:
+        """Attach to the shared medical knowledge snapshot."""
+        self.knowledge = get_knowledge_store()
+    
+    @property
+    def medical_data(self) -> Dict[str, Any]:
+        return self.knowledge.current.data
+    
+    @property
+    def term_index(self):
+        """Compiled matcher for symptoms, causes and emergencies, shared with the knowledge base."""
+        return self.knowledge.current.term_index
+    
+    @property
+    def question_bank(self):
+        return self.knowledge.current.question_bank
+    
+    @property
+    def medication_catalog(self):
+        return self.knowledge.current.medication_catalog
+    
+    def get_state(self, session_id: str) -> ConversationState:
         """Get conversation state for a session."""
-        if session_id not in self.conversation_states:
-            self.conversation_states[session_id] = {
-                'stage': 'initial',  # initial, gathering_symptoms, suggesting
-                'symptoms': [],
-                'symptom_details': {},
-                'follow_up_questions': [],
-                'question_index': 0,
-                'potential_conditions': [],
-                'risk_level': 'low'
-            }
-        return self.conversation_states[session_id]
+        return self.conversation_states.get(session_id)
     
-    def process_message(self, session_id: str, user_message: str) -> Dict[str, Any]:
-        """Process user message and return appropriate response."""
+    def process_message(self, session_id: str, user_message: str, stream: bool = False,
+                        asynchronous: bool = False) -> Dict[str, Any]:
+        """Process user message and return appropriate response.
+        
+        With stream=True, model-generated responses are returned as an
+        iterator of text chunks instead of a string. With asynchronous=True
+        they are left as a coroutine (or an async iterator when streaming);
+        use process_message_async() rather than passing it directly.
+        """
+        started = time.perf_counter()
+        
+        # Emergency triage runs before any state handling or model call
+        with _TRIAGE.timer():
+            emergencies = self.term_index.find_emergencies(user_message)
+        if emergencies:
+            result = self._generate_emergency_response(emergencies)
+            self._record_triage(time.perf_counter() - started)
+            _TRIAGE_RESPONSES.inc()
+            return result
+        
         self.current_session = session_id
-        state = self.get_state(session_id)
+        with _STATE_LOAD.timer():
+            state = self.get_state(session_id)
+        result = self._advance_conversation(session_id, state, user_message, stream, asynchronous)
+        
+        # Write back so other workers see this turn (and idle expiry restarts)
+        with _STATE_SAVE.timer():
+            self.conversation_states.save(session_id, state)
+        return result
+    
+    async def process_message_async(self, session_id: str, user_message: str,
+                                    stream: bool = False) -> Dict[str, Any]:
+        """process_message() for the event loop.
+        
+        The symptom flow reads and writes the session store, so it runs on
+        the loop's default executor; a model call is then awaited on the
+        loop, so a slow model holds no thread. With stream=True the response
+        is an async iterator of text chunks.
+        """
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.process_message, session_id, user_message, stream, True)
+        if inspect.isawaitable(result.get('response')):
+            result['response'] = await result['response']
+        return result
+    
+    def _advance_conversation(self, session_id: str, state: ConversationState, user_message: str,
+                              stream: bool, asynchronous: bool = False) -> Dict[str, Any]:
+        """Apply one user message to the symptom flow, updating state in place."""
         user_message_lower = user_message.lower()
         
         # Detect if this is an initial symptom report
-        detected_symptoms = self._detect_symptoms(user_message)
+        with _DETECTION.timer():
+            detected_symptoms = self._detect_symptoms(user_message)
         
-        if state['stage'] == 'initial' and detected_symptoms:
+        if state.stage == 'initial' and detected_symptoms:
             # Start symptom gathering
-            state['stage'] = 'gathering_symptoms'
-            state['symptoms'] = detected_symptoms
-            state['symptom_details'][detected_symptoms[0]] = user_message
-            state['question_index'] = 1  # Increment to track that we've asked the first question
+            state.stage = 'gathering_symptoms'
+            state.symptoms = detected_symptoms
+            state.symptom_details[detected_symptoms[0]] = user_message
+            state.question_index = 1  # Increment to track that we've asked the first question
             
             # Ask first follow-up question
             follow_up = self._get_follow_up_question(detected_symptoms[0])
+            _FLOW_RESPONSES.inc()
             
             return {
                 'response': follow_up['response'],
                 'next_question': follow_up.get('next_question'),
-                'stage': state['stage'],
+                'stage': state.stage,
                 'suggestions': follow_up.get('suggestions', [])
             }
         
-        elif state['stage'] == 'gathering_symptoms':
+        elif state.stage == 'gathering_symptoms':
             # Processing follow-up answers
-            current_symptom = state['symptoms'][-1]
-            state['symptom_details'][current_symptom] = user_message
+            current_symptom = state.symptoms[-1]
+            state.symptom_details[current_symptom] = user_message
             
             # Check if we should continue asking or start suggesting
             # Since we already asked question 0 in initial stage, we use question_index as-is
-            question_index = state['question_index']
+            question_index = state.question_index
             max_questions = self._get_max_questions_for_symptom(current_symptom)
             
             if question_index < max_questions:
                 # Ask next question (index 1, 2, 3, etc.)
                 follow_up = self._get_next_follow_up(current_symptom, question_index)
-                state['question_index'] += 1
+                state.question_index += 1
+                _FLOW_RESPONSES.inc()
                 
                 return {
                     'response': follow_up['response'],
                     'next_question': follow_up.get('next_question'),
-                    'stage': state['stage'],
+                    'stage': state.stage,
                     'suggestions': follow_up.get('suggestions', [])
                 }
             else:
                 # Done asking questions - start suggesting medications
-                state['stage'] = 'suggesting'
-                suggestions = self._generate_suggestions(state)
-                state = self.conversation_states[session_id]  # Update state
+                state.stage = 'suggesting'
+                with _SUGGESTIONS.timer():
+                    suggestions = self._generate_suggestions(state)
+                _FLOW_RESPONSES.inc()
                 
                 return {
                     'response': suggestions['response'],
                     'medications': suggestions.get('medications', []),
                     'recommendations': suggestions.get('recommendations', []),
-                    'stage': state['stage']
+                    'stage': state.stage
                 }
         
-        elif state['stage'] == 'suggesting':
+        elif state.stage == 'suggesting':
             # Check if user wants to start new analysis
             if any(keyword in user_message_lower for keyword in ['new', 'another', 'different', 'reset', 'start over']):
-                state = self._reset_state(session_id)
+                state.reset()
+                _FLOW_RESPONSES.inc()
                 return {
                     'response': 'Okay, I\'m ready to help you with a new symptom or health concern. What would you like to ask about?',
                     'stage': 'initial'
@@ -105,162 +187,85 @@ class ConversationManager:
             else:
                 # Provide general response
                 return {
-                    'response': self._generate_general_response(user_message),
-                    'stage': state['stage']
+                    'response': self._general_response(session_id, user_message, stream, asynchronous),
+                    'stage': state.stage
                 }
         
         else:
             # General conversation - use AI if available
-            if detected_symptoms and state['stage'] == 'initial':
-                response = self._generate_general_response(user_message)
-                response += '\n\nWould you like me to ask you some questions to better understand your symptoms?'
+            if detected_symptoms and state.stage == 'initial':
+                response = self._general_response(session_id, user_message, stream, asynchronous)
+                response = self._append_text(response, '\n\nWould you like me to ask you some questions to better understand your symptoms?')
             else:
                 # Use AI for general questions
-                response = self._generate_general_response(user_message)
+                response = self._general_response(session_id, user_message, stream, asynchronous)
             
             return {'response': response}
     
+    def _generate_emergency_response(self, emergencies: List[str]) -> Dict[str, Any]:
+        """Immediate emergency guidance, without model calls or follow-up questions."""
+        response = "🚨 **This may be a medical emergency.**\n\n"
+        response += "Based on what you described (" + ", ".join(emergencies) + "), please:\n"
+        response += "• **Call 911** (or your local emergency number) immediately\n"
+        response += "• Do not drive yourself to the hospital\n"
+        response += "• Stay with someone if you can, and follow the dispatcher's instructions\n\n"
+        if any(term.lower() in ('suicidal', 'self harm', 'suicidal thoughts', 'overdose') for term in emergencies):
+            response += "If you are having thoughts of harming yourself, call or text 988 (Suicide & Crisis Lifeline) now.\n\n"
+        response += "I can't assess emergencies - please get professional help right away."
+        
+        return {
+            'response': response,
+            'stage': 'emergency',
+            'urgency': 'emergency',
+            'recommendations': ['Call 911 or go to the nearest emergency room immediately']
+        }
+    
+    def _record_triage(self, seconds: float):
+        """Count a short-circuited request and record its latency."""
+        with self._triage_lock:
+            self.triage_short_circuits += 1
+        self.triage_latency.observe(seconds)
+    
+    def get_triage_stats(self) -> Dict[str, Any]:
+        """Get emergency triage counters."""
+        return {
+            'short_circuited': self.triage_short_circuits,
+            'latency': self.triage_latency.get_stats()
+        }
+    
     def _detect_symptoms(self, message: str) -> List[str]:
         """Detect symptoms in user message."""
-        symptoms = self.medical_data.get('symptoms', {})
-        detected = []
-        message_lower = message.lower()
-        
-        for symptom_key, symptom_data in symptoms.items():
-            if symptom_key in message_lower:
-                detected.append(symptom_key)
-            elif any(cause.lower() in message_lower for cause in symptom_data.get('common_causes', [])):
-                detected.append(symptom_key)
-        
-        return detected
+        return self.term_index.detect_symptoms(message)
     
     def _get_follow_up_question(self, symptom: str) -> Dict[str, Any]:
         """Get first follow-up question for a symptom."""
-        questions_by_symptom = {
-            'headache': {
-                'questions': [
-                    "How long have you been experiencing this headache? (hours/days)",
-                    "Can you rate the pain on a scale of 1-10?",
-                    "Does anything seem to trigger or worsen it?",
-                    "Have you tried any pain relievers already?"
-                ],
-                'response': f"Thank you for describing your headache. Let me ask you a few questions to better understand your situation."
-            },
-            'fever': {
-                'questions': [
-                    "What is your current temperature? (if you know)",
-                    "How long have you had the fever?",
-                    "Do you have any other symptoms? (chills, body aches, cough)",
-                    "Have you taken any fever reducers?"
-                ],
-                'response': "I understand you have a fever. Let me gather some important details."
-            },
-            'cough': {
-                'questions': [
-                    "How long have you been coughing?",
-                    "Is it a dry cough or do you have mucus?",
-                    "Does your cough worsen at certain times of day?",
-                    "Have you been exposed to anyone who's been sick recently?"
-                ],
-                'response': "Thank you for mentioning your cough. I'd like to understand it better."
-            },
-            'abdominal_pain': {
-                'questions': [
-                    "Where exactly is the pain located? (upper/lower abdomen)",
-                    "How would you describe the pain? (sharp, dull, cramping)",
-                    "How long has it been going on?",
-                    "Are there any activities that make it better or worse?"
-                ],
-                'response': "I see you're experiencing abdominal pain. Let me ask you some questions to help assess this."
-            },
-            'dizziness': {
-                'questions': [
-                    "When does the dizziness occur? (standing up, after eating, randomly)",
-                    "Do you feel lightheaded or like the room is spinning?",
-                    "How long do the episodes last?",
-                    "Have you had any recent falls or injuries?"
-                ],
-                'response': "Thank you for mentioning dizziness. I need to ask you a few questions."
-            }
-        }
-        
-        default = {
-            'questions': [
-                "How long have you been experiencing this?",
-                "How severe would you rate it on a scale of 1-10?",
-                "Have you tried any treatments yet?",
-                "Are there any other symptoms accompanying this?"
-            ],
-            'response': f"Thank you for describing your symptoms. Let me ask a few questions."
-        }
-        
-        symptom_data = questions_by_symptom.get(symptom, default)
-        
+        prompt = self.question_bank.first_prompt(symptom)
         return {
-            'response': symptom_data['response'] + "\n\n" + symptom_data['questions'][0] + "\n\n**Please respond with your answer.**",
-            'next_question': symptom_data['questions'][0]
+            'response': prompt.response,
+            'next_question': prompt.question
         }
     
     def _get_next_follow_up(self, symptom: str, question_index: int) -> Dict[str, Any]:
         """Get next follow-up question."""
-        questions_by_symptom = {
-            'headache': [
-                "How long have you been experiencing this headache? (hours/days)",
-                "Can you rate the pain on a scale of 1-10?",
-                "Does anything seem to trigger or worsen it?",
-                "Have you tried any pain relievers already?"
-            ],
-            'fever': [
-                "What is your current temperature? (if you know)",
-                "How long have you had the fever?",
-                "Do you have any other symptoms? (chills, body aches, cough)",
-                "Have you taken any fever reducers?"
-            ],
-            'cough': [
-                "How long have you been coughing?",
-                "Is it a dry cough or do you have mucus?",
-                "Does your cough worsen at certain times of day?",
-                "Have you been exposed to anyone who's been sick recently?"
-            ],
-            'abdominal_pain': [
-                "Where exactly is the pain located? (upper/lower abdomen)",
-                "How would you describe the pain? (sharp, dull, cramping)",
-                "How long has it been going on?",
-                "Are there any activities that make it better or worse?"
-            ],
-            'dizziness': [
-                "When does the dizziness occur? (standing up, after eating, randomly)",
-                "Do you feel lightheaded or like the room is spinning?",
-                "How long do the episodes last?",
-                "Have you had any recent falls or injuries?"
-            ]
-        }
-        
-        default_questions = [
-            "How long have you been experiencing this?",
-            "How severe would you rate it on a scale of 1-10?",
-            "Have you tried any treatments yet?",
-            "Are there any other symptoms accompanying this?"
-        ]
-        
-        questions = questions_by_symptom.get(symptom, default_questions)
+        prompts = self.question_bank.prompts_for(symptom)
         
-        if question_index < len(questions):
+        if question_index < len(prompts):
+            prompt = prompts[question_index]
             return {
-                'response': questions[question_index] + "\n\n**Please provide your answer.**",
-                'next_question': questions[question_index]
+                'response': prompt.response,
+                'next_question': prompt.question
             }
         else:
             # Done with questions, start suggesting
-            return self._generate_suggestions(self.conversation_states.get('current_session', {'symptoms': [symptom]}))
+            return self._generate_suggestions(ConversationState(symptoms=[symptom]))
     
     def _get_max_questions_for_symptom(self, symptom: str) -> int:
         """Get maximum number of questions to ask for a symptom."""
-        return 4  # Default to 4 questions
+        return self.question_bank.question_count(symptom)
     
-    def _generate_suggestions(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    def _generate_suggestions(self, state: ConversationState) -> Dict[str, Any]:
         """Generate medication suggestions based on gathered symptoms."""
-        symptoms = state.get('symptoms', [])
+        symptoms = state.symptoms
         
         if not symptoms:
             return {
@@ -269,40 +274,10 @@ class ConversationManager:
                 'recommendations': ["Consult with a healthcare professional"]
             }
         
-        # Analyze symptoms and suggest medications
-        suggested_medications = []
-        recommendations = []
-        
-        for symptom in symptoms:
-            symptom_info = self.medical_data.get('symptoms', {}).get(symptom, {})
-            
-            if symptom == 'headache':
-                suggested_medications.extend([
-                    {'name': 'Acetaminophen (Tylenol)', 'dosage': '500-1000mg', 'frequency': 'Every 4-6 hours', 'notes': 'For mild to moderate pain'},
-                    {'name': 'Ibuprofen (Advil)', 'dosage': '200-400mg', 'frequency': 'Every 4-6 hours', 'notes': 'Anti-inflammatory, take with food'},
-                ])
-                recommendations.extend(['Rest in a dark room', 'Apply cold compress', 'Stay hydrated'])
-            
-            elif symptom == 'fever':
-                suggested_medications.extend([
-                    {'name': 'Acetaminophen (Tylenol)', 'dosage': '500-1000mg', 'frequency': 'Every 4-6 hours', 'notes': 'Reduces fever'},
-                    {'name': 'Ibuprofen (Advil)', 'dosage': '200-400mg', 'frequency': 'Every 6-8 hours', 'notes': 'If fever persists'},
-                ])
-                recommendations.extend(['Rest', 'Stay hydrated', 'Use cool compresses', 'Light clothing'])
-            
-            elif symptom == 'cough':
-                suggested_medications.extend([
-                    {'name': 'Dextromethorphan (Cough Suppressant)', 'dosage': '15-30mg', 'frequency': 'Every 4-6 hours', 'notes': 'For dry cough'},
-                    {'name': 'Guaifenesin (Expectorant)', 'dosage': '200-400mg', 'frequency': 'Every 4 hours', 'notes': 'For productive cough'},
-                ])
-                recommendations.extend(['Stay hydrated', 'Use humidifier', 'Honey and warm liquids'])
-            
-            elif symptom == 'abdominal_pain':
-                suggested_medications.extend([
-                    {'name': 'Antacids (Tums, Rolaids)', 'dosage': 'As directed', 'frequency': 'When needed', 'notes': 'For indigestion'},
-                    {'name': 'Simethicone (Gas-X)', 'dosage': '40-125mg', 'frequency': 'After meals', 'notes': 'For gas'},
-                ])
-                recommendations.extend(['Avoid trigger foods', 'Small meals', 'Apply heat to abdomen'])
+        # Deduplicated, interaction-checked picks from the medication catalog
+        suggestion_set = self.medication_catalog.suggest(symptoms)
+        suggested_medications = suggestion_set.medications
+        recommendations = suggestion_set.recommendations
         
         # Create comprehensive response
         response = "Based on your symptoms and our conversation, here's what I recommend:\n\n"
@@ -314,6 +289,11 @@ class ConversationManager:
             response += f"  - Frequency: {med['frequency']}\n"
             response += f"  - Note: {med['notes']}\n"
         
+        if suggestion_set.warnings:
+            response += "\n**Interaction Warnings:**\n"
+            for warning in suggestion_set.warnings:
+                response += f"• {warning}\n"
+        
         response += "\n**Additional Recommendations:**\n"
         for rec in recommendations:
             response += f"• {rec}\n"
@@ -328,34 +308,171 @@ class ConversationManager:
         return {
             'response': response,
             'medications': suggested_medications,
-            'recommendations': recommendations
+            'recommendations': recommendations,
+            'warnings': suggestion_set.warnings
         }
     
-    def _generate_general_response(self, message: str) -> str:
+    def _select_model(self):
+        """Pick the model for general chat: the local model once loaded, else the remote one."""
+        if self.local_model and self.local_model.is_ready():
+            return self.local_model
+        if self.ai_model and self.ai_model.is_available():
+            return self.ai_model
+        return None
+    
+    def _general_response(self, session_id: str, message: str, stream: bool, asynchronous: bool = False):
+        """Generate a general response as a string or a stream of chunks (or their async forms)."""
+        if asynchronous:
+            if stream:
+                return self._stream_general_response_async(message, session_id)
+            return self._generate_general_response_async(message, session_id)
+        if stream:
+            return self._stream_general_response(message, session_id)
+        return self._generate_general_response(message, session_id)
+    
+    def _append_text(self, response, text: str):
+        """Append text to a string, streamed, awaitable or async streamed response."""
+        if isinstance(response, str):
+            return response + text
+        if inspect.isawaitable(response):
+            return self._append_awaited(response, text)
+        if hasattr(response, '__aiter__'):
+            return self._append_async_stream(response, text)
+        return itertools.chain(response, [text])
+    
+    async def _append_awaited(self, response, text: str) -> str:
+        return await response + text
+    
+    async def _append_async_stream(self, response: AsyncIterator[str], text: str) -> AsyncIterator[str]:
+        async for chunk in response:
+            yield chunk
+        yield text
+    
+    def _generate_general_response(self, message: str, session_id: Optional[str] = None) -> str:
         """Generate general response for non-symptom queries using AI if available."""
         # Try using AI model if available
-        if self.ai_model and self.ai_model.is_available():
+        model = self._select_model()
+        if model:
             try:
-                ai_response = self.ai_model.get_response(message)
+                with _CONTEXT.timer():
+                    context = self._model_context(session_id, message)
+                with _MODEL.timer():
+                    ai_response = model.get_response(message, context)
                 return ai_response
             except Exception as e:
                 print(f"AI model error: {e}, using fallback")
         
-        # Fallback response
+        return self._get_general_fallback(message)
+    
+    def _stream_general_response(self, message: str, session_id: Optional[str] = None) -> Iterator[str]:
+        """Stream a general response chunk by chunk from the AI model if available."""
+        model = self._select_model()
+        if model and hasattr(model, 'stream_response'):
+            streamed = False
+            try:
+                with _CONTEXT.timer():
+                    context = self._model_context(session_id, message)
+                # Covers the whole stream, including time the client takes to read it
+                with _MODEL.timer():
+                    for chunk in model.stream_response(message, context):
+                        streamed = True
+                        yield chunk
+                return
+            except Exception as e:
+                print(f"AI model error: {e}, using fallback")
+                if streamed:
+                    return
+        elif model:
+            yield self._generate_general_response(message, session_id)
+            return
+        
+        yield self._get_general_fallback(message)
+    
+    async def _generate_general_response_async(self, message: str, session_id: Optional[str] = None) -> str:
+        """Async general response: remote models are awaited, blocking ones run on the model executor."""
+        model = self._select_model()
+        if model:
+            try:
+                loop = asyncio.get_running_loop()
+                with _CONTEXT.timer():
+                    # History is read from SQLite; keep it off the loop
+                    context = await loop.run_in_executor(None, self._model_context, session_id, message)
+                with _MODEL.timer():
+                    if hasattr(model, 'get_response_async'):
+                        return await model.get_response_async(message, context)
+                    return await loop.run_in_executor(self.model_executor, model.get_response, message, context)
+            except Exception as e:
+                print(f"AI model error: {e}, using fallback")
+        
+        return self._get_general_fallback(message)
+    
+    async def _stream_general_response_async(self, message: str,
+                                             session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Async streamed general response; a blocking model's stream is advanced on the model executor."""
+        model = self._select_model()
+        if model and (hasattr(model, 'stream_response_async') or hasattr(model, 'stream_response')):
+            streamed = False
+            try:
+                with _CONTEXT.timer():
+                    context = await asyncio.get_running_loop().run_in_executor(None, self._model_context,
+                                                                               session_id, message)
+                if hasattr(model, 'stream_response_async'):
+                    chunks = model.stream_response_async(message, context)
+                else:
+                    chunks = _iterate_in_executor(model.stream_response(message, context), self.model_executor)
+                with _MODEL.timer():
+                    async for chunk in chunks:
+                        streamed = True
+                        yield chunk
+                return
+            except Exception as e:
+                print(f"AI model error: {e}, using fallback")
+                if streamed:
+                    return
+        elif model:
+            yield await self._generate_general_response_async(message, session_id)
+            return
+        
+        yield self._get_general_fallback(message)
+    
+    def _model_context(self, session_id: Optional[str], message: str) -> str:
+        """Prior turns of the session followed by relevant knowledge base passages."""
+        conversation = ""
+        if self.context_builder is not None and session_id is not None:
+            conversation = self.context_builder.build(session_id)
+        return conversation + self._retrieve_context(message)
+    
+    def _retrieve_context(self, message: str) -> str:
+        """Knowledge base passages relevant to a message, for grounding the model prompt."""
+        index = self.knowledge.current.retrieval_index
+        if index is None:
+            return ""
+        return index.build_context(message, config.RETRIEVAL_TOP_K, config.RETRIEVAL_MIN_SCORE)
+    
+    def _get_general_fallback(self, message: str) -> str:
+        """Fallback response when no AI model can answer."""
+        _FALLBACK_RESPONSES.inc()
         return f"I understand you're asking about: {message}\n\n" + \
                "I can help you with symptom analysis and general health information. " + \
                "If you're experiencing any symptoms, please describe them and I'll guide you through some questions."
     
-    def _reset_state(self, session_id: str) -> Dict[str, Any]:
+    def _reset_state(self, session_id: str) -> ConversationState:
         """Reset conversation state."""
-        self.conversation_states[session_id] = {
-            'stage': 'initial',
-            'symptoms': [],
-            'symptom_details': {},
-            'follow_up_questions': [],
-            'question_index': 0,
-            'potential_conditions': [],
-            'risk_level': 'low'
-        }
-        return self.conversation_states[session_id]
+        return self.conversation_states.reset(session_id)
+    
+    def get_session_stats(self) -> Dict[str, Any]:
+        """Get session store gauges."""
+        return self.conversation_states.get_stats()
+
+
+_END = object()
+
 
+async def _iterate_in_executor(iterator: Iterator[str], executor=None) -> AsyncIterator[str]:
+    """Advance a blocking iterator on an executor, one item at a time."""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await loop.run_in_executor(executor, next, iterator, _END)
+        if item is _END:
+            return
+        yield item
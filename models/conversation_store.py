@@ -0,0 +1,307 @@
+"""
+Conversation persistence for HealthAI
+Write-behind queue that flushes chat turns to SQLite in batches
+"""
+import base64
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models.metrics import DB_WRITE_SECONDS
+
+_WRITE_LATENCY = DB_WRITE_SECONDS.labels()
+
+
+def init_schema(conn: sqlite3.Connection):
+    """Create the chat tables if they don't exist."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            message TEXT,
+            response TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
+        )
+    ''')
+    # History reads seek by session and time; rowid breaks timestamp ties
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_session_timestamp
+        ON messages (session_id, timestamp)
+    ''')
+    conn.commit()
+
+
+class _FlushRequest:
+    """Queue marker; its event is set once everything queued before it is committed."""
+    __slots__ = ('event',)
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+_STOP = object()
+
+
+class ConversationWriter:
+    """Background writer that batches chat turns into single SQLite transactions."""
+
+    def __init__(self, db_path: str, batch_size: int = 64, flush_interval: float = 0.5,
+                 max_known_sessions: int = 100000):
+        """
+        Args:
+            db_path: SQLite database file
+            batch_size: Flush once this many turns are queued
+            flush_interval: Flush at least this often (seconds) while turns are queued
+            max_known_sessions: Size limit of the cache of session ids already in chat_sessions
+        """
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_known_sessions = max_known_sessions
+
+        self._queue = queue.Queue()
+        self._known_sessions = set()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        # Counters
+        self.messages_written = 0
+        self.batches_written = 0
+        self.messages_dropped = 0
+        self.write_errors = 0
+
+    def enqueue(self, session_id: str, message: str, response: str):
+        """Queue a chat turn for writing; returns without touching the database."""
+        if self._closed:
+            raise RuntimeError("Conversation writer is closed")
+        self._ensure_worker()
+        # Stamp the turn now, in SQLite's CURRENT_TIMESTAMP format, so flush delay doesn't skew it
+        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        self._queue.put((session_id, message, response, timestamp))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every turn queued so far is committed."""
+        if self._worker is None:
+            return True
+        marker = _FlushRequest()
+        self._queue.put(marker)
+        return marker.event.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Write everything still queued, then close the connection."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._worker is not None:
+            self._queue.put(_STOP)
+            self._worker.join(timeout)
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+                    self._worker.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the writer's long-lived connection in WAL mode."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        init_schema(conn)
+        return conn
+
+    def _run(self):
+        """Worker loop: collect a batch by size or time, then write it."""
+        conn = self._connect()
+        stopping = False
+
+        while not stopping:
+            batch, markers = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, _FlushRequest):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+
+                if stopping or markers or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if stopping:
+                # Drain whatever was queued before the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, _FlushRequest):
+                        markers.append(item)
+                    elif item is not _STOP:
+                        batch.append(item)
+
+            if batch:
+                self._write(conn, batch)
+            for marker in markers:
+                marker.event.set()
+
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: List[tuple]):
+        """Write one batch in a single transaction."""
+        new_sessions = {turn[0] for turn in batch} - self._known_sessions
+        try:
+            with _WRITE_LATENCY.timer(), conn:
+                if new_sessions:
+                    conn.executemany('INSERT OR IGNORE INTO chat_sessions (session_id) VALUES (?)',
+                                     [(session_id,) for session_id in new_sessions])
+                conn.executemany('''
+                    INSERT INTO messages (session_id, message, response, timestamp)
+                    VALUES (?, ?, ?, ?)
+                ''', batch)
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not store {len(batch)} messages: {e}")
+            self.write_errors += 1
+            self.messages_dropped += len(batch)
+            return
+
+        if len(self._known_sessions) + len(new_sessions) > self.max_known_sessions:
+            self._known_sessions.clear()
+        self._known_sessions.update(new_sessions)
+        self.messages_written += len(batch)
+        self.batches_written += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth and write counters."""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'messages_written': self.messages_written,
+            'batches_written': self.batches_written,
+            'avg_batch_size': round(self.messages_written / self.batches_written, 3) if self.batches_written else 0.0,
+            'messages_dropped': self.messages_dropped,
+            'write_errors': self.write_errors,
+            'known_sessions': len(self._known_sessions)
+        }
+
+
+class ConversationHistory:
+    """Read side of the conversation store with keyset pagination."""
+
+    def __init__(self, db_path: str, max_page_size: int = 200):
+        self.db_path = db_path
+        self.max_page_size = max_page_size
+        self._local = threading.local()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """One reusable connection per thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            if not self._schema_ready:
+                init_schema(conn)
+                self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def encode_cursor(timestamp: str, message_id: int) -> str:
+        """Opaque cursor for the position of a message."""
+        return base64.urlsafe_b64encode(f"{timestamp}|{message_id}".encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        """Inverse of encode_cursor; raises ValueError on malformed input."""
+        try:
+            timestamp, message_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+            return timestamp, int(message_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    def get_messages(self, session_id: str, limit: int = 50, before: Optional[str] = None,
+                     after: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get one page of a session's messages in chronological order.
+
+        Without a cursor the newest page is returned. Pages are located by
+        seeking the (session_id, timestamp) index to the cursor position
+        rather than with OFFSET, so every page costs the same.
+
+        Args:
+            session_id: Session to read
+            limit: Page size, capped at max_page_size
+            before: Cursor; return messages older than this position
+            after: Cursor; return messages newer than this position
+
+        Returns:
+            Dict with 'messages', and 'next_cursor' (older page) and
+            'prev_cursor' (newer page), each None at the end of the history
+        """
+        limit = max(1, min(int(limit), self.max_page_size))
+        conn = self._connection()
+
+        if after is not None:
+            timestamp, message_id = self.decode_cursor(after)
+            rows = conn.execute('''
+                SELECT id, message, response, timestamp FROM messages
+                WHERE session_id = ? AND (timestamp, id) > (?, ?)
+                ORDER BY timestamp ASC, id ASC
+                LIMIT ?
+            ''', (session_id, timestamp, message_id, limit + 1)).fetchall()
+            has_more_newer = len(rows) > limit
+            rows = rows[:limit]
+            has_more_older = True
+        else:
+            if before is not None:
+                timestamp, message_id = self.decode_cursor(before)
+                rows = conn.execute('''
+                    SELECT id, message, response, timestamp FROM messages
+                    WHERE session_id = ? AND (timestamp, id) < (?, ?)
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT ?
+                ''', (session_id, timestamp, message_id, limit + 1)).fetchall()
+            else:
+                rows = conn.execute('''
+                    SELECT id, message, response, timestamp FROM messages
+                    WHERE session_id = ?
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT ?
+                ''', (session_id, limit + 1)).fetchall()
+            has_more_older = len(rows) > limit
+            rows = list(reversed(rows[:limit]))
+            has_more_newer = before is not None
+
+        messages = [
+            {'id': row[0], 'message': row[1], 'response': row[2], 'timestamp': row[3]}
+            for row in rows
+        ]
+        return {
+            'messages': messages,
+            'next_cursor': self.encode_cursor(rows[0][3], rows[0][0]) if rows and has_more_older else None,
+            'prev_cursor': self.encode_cursor(rows[-1][3], rows[-1][0]) if rows and has_more_newer else None
+        }
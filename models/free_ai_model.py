@@ -2,20 +2,51 @@
 Free AI Model Integration for HealthAI
 Uses Hugging Face Inference API (free) for conversational responses
 """
+import asyncio
 import requests
 import json
-from typing import Dict, Any, Optional
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Dict, Any, Optional, Iterator, AsyncIterator
 import time
 
+import config
+from models.circuit_breaker import CircuitBreaker, CircuitOpenError
+from models.http_client import PooledHTTPClient
+from models.metrics import COALESCED_TOTAL, MODEL_SECONDS, RESPONSES_TOTAL
+from models.response_cache import ResponseCache
+from models.single_flight import SingleFlight
+
 class FreeAIModel:
     """Free, open-source AI model integration for general chat conversations."""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[ResponseCache] = None):
         self.model_name = "mistralai/Mistral-7B-Instruct-v0.2"  # Free and open source
-        self.api_url = f"https://api-inference.huggingface.co/models/{self.model_name}"
+        self.api_url = f"{config.HF_API_BASE_URL.rstrip('/')}/{self.model_name}"
         self.use_local_fallback = True
         self.loaded = False
         
+        # Keep-alive connection pool shared by all requests to the API
+        self.http = PooledHTTPClient(
+            pool_size=config.HF_POOL_SIZE,
+            connect_timeout=config.HF_CONNECT_TIMEOUT,
+            read_timeout=self._read_timeout(),
+            max_retries=config.HF_MAX_RETRIES,
+            backoff_base=config.HF_BACKOFF_BASE,
+            backoff_max=config.HF_BACKOFF_MAX
+        )
+        self._async_http = None  # Created on first async request (async serving mode)
+        self.request_budget = config.HF_REQUEST_BUDGET
+        self.cache = cache  # Optional shared cache of model answers
+        # Identical prompts in flight at the same time share one API call
+        self.in_flight = SingleFlight() if config.REQUEST_COALESCING_ENABLED else None
+        # While the API keeps failing, answer from the fallback at once instead of waiting on it
+        self.breaker = CircuitBreaker(
+            'inference_api',
+            failure_threshold=config.HF_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=config.HF_CIRCUIT_RESET_TIMEOUT,
+            half_open_calls=config.HF_CIRCUIT_HALF_OPEN_CALLS
+        ) if config.HF_CIRCUIT_BREAKER_ENABLED else None
+        
         print("Initializing Free AI Model...")
         print(f"Model: {self.model_name}")
         print("Ready for free AI conversations!")
@@ -32,66 +63,201 @@ class FreeAIModel:
         Returns:
             AI-generated response
         """
+        started = time.perf_counter()
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model_name, user_message, conversation_context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_path('cache', started)
+                return cached
+        
         try:
             # Try using Hugging Face Inference API
-            response = self._get_hf_response(user_message, conversation_context)
+            if self.in_flight is not None:
+                key = cache_key or ResponseCache.make_key(self.model_name, user_message, conversation_context)
+                response, shared = self.in_flight.do(key, self._fetch_response, user_message,
+                                                     conversation_context, cache_key)
+            else:
+                response = self._fetch_response(user_message, conversation_context, cache_key)
+                shared = False
+            if shared:
+                COALESCED_TOTAL.labels('free_ai').inc()
             if response:
-                return self._format_response(response)
+                self._record_path('coalesced' if shared else 'model', started)
+                return response
+        except CircuitOpenError:
+            response = self._get_enhanced_fallback(user_message)
+            self._record_path('circuit_open', started)
+            return response
         except Exception as e:
             print(f"WARNING HF API error: {e}")
         
         # Fallback to enhanced rule-based system
-        return self._get_enhanced_fallback(user_message)
+        response = self._get_enhanced_fallback(user_message)
+        self._record_path('fallback', started)
+        return response
     
-    def _get_hf_response(self, user_message: str, context: str) -> Optional[str]:
-        """Get response from Hugging Face Inference API."""
+    def _fetch_response(self, user_message: str, context: str, cache_key=None) -> Optional[str]:
+        """One Inference API call, formatted and cached; None if it produced nothing."""
+        self._check_circuit()
+        response = self._get_hf_response(user_message, context)
+        self._record_outcome(bool(response))
+        if not response:
+            return None
+        response = self._format_response(response)
+        if cache_key:
+            self.cache.put(cache_key, response)
+        return response
+    
+    def _check_circuit(self):
+        """Raise CircuitOpenError if the circuit breaker refuses an API call now."""
+        if self.breaker is not None and not self.breaker.allow_request():
+            raise CircuitOpenError("Inference API circuit is open")
+    
+    def _record_outcome(self, succeeded: bool):
+        """Report whether an API call produced text to the circuit breaker."""
+        if self.breaker is not None:
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+    
+    def _record_path(self, path: str, started: float):
+        """Count a response by the path that served it and record its latency."""
+        MODEL_SECONDS.labels('free_ai', path).observe(time.perf_counter() - started)
+        RESPONSES_TOTAL.labels(path, 'free_ai').inc()
+    
+    def stream_response(self, user_message: str, conversation_context: str = "") -> Iterator[str]:
+        """
+        Stream AI response tokens from the Hugging Face Inference API.
+        
+        Args:
+            user_message: The user's message
+            conversation_context: Previous conversation context
+        
+        Yields:
+            Chunks of the response text as they are generated
+        """
+        started = time.perf_counter()
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model_name, user_message, conversation_context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_path('cache', started)
+                yield cached
+                return
+        
+        if self.breaker is not None and not self.breaker.allow_request():
+            self._record_path('circuit_open', started)
+            yield self._get_enhanced_fallback(user_message)
+            return
+        
+        generated = []
+        completed = False
         try:
-            # Build the prompt with medical context
-            prompt = f"""You are a helpful and knowledgeable medical assistant. Provide accurate, helpful medical information.
+            for token in self._stream_hf_response(user_message, conversation_context):
+                if not generated:
+                    self._record_outcome(True)  # the first token shows the API is up
+                generated.append(token)
+                yield token
+            completed = True
+        except Exception as e:
+            print(f"WARNING HF API streaming error: {e}")
+        if not generated:
+            self._record_outcome(False)
+        
+        if generated:
+            text = "".join(generated)
+            if "WARNING" not in text and "Important" not in text:
+                disclaimer = "\n\nWARNING **Important**: This is preliminary guidance only. Please consult a healthcare professional for proper medical advice."
+                text += disclaimer
+                yield disclaimer
+            # Only cache answers that streamed to the end
+            if completed and cache_key:
+                self.cache.put(cache_key, text.strip())
+            self._record_path('model', started)
+            return
+        
+        # Nothing streamed - fall back to enhanced rule-based system
+        self._record_path('fallback', started)
+        yield self._get_enhanced_fallback(user_message)
+    
+    def _build_prompt(self, user_message: str, context: str) -> str:
+        """Build the prompt with medical context."""
+        return f"""You are a helpful and knowledgeable medical assistant. Provide accurate, helpful medical information.
 
 {context}
 User: {user_message}
 Assistant:"""
-            
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_new_tokens": 200,
-                    "temperature": 0.7,
-                    "return_full_text": False
-                }
+    
+    def _build_payload(self, user_message: str, context: str, stream: bool = False) -> Dict[str, Any]:
+        """Build the Inference API request payload."""
+        payload = {
+            "inputs": self._build_prompt(user_message, context),
+            "parameters": {
+                "max_new_tokens": 200,
+                "temperature": 0.7,
+                "return_full_text": False
             }
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+    
+    def _stream_hf_response(self, user_message: str, context: str) -> Iterator[str]:
+        """Stream tokens from the Inference API's server-sent events."""
+        response = self.http.post(
+            self.api_url,
+            headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+            json=self._build_payload(user_message, context, stream=True),
+            stream=True,
+            deadline=time.monotonic() + self.request_budget
+        )
+        
+        try:
+            if response.status_code != 200:
+                print(f"Streaming request failed with status {response.status_code}")
+                return
+            
+            for line in response.iter_lines(decode_unicode=True):
+                text = self._parse_stream_line(line)
+                if text:
+                    yield text
+        finally:
+            response.close()
+    
+    def _parse_stream_line(self, line: str) -> str:
+        """Text of one server-sent event line, or "" for other lines and special tokens."""
+        if not line or not line.startswith("data:"):
+            return ""
+        event = json.loads(line[len("data:"):].strip())
+        token = event.get("token") or {}
+        if token.get("special"):
+            return ""
+        return token.get("text", "")
+    
+    def _get_hf_response(self, user_message: str, context: str) -> Optional[str]:
+        """Get response from Hugging Face Inference API."""
+        try:
+            payload = self._build_payload(user_message, context)
             
-            # Make API request
-            response = requests.post(
+            # Make API request on the pooled client; retries with jittered
+            # backoff run there, so this worker waits at most the request budget
+            future = self.http.post_async(
                 self.api_url,
                 headers={"Content-Type": "application/json"},
                 json=payload,
-                timeout=30
+                deadline=time.monotonic() + self.request_budget
             )
+            try:
+                response = future.result(timeout=self.request_budget)
+            except FuturesTimeoutError:
+                print("Request timed out")
+                return None
             
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    generated_text = result[0].get('generated_text', '')
-                    return generated_text
-            elif response.status_code == 503:
-                # Model is loading, wait a bit and retry
-                print("⏳ Model is loading, please wait...")
-                time.sleep(5)
-                response = requests.post(
-                    self.api_url,
-                    headers={"Content-Type": "application/json"},
-                    json=payload,
-                    timeout=30
-                )
-                if response.status_code == 200:
-                    result = response.json()
-                    if isinstance(result, list) and len(result) > 0:
-                        generated_text = result[0].get('generated_text', '')
-                        return generated_text
-            
-            return None
+            return self._generated_text(response)
             
         except requests.exceptions.Timeout:
             print("Request timed out")
@@ -103,6 +269,159 @@ Assistant:"""
             print(f"Error: {e}")
             return None
     
+    def _generated_text(self, response) -> Optional[str]:
+        """Generated text of an Inference API response, or None if it has none."""
+        if response.status_code == 200:
+            result = response.json()
+            if isinstance(result, list) and len(result) > 0:
+                return result[0].get('generated_text', '')
+        elif response.status_code == 503:
+            print("⏳ Model is still loading, using fallback...")
+        return None
+
+    @staticmethod
+    def _read_timeout() -> float:
+        """Read timeout for the API clients, capped at the request budget.
+
+        A request given up on at the budget still holds its connection (and, for
+        the pooled client, its worker) until the read times out.
+        """
+        return min(config.HF_READ_TIMEOUT, config.HF_REQUEST_BUDGET)
+
+    @property
+    def async_http(self):
+        """Asyncio client for the async serving mode, created on first use (needs aiohttp)."""
+        if self._async_http is None:
+            from models.async_http_client import AsyncHTTPClient
+            self._async_http = AsyncHTTPClient(
+                max_connections=config.HF_ASYNC_MAX_CONNECTIONS,
+                connect_timeout=config.HF_CONNECT_TIMEOUT,
+                read_timeout=self._read_timeout(),
+                max_retries=config.HF_MAX_RETRIES,
+                backoff_base=config.HF_BACKOFF_BASE,
+                backoff_max=config.HF_BACKOFF_MAX
+            )
+        return self._async_http
+    
+    async def get_response_async(self, user_message: str, conversation_context: str = "") -> str:
+        """get_response() for the event loop: waits on the API without holding a thread."""
+        started = time.perf_counter()
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model_name, user_message, conversation_context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_path('cache', started)
+                return cached
+        
+        try:
+            if self.in_flight is not None:
+                key = cache_key or ResponseCache.make_key(self.model_name, user_message, conversation_context)
+                response, shared = await self.in_flight.do_async(key, self._fetch_response_async, user_message,
+                                                                 conversation_context, cache_key)
+            else:
+                response = await self._fetch_response_async(user_message, conversation_context, cache_key)
+                shared = False
+            if shared:
+                COALESCED_TOTAL.labels('free_ai').inc()
+            if response:
+                self._record_path('coalesced' if shared else 'model', started)
+                return response
+        except CircuitOpenError:
+            response = self._get_enhanced_fallback(user_message)
+            self._record_path('circuit_open', started)
+            return response
+        except Exception as e:
+            print(f"WARNING HF API error: {e}")
+        
+        response = self._get_enhanced_fallback(user_message)
+        self._record_path('fallback', started)
+        return response
+    
+    async def _fetch_response_async(self, user_message: str, context: str, cache_key=None) -> Optional[str]:
+        """_fetch_response() on the event loop."""
+        self._check_circuit()
+        response = await self._get_hf_response_async(user_message, context)
+        self._record_outcome(bool(response))
+        if not response:
+            return None
+        response = self._format_response(response)
+        if cache_key:
+            self.cache.put(cache_key, response)
+        return response
+    
+    async def _get_hf_response_async(self, user_message: str, context: str) -> Optional[str]:
+        """Get response from the Inference API on the event loop, within the request budget."""
+        try:
+            response = await asyncio.wait_for(
+                self.async_http.post(
+                    self.api_url,
+                    headers={"Content-Type": "application/json"},
+                    json=self._build_payload(user_message, context),
+                    deadline=time.monotonic() + self.request_budget
+                ),
+                timeout=self.request_budget
+            )
+            return self._generated_text(response)
+        except asyncio.TimeoutError:
+            print("Request timed out")
+            return None
+        except Exception as e:
+            print(f"Network error: {e}")
+            return None
+    
+    async def stream_response_async(self, user_message: str, conversation_context: str = "") -> AsyncIterator[str]:
+        """stream_response() for the event loop."""
+        started = time.perf_counter()
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model_name, user_message, conversation_context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_path('cache', started)
+                yield cached
+                return
+        
+        if self.breaker is not None and not self.breaker.allow_request():
+            self._record_path('circuit_open', started)
+            yield self._get_enhanced_fallback(user_message)
+            return
+        
+        generated = []
+        completed = False
+        try:
+            async for line in self.async_http.stream_lines(
+                self.api_url,
+                headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+                json=self._build_payload(user_message, conversation_context, stream=True),
+                deadline=time.monotonic() + self.request_budget
+            ):
+                token = self._parse_stream_line(line)
+                if token:
+                    if not generated:
+                        self._record_outcome(True)
+                    generated.append(token)
+                    yield token
+            completed = True
+        except Exception as e:
+            print(f"WARNING HF API streaming error: {e}")
+        if not generated:
+            self._record_outcome(False)
+        
+        if generated:
+            text = "".join(generated)
+            if "WARNING" not in text and "Important" not in text:
+                disclaimer = "\n\nWARNING **Important**: This is preliminary guidance only. Please consult a healthcare professional for proper medical advice."
+                text += disclaimer
+                yield disclaimer
+            if completed and cache_key:
+                self.cache.put(cache_key, text.strip())
+            self._record_path('model', started)
+            return
+        
+        self._record_path('fallback', started)
+        yield self._get_enhanced_fallback(user_message)
+    
     def _format_response(self, response: str) -> str:
         """Format and clean the AI response."""
         if not response:
@@ -270,6 +589,17 @@ Would you like me to ask you some questions about your symptoms to provide more
 
 WARNING **Important**: This is preliminary guidance only. Please consult a healthcare professional for proper medical advice."""
 
+    def get_stats(self) -> Dict[str, Any]:
+        """Get connection pool, retry and circuit breaker counters."""
+        stats = self.http.get_stats()
+        if self._async_http is not None:
+            stats['async'] = self._async_http.get_stats()
+        if self.in_flight is not None:
+            stats['coalescing'] = self.in_flight.get_stats()
+        if self.breaker is not None:
+            stats['circuit_breaker'] = self.breaker.get_stats()
+        return stats
+    
     def is_available(self) -> bool:
         """Check if the AI model is available."""
         return self.loaded
@@ -0,0 +1,160 @@
+"""
+Pooled HTTP client for HealthAI's remote model calls
+Keeps connections alive between requests and retries with jittered backoff
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledHTTPClient:
+    """Keep-alive HTTP client with bounded retries and background execution."""
+
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 3.05, read_timeout: float = 30.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        """
+        Args:
+            pool_size: Maximum keep-alive connections per host (also the worker count)
+            connect_timeout: Seconds allowed to establish a connection
+            read_timeout: Seconds allowed between bytes of the response
+            max_retries: Retries after the first attempt on timeouts, connection errors and RETRY_STATUSES
+            backoff_base: Base of the exponential backoff in seconds
+            backoff_max: Upper bound of a single backoff in seconds
+        """
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="http-client")
+        self._stats_lock = threading.Lock()
+
+        # Counters
+        self.total_requests = 0
+        self.total_attempts = 0
+        self.total_retries = 0
+        self.total_failures = 0
+        self.retry_reasons = {}  # status code or error name -> retries
+
+    def post(self, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+             stream: bool = False, deadline: Optional[float] = None) -> requests.Response:
+        """
+        POST with retries on the calling thread.
+
+        Args:
+            url: Request URL
+            json: JSON payload
+            headers: Extra request headers
+            stream: Leave the response body unread for streaming
+            deadline: time.monotonic() value after which no further retry starts; each
+                attempt's timeouts are also cut to the time left before it
+
+        Returns:
+            The last response received; raises the last network error if none was received
+        """
+        self._count('total_requests')
+        attempt = 0
+
+        while True:
+            self._count('total_attempts')
+            try:
+                response = self.session.post(url, json=json, headers=headers, timeout=self._attempt_timeout(deadline),
+                                             stream=stream)
+                reason = response.status_code if response.status_code in self.RETRY_STATUSES else None
+                error = None
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                response = None
+                reason = type(e).__name__
+                error = e
+
+            if reason is None:
+                return response
+
+            delay = self._backoff(attempt)
+            if attempt >= self.max_retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                self._count('total_failures')
+                if error is not None:
+                    raise error
+                return response
+
+            if response is not None:
+                response.close()
+            self._record_retry(reason)
+            attempt += 1
+            time.sleep(delay)
+
+    def post_async(self, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                   deadline: Optional[float] = None) -> Future:
+        """Run post() on the client's worker pool so callers can wait with their own timeout."""
+        return self._executor.submit(self.post, url, json, headers, False, deadline)
+
+    def _attempt_timeout(self, deadline: Optional[float]) -> tuple:
+        """Connect and read timeouts for one attempt, no longer than the time left before the deadline.
+
+        An attempt still running after the deadline has been given up on by the
+        caller, but it keeps its pool worker until it times out.
+        """
+        if deadline is None:
+            return self.timeout
+        remaining = max(deadline - time.monotonic(), 0.001)
+        return (min(self.timeout[0], remaining), min(self.timeout[1], remaining))
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _record_retry(self, reason: Any):
+        with self._stats_lock:
+            self.total_retries += 1
+            self.retry_reasons[str(reason)] = self.retry_reasons.get(str(reason), 0) + 1
+
+    def _connection_stats(self) -> Dict[str, int]:
+        """Count connections opened vs requests sent across the adapter's pools."""
+        created = 0
+        requests_sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                created += pool.num_connections
+                requests_sent += pool.num_requests
+        return {
+            'connections_created': created,
+            'connections_reused': max(0, requests_sent - created)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get connection reuse and retry counters."""
+        with self._stats_lock:
+            stats = {
+                'pool_size': self.pool_size,
+                'total_requests': self.total_requests,
+                'total_attempts': self.total_attempts,
+                'total_retries': self.total_retries,
+                'total_failures': self.total_failures,
+                'retry_reasons': dict(self.retry_reasons)
+            }
+        stats.update(self._connection_stats())
+        return stats
+
+    def close(self):
+        """Shut down the worker pool and close pooled connections."""
+        self._executor.shutdown(wait=False)
+        self.session.close()
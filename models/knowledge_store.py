@@ -0,0 +1,164 @@
+"""
+Shared medical knowledge for HealthAI
+One immutable snapshot of medical_knowledge.json and its derived indexes,
+rebuilt off the request path when the file changes and swapped atomically
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import config
+from models.medication_catalog import MedicationCatalog
+from models.question_bank import QuestionBank
+from models.retrieval_index import RetrievalIndex
+from models.term_index import MedicalTermIndex
+
+
+class KnowledgeSnapshot:
+    """A parsed knowledge file plus everything derived from it.
+
+    Snapshots are never modified after construction; readers hold on to the
+    one they started with while a newer one is swapped in.
+    """
+    __slots__ = ('data', 'version', 'loaded_at', 'source_mtime',
+                 'term_index', 'question_bank', 'symptom_search_text', 'medication_catalog',
+                 'retrieval_index')
+
+    def __init__(self, data: Dict[str, Any], version: str, source_mtime: Optional[float] = None,
+                 index_path: Optional[str] = None):
+        self.data = data
+        self.version = version
+        self.loaded_at = time.time()
+        self.source_mtime = source_mtime
+
+        # Derived indexes
+        self.term_index = MedicalTermIndex(data, config.EMERGENCY_KEYWORDS)
+        self.question_bank = QuestionBank(data)
+        self.symptom_search_text = _build_search_text(data)
+        self.medication_catalog = MedicationCatalog(data)
+        self.retrieval_index = RetrievalIndex.load_or_build(
+            data, version, index_path, n_features=config.RETRIEVAL_FEATURES
+        ) if config.RETRIEVAL_ENABLED else None
+
+
+def _build_search_text(data: Dict[str, Any]) -> Dict[str, str]:
+    """Precompute one lowercase searchable string per symptom."""
+    search_text = {}
+    for symptom, info in data.get("symptoms", {}).items():
+        fields = [symptom, info.get("description", "")] + info.get("aliases", []) + info.get("common_causes", [])
+        # Separator keeps queries from matching across field boundaries
+        search_text[symptom] = "\x00".join(field.lower() for field in fields)
+    return search_text
+
+
+class KnowledgeStore:
+    """Holds the current knowledge snapshot and reloads it when the file changes."""
+
+    def __init__(self, knowledge_file: str, poll_interval: float = 5.0):
+        """
+        Args:
+            knowledge_file: Path of the knowledge JSON file
+            poll_interval: Seconds between change checks once the watcher is started
+        """
+        self.knowledge_file = knowledge_file
+        self.poll_interval = poll_interval
+        # Retrieval vectors are persisted next to the knowledge file
+        self.index_path = os.path.splitext(knowledge_file)[0] + "_index.npz"
+        self._watcher = None
+        self._reload_lock = threading.Lock()
+        self._file_signature = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self._snapshot = self._load() or KnowledgeSnapshot({}, version="empty")
+
+    @property
+    def current(self) -> KnowledgeSnapshot:
+        """The latest snapshot (a single attribute read, safe without locks)."""
+        return self._snapshot
+
+    def _signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.knowledge_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self) -> Optional[KnowledgeSnapshot]:
+        """Read, hash and index the file; None if it is missing or invalid."""
+        signature = self._signature()
+        if signature is None:
+            return None
+        try:
+            with open(self.knowledge_file, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw.decode('utf-8'))
+        except Exception as e:
+            # Remember the bad file too, so the watcher waits for the next change instead of retrying it
+            self._file_signature = signature
+            print(f"Error loading medical data: {e}")
+            self.reload_errors += 1
+            return None
+
+        self._file_signature = signature
+        version = hashlib.sha256(raw).hexdigest()[:12]
+        return KnowledgeSnapshot(data, version, source_mtime=signature[0] / 1e9, index_path=self.index_path)
+
+    def reload_if_changed(self) -> bool:
+        """Rebuild and swap in a new snapshot if the file content changed."""
+        with self._reload_lock:
+            signature = self._signature()
+            if signature is None or signature == self._file_signature:
+                return False
+
+            snapshot = self._load()
+            if snapshot is None or snapshot.version == self._snapshot.version:
+                return False
+
+            self._snapshot = snapshot
+            self.reloads += 1
+            print(f"Medical knowledge reloaded (version {snapshot.version})")
+            return True
+
+    def start_watcher(self):
+        """Poll the file for changes in a daemon thread."""
+        if self._watcher is not None or self.poll_interval <= 0:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="knowledge-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"Knowledge reload failed: {e}")
+                self.reload_errors += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version,
+            'loaded_at': snapshot.loaded_at,
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors,
+            'watching': self._watcher is not None
+        }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_knowledge_store(knowledge_file: Optional[str] = None) -> KnowledgeStore:
+    """Return the process-wide store for a knowledge file, creating it on first use."""
+    knowledge_file = knowledge_file or config.MEDICAL_KNOWLEDGE_PATH
+    with _stores_lock:
+        store = _stores.get(knowledge_file)
+        if store is None:
+            store = KnowledgeStore(knowledge_file, poll_interval=config.KNOWLEDGE_RELOAD_INTERVAL)
+            _stores[knowledge_file] = store
+        return store
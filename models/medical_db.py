@@ -2,23 +2,27 @@ import json
 import os
 from typing import Dict, List, Any, Optional
 
+import config
+from models.knowledge_store import get_knowledge_store
+
 class MedicalKnowledgeBase:
     def __init__(self):
         """Initialize the medical knowledge base."""
-        self.knowledge_file = "data/medical_knowledge.json"
-        self.knowledge_data = self._load_medical_data()
+        self.knowledge_file = config.MEDICAL_KNOWLEDGE_PATH
+        if not os.path.exists(self.knowledge_file):
+            self._create_default_knowledge()
+        
+        # Shared, hot-reloadable snapshot (also used by the conversation manager)
+        self.knowledge = get_knowledge_store(self.knowledge_file)
     
-    def _load_medical_data(self) -> Dict[str, Any]:
-        """Load medical knowledge from JSON file."""
-        if os.path.exists(self.knowledge_file):
-            try:
-                with open(self.knowledge_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading medical data: {e}")
-                return self._create_default_knowledge()
-        else:
-            return self._create_default_knowledge()
+    @property
+    def knowledge_data(self) -> Dict[str, Any]:
+        return self.knowledge.current.data
+    
+    @property
+    def term_index(self):
+        """Compiled matcher for emergency and urgency terms."""
+        return self.knowledge.current.term_index
     
     def _create_default_knowledge(self) -> Dict[str, Any]:
         """Create default medical knowledge base."""
@@ -115,15 +119,8 @@ class MedicalKnowledgeBase:
     def search_symptoms(self, query: str) -> List[str]:
         """Search for symptoms matching the query."""
         query_lower = query.lower()
-        matching_symptoms = []
-        
-        for symptom, info in self.knowledge_data.get("symptoms", {}).items():
-            if (query_lower in symptom or 
-                query_lower in info.get("description", "").lower() or
-                any(query_lower in cause.lower() for cause in info.get("common_causes", []))):
-                matching_symptoms.append(symptom)
-        
-        return matching_symptoms
+        search_text = self.knowledge.current.symptom_search_text
+        return [symptom for symptom, text in search_text.items() if query_lower in text]
     
     def get_emergency_signs(self) -> List[str]:
         """Get list of emergency warning signs."""
@@ -135,19 +132,14 @@ class MedicalKnowledgeBase:
     
     def assess_urgency(self, symptoms: List[str]) -> str:
         """Assess the urgency level based on symptoms."""
-        emergency_signs = self.get_emergency_signs()
+        hits = [self.term_index.scan(symptom) for symptom in symptoms]
         
-        for symptom in symptoms:
-            symptom_lower = symptom.lower()
-            if any(emergency in symptom_lower for emergency in emergency_signs):
-                return "emergency"
+        if any("emergency_sign" in symptom_hits for symptom_hits in hits):
+            return "emergency"
         
         # Check for moderate urgency symptoms
-        moderate_symptoms = ["fever", "persistent cough", "severe pain", "dizziness", "nausea"]
-        for symptom in symptoms:
-            symptom_lower = symptom.lower()
-            if any(moderate in symptom_lower for moderate in moderate_symptoms):
-                return "moderate"
+        if any("moderate" in symptom_hits for symptom_hits in hits):
+            return "moderate"
         
         return "low"
     
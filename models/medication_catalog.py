@@ -0,0 +1,208 @@
+"""
+Medication catalog for HealthAI
+Products, ingredient ids and precomputed duplicate/interaction bitsets
+"""
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Medication(NamedTuple):
+    """A catalog product; ingredient_mask has one bit per ingredient id."""
+    product_id: str
+    name: str
+    dosage: str
+    frequency: str
+    ingredients: Tuple[str, ...]
+    ingredient_mask: int
+
+
+class SuggestionSet(NamedTuple):
+    """Deduplicated medications for a symptom set and the checks that shaped it."""
+    medications: List[Dict[str, str]]
+    recommendations: List[str]
+    warnings: List[str]
+    skipped: List[str]
+
+
+class MedicationCatalog:
+    """
+    Medication products indexed for pairwise checks.
+
+    Every product gets a row index. For each row, two bitsets (Python ints)
+    hold the rows it duplicates (shared ingredient or drug class) and the
+    rows it interacts with, so checking any pair is one shift and mask.
+    """
+
+    def __init__(self, medical_data: Dict[str, Any]):
+        catalog = medical_data.get("medication_catalog", {})
+        ingredients = catalog.get("ingredients", {})
+
+        self.ingredient_ids = {ingredient: bit for bit, ingredient in enumerate(ingredients)}
+        self.products: List[Medication] = []
+        self.index: Dict[str, int] = {}
+
+        for product_id, product in catalog.get("products", {}).items():
+            product_ingredients = tuple(product.get("ingredients", []))
+            mask = 0
+            for ingredient in product_ingredients:
+                mask |= 1 << self._ingredient_bit(ingredient)
+            self.index[product_id] = len(self.products)
+            self.products.append(Medication(
+                product_id,
+                product.get("name", product_id),
+                product.get("dosage", "As directed"),
+                product.get("frequency", "As directed"),
+                product_ingredients,
+                mask
+            ))
+
+        # ingredient bit -> bitset of product rows containing it
+        holders = {}
+        for row, product in enumerate(self.products):
+            for ingredient in product.ingredients:
+                bit = self.ingredient_ids[ingredient]
+                holders[bit] = holders.get(bit, 0) | (1 << row)
+
+        self._duplicates = self._build_duplicate_rows(ingredients, holders)
+        self._interactions, self._warnings = self._build_interaction_rows(catalog.get("interactions", []), holders)
+        self._treatments = catalog.get("symptom_treatments", {})
+
+    def _ingredient_bit(self, ingredient: str) -> int:
+        """Bit for an ingredient, adding ids for ingredients only named in products."""
+        bit = self.ingredient_ids.get(ingredient)
+        if bit is None:
+            bit = self.ingredient_ids[ingredient] = len(self.ingredient_ids)
+        return bit
+
+    def _build_duplicate_rows(self, ingredients: Dict[str, Any], holders: Dict[int, int]) -> List[int]:
+        """Rows sharing an ingredient, or an ingredient of the same class, duplicate each other."""
+        classes = {}
+        for ingredient, info in ingredients.items():
+            drug_class = (info or {}).get("class")
+            if drug_class:
+                classes[drug_class] = classes.get(drug_class, 0) | holders.get(self.ingredient_ids[ingredient], 0)
+        rows = [0] * len(self.products)
+        for group in list(holders.values()) + list(classes.values()):
+            for row in _iter_bits(group):
+                rows[row] |= group
+        return [mask & ~(1 << row) for row, mask in enumerate(rows)]
+
+    def _build_interaction_rows(self, interactions: Iterable[Dict[str, Any]],
+                                holders: Dict[int, int]) -> Tuple[List[int], Dict[frozenset, str]]:
+        """Expand ingredient-level interactions to product rows."""
+        rows = [0] * len(self.products)
+        warnings = {}
+        for interaction in interactions:
+            first, second = interaction["ingredients"]
+            first_bit, second_bit = self._ingredient_bit(first), self._ingredient_bit(second)
+            warnings[frozenset((first_bit, second_bit))] = interaction.get("warning", "")
+            first_rows, second_rows = holders.get(first_bit, 0), holders.get(second_bit, 0)
+            for row in _iter_bits(first_rows):
+                rows[row] |= second_rows
+            for row in _iter_bits(second_rows):
+                rows[row] |= first_rows
+        return rows, warnings
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def get(self, product_id: str) -> Optional[Medication]:
+        row = self.index.get(product_id)
+        return None if row is None else self.products[row]
+
+    def is_duplicate(self, first: str, second: str) -> bool:
+        """Whether two products share an ingredient or drug class."""
+        first_row, second_row = self.index[first], self.index[second]
+        return bool((self._duplicates[first_row] >> second_row) & 1)
+
+    def interacts(self, first: str, second: str) -> bool:
+        """Whether two products have a known ingredient interaction."""
+        first_row, second_row = self.index[first], self.index[second]
+        return bool((self._interactions[first_row] >> second_row) & 1)
+
+    def interaction_warnings(self, first: str, second: str) -> List[str]:
+        """Warnings for every interacting ingredient pair of two products."""
+        first_med, second_med = self.get(first), self.get(second)
+        warnings = []
+        for first_bit in _iter_bits(first_med.ingredient_mask):
+            for second_bit in _iter_bits(second_med.ingredient_mask):
+                warning = self._warnings.get(frozenset((first_bit, second_bit)))
+                if warning and warning not in warnings:
+                    warnings.append(warning)
+        return warnings
+
+    def check(self, product_ids: Iterable[str]) -> Dict[str, List[Tuple[str, str]]]:
+        """Check every pair of a product list for duplicates and interactions."""
+        rows = [self.index[product_id] for product_id in product_ids if product_id in self.index]
+        duplicates, interactions = [], []
+        for position, row in enumerate(rows):
+            for other in rows[position + 1:]:
+                pair = (self.products[row].product_id, self.products[other].product_id)
+                if (self._duplicates[row] >> other) & 1:
+                    duplicates.append(pair)
+                if (self._interactions[row] >> other) & 1:
+                    interactions.append(pair)
+        return {'duplicates': duplicates, 'interactions': interactions}
+
+    def suggest(self, symptoms: Iterable[str]) -> SuggestionSet:
+        """
+        Medications and recommendations for a symptom set.
+
+        Products are taken in symptom order. A product already chosen for an
+        earlier symptom is listed once with its notes merged; one that
+        duplicates a chosen product's ingredient or class is skipped;
+        interacting pairs are kept and reported as warnings.
+        """
+        chosen: List[int] = []
+        chosen_mask = 0
+        notes: Dict[int, List[str]] = {}
+        recommendations, warnings, skipped = [], [], []
+
+        for symptom in symptoms:
+            treatment = self._treatments.get(symptom, {})
+            for entry in treatment.get("medications", []):
+                row = self.index.get(entry.get("product"))
+                if row is None:
+                    continue
+                note = entry.get("notes", "")
+
+                if (chosen_mask >> row) & 1:
+                    if note and note not in notes[row]:
+                        notes[row].append(note)
+                    continue
+                if self._duplicates[row] & chosen_mask:
+                    skipped.append(self.products[row].name)
+                    continue
+
+                for other in _iter_bits(self._interactions[row] & chosen_mask):
+                    for warning in self.interaction_warnings(self.products[other].product_id,
+                                                             self.products[row].product_id):
+                        if warning not in warnings:
+                            warnings.append(warning)
+
+                chosen.append(row)
+                chosen_mask |= 1 << row
+                notes[row] = [note] if note else []
+
+            for recommendation in treatment.get("recommendations", []):
+                if recommendation not in recommendations:
+                    recommendations.append(recommendation)
+
+        medications = []
+        for row in chosen:
+            product = self.products[row]
+            medications.append({
+                'id': product.product_id,
+                'name': product.name,
+                'dosage': product.dosage,
+                'frequency': product.frequency,
+                'notes': "; ".join(notes[row])
+            })
+        return SuggestionSet(medications, recommendations, warnings, skipped)
+
+
+def _iter_bits(mask: int):
+    """Yield the positions of the set bits of mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
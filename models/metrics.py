@@ -0,0 +1,245 @@
+"""
+Low-overhead in-process metrics for HealthAI
+Histograms and counters, exported in Prometheus text format at /metrics
+"""
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bucket upper bounds in seconds, from 10 microseconds to 30 seconds
+DEFAULT_LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets: Optional[Sequence[float]] = None):
+        self.buckets = tuple(sorted(buckets or DEFAULT_LATENCY_BUCKETS))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """Record one duration."""
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[slot] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def timer(self) -> "_Timer":
+        """Context manager that observes the duration of its block."""
+        return _Timer(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get cumulative bucket counts, total count and sum."""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative[bound] = running
+        cumulative[float('inf')] = count
+
+        return {'buckets': cumulative, 'count': count, 'sum': total}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get a JSON-friendly summary with approximate percentiles in milliseconds."""
+        snapshot = self.snapshot()
+        count = snapshot['count']
+        return {
+            'count': count,
+            'avg_ms': round(snapshot['sum'] / count * 1000.0, 4) if count else 0.0,
+            'p50_ms': self._percentile_ms(snapshot, 0.50),
+            'p95_ms': self._percentile_ms(snapshot, 0.95),
+            'p99_ms': self._percentile_ms(snapshot, 0.99)
+        }
+
+    def _percentile_ms(self, snapshot: Dict[str, Any], quantile: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given quantile."""
+        count = snapshot['count']
+        if not count:
+            return None
+        rank = quantile * count
+        for bound, cumulative in snapshot['buckets'].items():
+            if cumulative >= rank:
+                return bound * 1000.0 if bound != float('inf') else None
+        return None
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram: LatencyHistogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Counter:
+    """Monotonically increasing count."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down."""
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class MetricFamily:
+    """A named metric with one child (histogram, counter or gauge) per combination of label values."""
+
+    def __init__(self, name: str, documentation: str, kind: str, label_names: Sequence[str],
+                 factory: Callable[[], Any]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Child for these label values, created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return sorted(self._children.items())
+
+
+class MetricsRegistry:
+    """Process-wide set of metric families, rendered together for scraping."""
+
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name: str, documentation: str, kind: str, label_names: Sequence[str],
+                  factory: Callable[[], Any]) -> MetricFamily:
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = MetricFamily(name, documentation, kind, label_names, factory)
+            elif family.kind != kind or family.label_names != tuple(label_names):
+                raise ValueError(f"Metric {name} is already registered differently")
+            return family
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Optional[Sequence[float]] = None) -> MetricFamily:
+        """Register (or get) a family of latency histograms."""
+        return self._register(name, documentation, 'histogram', label_names, lambda: LatencyHistogram(buckets))
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> MetricFamily:
+        """Register (or get) a family of counters; the name should end in _total."""
+        return self._register(name, documentation, 'counter', label_names, Counter)
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> MetricFamily:
+        """Register (or get) a family of gauges."""
+        return self._register(name, documentation, 'gauge', label_names, Gauge)
+
+    def render(self) -> str:
+        """Every family in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            families = sorted(self._families.values(), key=lambda family: family.name)
+
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family.name} {_escape_help(family.documentation)}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in family.children():
+                labels = list(zip(family.label_names, values))
+                if family.kind in ('counter', 'gauge'):
+                    lines.append(f"{family.name}{_format_labels(labels)} {child.value}")
+                    continue
+                snapshot = child.snapshot()
+                for bound, count in snapshot['buckets'].items():
+                    le = _format_number(bound)
+                    lines.append(f"{family.name}_bucket{_format_labels(labels + [('le', le)])} {count}")
+                lines.append(f"{family.name}_sum{_format_labels(labels)} {_format_number(snapshot['sum'])}")
+                lines.append(f"{family.name}_count{_format_labels(labels)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """The process-wide metrics registry."""
+    return _registry
+
+
+# Hot-path metrics shared by the app, the conversation manager, the models and the writer
+REQUEST_SECONDS = _registry.histogram(
+    'healthai_http_request_seconds', "HTTP request latency by endpoint and status.", ('endpoint', 'status'))
+CHAT_STAGE_SECONDS = _registry.histogram(
+    'healthai_chat_stage_seconds', "Time spent in each stage of handling a chat message.", ('stage',))
+MODEL_SECONDS = _registry.histogram(
+    'healthai_model_response_seconds', "Model response latency by model and the path that served it.",
+    ('model', 'path'))
+RESPONSES_TOTAL = _registry.counter(
+    'healthai_responses_total',
+    "Chat responses by serving path (model, cache, coalesced, fallback, circuit_open, rules) and source.",
+    ('path', 'source'))
+COALESCED_TOTAL = _registry.counter(
+    'healthai_coalesced_requests_total', "Model requests served by an identical request already in flight.",
+    ('model',))
+DB_WRITE_SECONDS = _registry.histogram(
+    'healthai_db_write_seconds', "Duration of each batched SQLite conversation write.")
+RATE_LIMITED_TOTAL = _registry.counter(
+    'healthai_rate_limited_total', "Chat requests rejected with 429, by the key that ran out of tokens.",
+    ('key',))
+CIRCUIT_STATE = _registry.gauge(
+    'healthai_circuit_breaker_state', "Circuit breaker state: 0 closed, 1 half-open, 2 open.", ('circuit',))
+CIRCUIT_REJECTED_TOTAL = _registry.counter(
+    'healthai_circuit_breaker_rejected_total', "Calls refused without being made because the circuit was open.",
+    ('circuit',))
@@ -0,0 +1,118 @@
+"""
+Prompt prefix KV cache for HealthAI
+Prefills the fixed system prompt once and reuses its key/value cache,
+so each request only prefills its own suffix
+"""
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import torch
+
+from models.metrics import LatencyHistogram
+
+
+class PrefixKVCache:
+    """Key/value cache of a fixed prompt prefix, shared by every generation."""
+
+    def __init__(self, model, tokenizer, prefix: str, device: str = "cpu"):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.device = device
+
+        self.prefix_ids = None
+        self.past_key_values = None
+        self.prefix_prefill_seconds = None
+
+        # Counters
+        self.requests = 0
+        self.suffix_prefill = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.past_key_values is not None
+
+    def warmup(self, runs: int = 3):
+        """Prefill the prefix, keep its KV cache and time what each request will skip."""
+        prefix_ids = self.tokenizer(self.prefix, return_tensors="pt")["input_ids"].to(self.device)
+        timings = []
+        with torch.no_grad():
+            for _ in range(max(1, runs)):
+                started = time.perf_counter()
+                output = self.model(input_ids=prefix_ids, use_cache=True)
+                timings.append(time.perf_counter() - started)
+
+        self.prefix_ids = prefix_ids
+        self.past_key_values = output.past_key_values
+        # The first run includes one-off allocation costs; keep the fastest
+        self.prefix_prefill_seconds = min(timings)
+
+    def _expand(self, batch_size: int):
+        """Prefix cache viewed as a batch; models concatenate onto it, never write in place."""
+        return tuple(
+            tuple(tensor.expand(batch_size, *tensor.shape[1:]) for tensor in layer)
+            for layer in self.past_key_values
+        )
+
+    def prepare(self, prompts: List[str]) -> Tuple[Dict[str, Any], int]:
+        """
+        Build generate() arguments that reuse the prefix cache.
+
+        Every prompt must start with the prefix. The suffixes are prefilled
+        here on top of the cached prefix, all but their last token, and
+        generate() receives that cache plus the full input ids, so it only
+        runs the final prompt token before sampling.
+
+        Returns:
+            (generate kwargs, prompt length in tokens)
+        """
+        suffixes = [prompt[len(self.prefix):] for prompt in prompts]
+        encoded = self.tokenizer(suffixes, return_tensors="pt", padding=True, add_special_tokens=False)
+        suffix_ids = encoded["input_ids"].to(self.device)
+        suffix_mask = encoded["attention_mask"].to(self.device)
+        batch_size, prefix_length = suffix_ids.shape[0], self.prefix_ids.shape[1]
+
+        # Left padding lands between the prefix and the suffix; the mask hides it
+        attention_mask = torch.cat([
+            torch.ones(batch_size, prefix_length, dtype=suffix_mask.dtype, device=self.device),
+            suffix_mask
+        ], dim=1)
+        input_ids = torch.cat([self.prefix_ids.expand(batch_size, -1), suffix_ids], dim=1)
+
+        past_key_values = self._expand(batch_size)
+        started = time.perf_counter()
+        if suffix_ids.shape[1] > 1:
+            position_ids = (attention_mask.long().cumsum(-1) - 1).clamp(min=0)
+            with torch.no_grad():
+                output = self.model(
+                    input_ids=suffix_ids[:, :-1],
+                    attention_mask=attention_mask[:, :-1],
+                    position_ids=position_ids[:, prefix_length:-1],
+                    past_key_values=past_key_values,
+                    use_cache=True
+                )
+            past_key_values = output.past_key_values
+        self.suffix_prefill.observe(time.perf_counter() - started)
+
+        with self._lock:
+            self.requests += batch_size
+
+        return {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+            'past_key_values': past_key_values
+        }, input_ids.shape[1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Prefix size, per-request prefill time saved and suffix prefill latency."""
+        saved = self.prefix_prefill_seconds or 0.0
+        return {
+            'ready': self.ready,
+            'prefix_tokens': int(self.prefix_ids.shape[1]) if self.prefix_ids is not None else 0,
+            'requests': self.requests,
+            'prefill_saved_ms_per_request': round(saved * 1000, 3),
+            'prefill_saved_seconds_total': round(saved * self.requests, 3),
+            'suffix_prefill': self.suffix_prefill.get_stats()
+        }
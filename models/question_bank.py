@@ -0,0 +1,61 @@
+"""
+Follow-up question bank for HealthAI
+Loaded once from the knowledge data into immutable, pre-rendered prompts
+"""
+from types import MappingProxyType
+from typing import Any, Dict, NamedTuple, Tuple
+
+# Used when the knowledge data has no "default" entry
+_GENERIC_FOLLOW_UP = {
+    "intro": "Thank you for describing your symptoms. Let me ask a few questions.",
+    "questions": [
+        "How long have you been experiencing this?",
+        "How severe would you rate it on a scale of 1-10?",
+        "Have you tried any treatments yet?",
+        "Are there any other symptoms accompanying this?"
+    ]
+}
+
+
+class FollowUpPrompt(NamedTuple):
+    """A follow-up question and the full message that asks it."""
+    response: str
+    question: str
+
+
+class QuestionBank:
+    """Symptom -> tuple of rendered follow-up prompts, built once."""
+
+    def __init__(self, medical_data: Dict[str, Any]):
+        entries = dict(medical_data.get("follow_up_questions", {}))
+        default = entries.pop("default", _GENERIC_FOLLOW_UP)
+
+        self._default_first, self._default = self._render(default)
+        rendered = {symptom: self._render(entry) for symptom, entry in entries.items()}
+        self._first = MappingProxyType({symptom: first for symptom, (first, _) in rendered.items()})
+        self._prompts = MappingProxyType({symptom: prompts for symptom, (_, prompts) in rendered.items()})
+
+    @staticmethod
+    def _render(entry: Dict[str, Any]) -> Tuple[FollowUpPrompt, Tuple[FollowUpPrompt, ...]]:
+        """Pre-render the opening prompt (with the intro) and the prompt for each question."""
+        questions = entry.get("questions", [])
+        first = FollowUpPrompt(
+            entry.get("intro", "") + "\n\n" + questions[0] + "\n\n**Please respond with your answer.**",
+            questions[0]
+        ) if questions else None
+        prompts = tuple(
+            FollowUpPrompt(question + "\n\n**Please provide your answer.**", question)
+            for question in questions
+        )
+        return first, prompts
+
+    def first_prompt(self, symptom: str) -> FollowUpPrompt:
+        """The opening prompt for a symptom, or the default one."""
+        return self._first.get(symptom, self._default_first)
+
+    def prompts_for(self, symptom: str) -> Tuple[FollowUpPrompt, ...]:
+        """Prompts for each follow-up question of a symptom, or the default set."""
+        return self._prompts.get(symptom, self._default)
+
+    def question_count(self, symptom: str) -> int:
+        return len(self.prompts_for(symptom))
@@ -1,33 +1,124 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+from transformers.utils import is_accelerate_available
 import json
 import re
-from typing import List, Dict, Any
+import threading
+import time
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+import config
+from models.batch_scheduler import MicroBatchScheduler
+from models.metrics import COALESCED_TOTAL, MODEL_SECONDS, RESPONSES_TOTAL
+from models.prefix_cache import PrefixKVCache
+from models.response_cache import ResponseCache
+from models.single_flight import SingleFlight
+
+PRECISIONS = ("auto", "fp32", "bf16", "int8")
+
+SYSTEM_PROMPT = "You are a helpful medical assistant. Provide accurate, helpful medical information while always reminding users to consult healthcare professionals for serious concerns."
 
 class QwenMedicalAssistant:
-    def __init__(self):
-        """Initialize the Qwen AI model for medical assistance."""
-        self.model_name = "Qwen/Qwen-7B-Chat"
+    def __init__(self, background: bool = False, cache: Optional[ResponseCache] = None,
+                 precision: Optional[str] = None):
+        """Initialize the Qwen AI model for medical assistance.
+
+        Args:
+            background: Load the model weights in a daemon thread instead of
+                blocking the caller. Until loading finishes, get_response()
+                serves the rule-based fallback.
+            cache: Optional shared cache of model answers
+            precision: Weight precision (see config.AI_MODEL_PRECISION);
+                defaults to the configured one
+        """
+        self.model_name = config.AI_MODEL_NAME
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.precision = self._resolve_precision(precision or config.AI_MODEL_PRECISION)
+        self.model = None
+        self.tokenizer = None
+        self.cache = cache
+        self.in_flight = SingleFlight() if config.REQUEST_COALESCING_ENABLED else None  # shares identical generations
+        self.prefix_cache = None  # KV cache of the system prompt, built after loading
         
-        print(f"🤖 Loading Qwen model on {self.device}...")
+        # Load state: pending, loading, ready, failed
+        self.load_state = 'pending'
+        self.load_error = None
+        self.load_started_at = None
+        self.load_time = None
+        self._load_thread = None
+        
+        # Concurrent requests are queued and generated together
+        self.scheduler = None
+        if config.AI_BATCHING_ENABLED:
+            self.scheduler = MicroBatchScheduler(
+                self._generate_batch,
+                max_batch_size=config.AI_BATCH_MAX_SIZE,
+                max_wait_ms=config.AI_BATCH_MAX_WAIT_MS,
+                name="qwen-batcher"
+            )
+        
+        if background:
+            self.start_background_load()
+        else:
+            self.load_model()
+    
+    def start_background_load(self) -> threading.Thread:
+        """Start loading the model in a daemon thread and return immediately."""
+        if self._load_thread is None:
+            self.load_state = 'loading'
+            self._load_thread = threading.Thread(
+                target=self.load_model,
+                name="qwen-model-loader",
+                daemon=True
+            )
+            self._load_thread.start()
+        return self._load_thread
+    
+    def load_model(self):
+        """Load tokenizer and model weights, recording load state and time."""
+        self.load_state = 'loading'
+        self.load_started_at = time.time()
+        print(f"🤖 Loading Qwen model on {self.device} ({self.precision})...")
         
         try:
             # Load tokenizer and model
-            self.tokenizer = AutoTokenizer.from_pretrained(
+            tokenizer = AutoTokenizer.from_pretrained(
                 self.model_name,
                 trust_remote_code=True
             )
-            self.model = AutoModelForCausalLM.from_pretrained(
+            model = AutoModelForCausalLM.from_pretrained(
                 self.model_name,
                 trust_remote_code=True,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                device_map="auto" if self.device == "cuda" else None
+                torch_dtype=self._load_dtype(),
+                device_map="auto" if self.device == "cuda" else None,
+                # Load weights straight into the model instead of over a randomly initialized copy;
+                # otherwise peak memory is about twice the weights (needs accelerate)
+                low_cpu_mem_usage=is_accelerate_available()
             )
             
             if self.device == "cpu":
-                self.model = self.model.to(self.device)
-                
+                model = model.to(self.device)
+            
+            if self.precision == "int8":
+                # Linear weights become int8; activations are quantized on the fly. The float32
+                # weights are loaded first, so peak memory is still about their size. In place:
+                # the default would deep-copy the whole float32 model and double that peak
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8,
+                                                               inplace=True)
+            model.eval()
+            
+            # Decoder-only models must be left-padded for batched generation
+            tokenizer.padding_side = "left"
+            if tokenizer.pad_token_id is None:
+                tokenizer.pad_token_id = getattr(tokenizer, "eod_id", tokenizer.eos_token_id)
+            
+            # Publish the tokenizer before the model so get_response() never
+            # sees a model without its tokenizer
+            self.tokenizer = tokenizer
+            self.model = model
+            if config.AI_PREFIX_CACHE_ENABLED:
+                self._warm_prefix_cache()
+            self.load_state = 'ready'
             print("✅ Qwen model loaded successfully!")
             
         except Exception as e:
@@ -35,53 +126,242 @@ class QwenMedicalAssistant:
             print("🔄 Falling back to rule-based responses...")
             self.model = None
             self.tokenizer = None
+            self.load_error = str(e)
+            self.load_state = 'failed'
+        finally:
+            self.load_time = time.time() - self.load_started_at
+    
+    def _warm_prefix_cache(self):
+        """Prefill the system prompt once; generation then only prefills the user part."""
+        try:
+            prefix_cache = PrefixKVCache(self.model, self.tokenizer, self._build_prompt_prefix(), self.device)
+            prefix_cache.warmup()
+            self.prefix_cache = prefix_cache
+            print(f"✅ Prompt prefix cached ({prefix_cache.get_stats()['prefix_tokens']} tokens, "
+                  f"{prefix_cache.prefix_prefill_seconds * 1000:.1f}ms prefill saved per request)")
+        except Exception as e:
+            print(f"⚠️ Prompt prefix cache disabled: {e}")
+            self.prefix_cache = None
+    
+    def _generation_inputs(self, prompts: List[str]):
+        """Tokenized generate() inputs and prompt length, reusing the prefix cache when warm."""
+        if self.prefix_cache and self.prefix_cache.ready:
+            return self.prefix_cache.prepare(prompts)
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+        return dict(inputs), inputs["input_ids"].shape[1]
+    
+    def _resolve_precision(self, precision: str) -> str:
+        """Validate a precision setting and map "auto" to the device default."""
+        precision = precision.lower()
+        if precision not in PRECISIONS:
+            print(f"⚠️ Unknown AI_MODEL_PRECISION '{precision}', using auto")
+            precision = "auto"
+        if precision == "int8" and self.device == "cuda":
+            # Dynamic quantization kernels are CPU-only
+            print("⚠️ int8 precision is CPU-only, using fp16 on GPU")
+            precision = "auto"
+        if precision == "auto":
+            precision = "fp16" if self.device == "cuda" else "fp32"
+        return precision
+    
+    def _load_dtype(self) -> torch.dtype:
+        """Dtype to load weights in; int8 quantizes from float32 weights."""
+        return {
+            "fp16": torch.float16,
+            "bf16": torch.bfloat16,
+        }.get(self.precision, torch.float32)
     
-    def get_response(self, user_input: str) -> str:
+    def is_ready(self) -> bool:
+        """Check if the model weights are loaded and usable."""
+        return self.load_state == 'ready'
+    
+    def get_load_status(self) -> Dict[str, Any]:
+        """Report model load state for health and readiness checks."""
+        return {
+            'model': self.model_name,
+            'device': self.device,
+            'precision': self.precision,
+            'state': self.load_state,
+            'load_time_seconds': round(self.load_time, 3) if self.load_time is not None else None,
+            'loading_for_seconds': round(time.time() - self.load_started_at, 3)
+                if self.load_state == 'loading' and self.load_started_at else None,
+            'error': self.load_error
+        }
+    
+    def get_response(self, user_input: str, context: str = "") -> str:
         """Generate a medical response using Qwen AI or fallback system."""
+        started = time.perf_counter()
         try:
             if self.model and self.tokenizer:
-                return self._generate_ai_response(user_input)
-            else:
-                return self._generate_fallback_response(user_input)
+                response, path = self._get_cached_ai_response(user_input, context)
+                self._record_path(path, started)
+                return response
         except Exception as e:
             print(f"Error generating response: {e}")
-            return self._generate_fallback_response(user_input)
+        response = self._generate_fallback_response(user_input)
+        self._record_path('fallback', started)
+        return response
     
-    def _generate_ai_response(self, user_input: str) -> str:
-        """Generate response using Qwen AI model."""
-        # Create medical context prompt
-        medical_prompt = f"""You are a helpful medical assistant. Provide accurate, helpful medical information while always reminding users to consult healthcare professionals for serious concerns.
-
-User Question: {user_input}
-
-Medical Assistant Response:"""
+    def _get_cached_ai_response(self, user_input: str, context: str = "") -> Tuple[str, str]:
+        """
+        Serve a model answer from the cache, generating it on a miss.
         
-        # Tokenize input
-        inputs = self.tokenizer.encode(medical_prompt, return_tensors="pt").to(self.device)
+        Identical prompts generating at the same time share one generation.
         
-        # Generate response
-        with torch.no_grad():
-            outputs = self.model.generate(
-                inputs,
-                max_length=inputs.shape[1] + 200,
-                num_return_sequences=1,
-                temperature=0.7,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id
-            )
+        Returns:
+            (answer, path) - path is 'cache', 'coalesced' or 'model'
+        """
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model_name, user_input, context)
+            response = self.cache.get(cache_key)
+            if response is not None:
+                return response, 'cache'
+        
+        if self.in_flight is None:
+            return self._generate_and_cache(user_input, context, cache_key), 'model'
         
-        # Decode response
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        key = cache_key or ResponseCache.make_key(self.model_name, user_input, context)
+        response, shared = self.in_flight.do(key, self._generate_and_cache, user_input, context, cache_key)
+        if shared:
+            COALESCED_TOTAL.labels('local').inc()
+            return response, 'coalesced'
+        return response, 'model'
+    
+    def _generate_and_cache(self, user_input: str, context: str, cache_key=None) -> str:
+        response = self._generate_ai_response(user_input, context)
+        if cache_key:
+            self.cache.put(cache_key, response)
+        return response
+    
+    def _record_path(self, path: str, started: float):
+        """Count a response by the path that served it and record its latency."""
+        MODEL_SECONDS.labels('local', path).observe(time.perf_counter() - started)
+        RESPONSES_TOTAL.labels(path, 'local').inc()
+    
+    def stream_response(self, user_input: str, context: str = "") -> Iterator[str]:
+        """Stream a medical response token by token, or the fallback in one chunk."""
+        started = time.perf_counter()
+        if not (self.model and self.tokenizer):
+            self._record_path('fallback', started)
+            yield self._generate_fallback_response(user_input)
+            return
+        
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model_name, user_input, context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_path('cache', started)
+                yield cached
+                return
+        
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        inputs, _ = self._generation_inputs([self._build_prompt(user_input, context)])
+        errors = []
+        
+        def generate():
+            try:
+                with torch.no_grad():
+                    self.model.generate(**inputs, streamer=streamer, **self._generation_kwargs())
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer
+                streamer.end()
+        
+        thread = threading.Thread(target=generate, name="qwen-streamer", daemon=True)
+        thread.start()
+        
+        generated = []
+        for text in streamer:
+            if text:
+                generated.append(text)
+                yield text
+        thread.join()
+        
+        if errors:
+            print(f"Error generating response: {errors[0]}")
+            if not generated:
+                self._record_path('fallback', started)
+                yield self._generate_fallback_response(user_input)
+                return
+        self._record_path('model', started)
+        
+        disclaimer = "\n\n⚠️ **Important**: This is preliminary guidance only. Please consult a healthcare professional for proper medical advice, especially for serious symptoms."
+        yield disclaimer
+        
+        if cache_key and not errors:
+            self.cache.put(cache_key, "".join(generated).strip() + disclaimer)
+    
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        """Sampling parameters shared by batched and streamed generation."""
+        return {
+            'max_new_tokens': config.AI_MAX_LENGTH,
+            'num_return_sequences': 1,
+            'temperature': config.AI_TEMPERATURE,
+            'do_sample': True,
+            'pad_token_id': self.tokenizer.pad_token_id
+        }
+    
+    def _build_prompt_prefix(self) -> str:
+        """The part of every prompt that doesn't depend on the request."""
+        return f"{SYSTEM_PROMPT}\n\n"
+    
+    def _build_prompt(self, user_input: str, context: str = "") -> str:
+        """Create the medical context prompt for a user question."""
+        if context:
+            context = f"{context.strip()}\n\n"
+        return f"""{self._build_prompt_prefix()}{context}User Question: {user_input}
+
+Medical Assistant Response:"""
+    
+    def _generate_ai_response(self, user_input: str, context: str = "") -> str:
+        """Generate response using Qwen AI model."""
+        medical_prompt = self._build_prompt(user_input, context)
         
-        # Extract only the assistant's response
-        if "Medical Assistant Response:" in response:
-            response = response.split("Medical Assistant Response:")[-1].strip()
+        if self.scheduler:
+            response = self.scheduler.submit(medical_prompt)
+        else:
+            response = self._generate_batch([medical_prompt])[0]
         
         # Add medical disclaimer
         disclaimer = "\n\n⚠️ **Important**: This is preliminary guidance only. Please consult a healthcare professional for proper medical advice, especially for serious symptoms."
         
         return response + disclaimer
     
+    def _generate_batch(self, prompts: List[str]) -> List[str]:
+        """Generate responses for several prompts in one padded model call."""
+        # Tokenize input (only the request-specific part is prefilled when the prefix is cached)
+        inputs, prompt_length = self._generation_inputs(prompts)
+        
+        # Generate response
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, **self._generation_kwargs())
+        
+        # Decode only the generated tokens of each row
+        responses = []
+        for output in outputs:
+            response = self.tokenizer.decode(output[prompt_length:], skip_special_tokens=True)
+            
+            # Extract only the assistant's response
+            if "Medical Assistant Response:" in response:
+                response = response.split("Medical Assistant Response:")[-1]
+            responses.append(response.strip())
+        
+        return responses
+    
+    def get_prefix_cache_stats(self) -> Dict[str, Any]:
+        """Get prompt prefix cache counters (empty until the cache is warm)."""
+        return self.prefix_cache.get_stats() if self.prefix_cache else {}
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """Get request coalescing counters (empty when coalescing is disabled)."""
+        return self.in_flight.get_stats() if self.in_flight else {}
+    
+    def get_batch_stats(self) -> Dict[str, Any]:
+        """Get micro-batching counters (empty when batching is disabled)."""
+        return self.scheduler.get_stats() if self.scheduler else {}
+    
     def _generate_fallback_response(self, user_input: str) -> str:
         """Generate fallback response using rule-based system."""
         user_input_lower = user_input.lower()
@@ -0,0 +1,200 @@
+"""
+Request rate limiting for HealthAI
+Token buckets per client key, kept in bounded, expiring process memory or in
+SQLite so the limit holds across worker processes
+"""
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Tuple
+
+import config
+from models.sqlite_connections import ThreadLocalSQLite
+
+
+class RateDecision(NamedTuple):
+    """Outcome of taking a token: whether the request may proceed, and when to retry if not."""
+    allowed: bool
+    retry_after: float
+    remaining: int
+
+
+class RateLimiter(ABC):
+    """Interface for token-bucket backends.
+
+    Every key has a bucket of up to `burst` tokens that refills at
+    requests_per_minute / 60 tokens per second; a request takes one token.
+    A bucket left idle long enough to refill completely is the same as a
+    new one, so backends may forget it.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int):
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.refill_seconds = self.burst / self.rate  # idle time after which a bucket is full again
+
+        # Counters
+        self.allowed = 0
+        self.limited = 0
+        self._counter_lock = threading.Lock()
+
+    @abstractmethod
+    def acquire(self, key: str) -> RateDecision:
+        """Take a token from the key's bucket."""
+
+    def _take(self, tokens: float, elapsed: float) -> Tuple[float, RateDecision]:
+        """Refill for the elapsed time and take a token; returns (tokens left, decision)."""
+        tokens = min(self.burst, tokens + elapsed * self.rate)
+        if tokens >= 1.0:
+            decision = RateDecision(True, 0.0, int(tokens - 1.0))
+            tokens -= 1.0
+        else:
+            decision = RateDecision(False, (1.0 - tokens) / self.rate, 0)
+        with self._counter_lock:
+            if decision.allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+        return tokens, decision
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        """Get limit settings and decision counters."""
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """Buckets in an LRU-bounded dict; idle buckets expire once they would be full again."""
+
+    def __init__(self, requests_per_minute: float = 30, burst: int = 10, max_keys: int = 100000):
+        """
+        Args:
+            requests_per_minute: Sustained request rate allowed per key
+            burst: Requests a key may make at once after being idle
+            max_keys: Most buckets held at once; the least recently used is dropped beyond this
+        """
+        super().__init__(requests_per_minute, burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at], least recently used first
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def acquire(self, key: str) -> RateDecision:
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(key)
+
+            bucket[0], decision = self._take(bucket[0], now - bucket[1])
+            bucket[1] = now
+            return decision
+
+    def _expire_idle(self, now: float):
+        """Drop full-again buckets; they sit at the front of the LRU order."""
+        cutoff = now - self.refill_seconds
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket[1] > cutoff:
+                break
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire_idle(time.monotonic())
+            return {
+                'backend': 'memory',
+                'requests_per_minute': round(self.rate * 60, 3),
+                'burst': self.burst,
+                'active_keys': len(self._buckets),
+                'max_keys': self.max_keys,
+                'evictions': self.evictions,
+                'allowed': self.allowed,
+                'limited': self.limited
+            }
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """Buckets in a SQLite table in WAL mode, shared by all processes on a host."""
+
+    def __init__(self, db_path: str, requests_per_minute: float = 30, burst: int = 10,
+                 cleanup_interval: float = 60.0):
+        """
+        Args:
+            db_path: SQLite database file
+            requests_per_minute: Sustained request rate allowed per key
+            burst: Requests a key may make at once after being idle
+            cleanup_interval: How often (seconds) full-again buckets are deleted
+        """
+        super().__init__(requests_per_minute, burst)
+        self.db_path = db_path
+        self._db = ThreadLocalSQLite(db_path, cleanup_interval)
+
+        self._db.connection().execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def acquire(self, key: str) -> RateDecision:
+        conn = self._db.connection()
+        now = time.time()
+        # IMMEDIATE takes the write lock up front, so the read-modify-write is atomic across processes
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated_at = row if row is not None else (float(self.burst), now)
+            tokens, decision = self._take(tokens, max(0.0, now - updated_at))
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._db.maybe_cleanup(self._delete_full_buckets)
+        return decision
+
+    def _delete_full_buckets(self, conn):
+        conn.execute('DELETE FROM rate_buckets WHERE updated_at <= ?', (time.time() - self.refill_seconds,))
+
+    def get_stats(self) -> Dict[str, Any]:
+        active = self._db.connection().execute(
+            'SELECT COUNT(*) FROM rate_buckets WHERE updated_at > ?', (time.time() - self.refill_seconds,)
+        ).fetchone()[0]
+        return {
+            'backend': 'sqlite',
+            'requests_per_minute': round(self.rate * 60, 3),
+            'burst': self.burst,
+            'active_keys': active,
+            'allowed': self.allowed,
+            'limited': self.limited
+        }
+
+
+def retry_after_header(decision: RateDecision) -> str:
+    """Retry-After value in whole seconds, rounded up so a retry at that time succeeds."""
+    return str(max(1, math.ceil(decision.retry_after)))
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the rate limiter selected by config.RATE_LIMIT_BACKEND."""
+    backend = config.RATE_LIMIT_BACKEND
+    if backend == 'memory':
+        return InMemoryRateLimiter(config.RATE_LIMIT_REQUESTS_PER_MINUTE, config.RATE_LIMIT_BURST,
+                                   max_keys=config.RATE_LIMIT_MAX_KEYS)
+    if backend == 'sqlite':
+        return SQLiteRateLimiter(config.RATE_LIMIT_DB_PATH, config.RATE_LIMIT_REQUESTS_PER_MINUTE,
+                                 config.RATE_LIMIT_BURST)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
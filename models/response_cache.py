@@ -0,0 +1,95 @@
+"""
+Response cache for HealthAI model answers
+Bounded LRU cache with per-entry TTL, keyed on normalized prompts
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    text = _NON_WORD.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache whose entries expire after a fixed TTL."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        """
+        Args:
+            max_size: Maximum number of cached responses
+            ttl: Seconds a cached response stays valid
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, context: str = "") -> Tuple[str, str, str]:
+        """Build a cache key from the model name and normalized prompt."""
+        return (model_name, normalize_prompt(prompt), normalize_prompt(context) if context else "")
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key: Hashable, response: Any):
+        """Cache a response, evicting the least recently used entry when full."""
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached responses."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
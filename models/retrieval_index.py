@@ -0,0 +1,218 @@
+"""
+Local retrieval over the medical knowledge base for HealthAI
+Hashed TF-IDF vectors in a NumPy matrix, searched with one matrix product
+"""
+import json
+import math
+import os
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Words too common in the knowledge base to help ranking
+_STOP_WORDS = frozenset((
+    "a", "about", "am", "an", "and", "are", "as", "at", "be", "been", "by", "can", "could", "did",
+    "do", "does", "feel", "for", "from", "get", "has", "have", "how", "i", "if", "in", "is", "it",
+    "me", "my", "of", "on", "or", "should", "that", "the", "this", "to", "was", "what", "when",
+    "which", "who", "why", "will", "with", "would", "you"
+))
+
+
+class Passage(NamedTuple):
+    """A knowledge base chunk and its retrieval score."""
+    chunk_id: str
+    title: str
+    text: str
+    score: float
+
+
+def build_chunks(medical_data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Split the symptoms, conditions and first aid sections into one chunk per entry."""
+    chunks = []
+
+    for name, info in medical_data.get("symptoms", {}).items():
+        title = name.replace("_", " ").title()
+        parts = [f"{title}: {info.get('description', '')}."]
+        if info.get("aliases"):
+            parts.append("Also called: " + ", ".join(info["aliases"]) + ".")
+        if info.get("common_causes"):
+            parts.append("Common causes: " + ", ".join(info["common_causes"]) + ".")
+        if info.get("self_care"):
+            parts.append("Self-care: " + ", ".join(info["self_care"]) + ".")
+        if info.get("when_to_see_doctor"):
+            parts.append("See a doctor for: " + ", ".join(info["when_to_see_doctor"]) + ".")
+        chunks.append({"id": f"symptom:{name}", "title": title, "text": " ".join(parts)})
+
+    for name, info in medical_data.get("conditions", {}).items():
+        title = name.replace("_", " ").title()
+        parts = [f"{title}."]
+        for field, items in info.items():
+            label = field.replace("_", " ").capitalize()
+            if isinstance(items, list):
+                parts.append(f"{label}: " + ", ".join(items) + ".")
+            else:
+                parts.append(f"{label}: {items}.")
+        chunks.append({"id": f"condition:{name}", "title": title, "text": " ".join(parts)})
+
+    for name, text in medical_data.get("first_aid", {}).items():
+        title = name.replace("_", " ").title()
+        chunks.append({"id": f"first_aid:{name}", "title": f"First aid for {title.lower()}",
+                       "text": f"First aid for {title.lower()}: {text}"})
+
+    return chunks
+
+
+def _stem(word: str) -> str:
+    """Crude suffix folding so "headaches"/"headache" and "burned"/"burns" share a feature."""
+    if len(word) > 6 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 5 and word.endswith("ed"):
+        return word[:-2]
+    if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stop words, plus adjacent-word bigrams."""
+    words = [_stem(word) for word in _TOKEN.findall(text.lower()) if word not in _STOP_WORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class HashingVectorizer:
+    """Maps text to fixed-width term-frequency rows via a stable feature hash."""
+
+    def __init__(self, n_features: int = 16384):
+        self.n_features = n_features
+
+    def _bucket(self, token: str) -> int:
+        # crc32 is stable across processes, unlike hash()
+        return zlib.crc32(token.encode("utf-8")) % self.n_features
+
+    def transform(self, texts: Iterable[str]) -> np.ndarray:
+        """Sublinear term frequencies, one float32 row per text."""
+        texts = list(texts)
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for token in tokenize(text):
+                bucket = self._bucket(token)
+                counts[bucket] = counts.get(bucket, 0) + 1
+            for bucket, count in counts.items():
+                matrix[row, bucket] = 1.0 + math.log(count)
+        return matrix
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class RetrievalIndex:
+    """
+    Knowledge base chunks as L2-normalized TF-IDF rows.
+
+    Queries are vectorized the same way, so the cosine similarity of a batch
+    of queries against every chunk is a single (queries x chunks) product.
+    """
+
+    def __init__(self, chunks: List[Dict[str, str]], matrix: np.ndarray, idf: np.ndarray, version: str = ""):
+        self.chunks = chunks
+        self.matrix = matrix
+        self.idf = idf
+        self.version = version
+        self.vectorizer = HashingVectorizer(matrix.shape[1])
+
+    @classmethod
+    def build(cls, medical_data: Dict[str, Any], version: str = "", n_features: int = 16384) -> "RetrievalIndex":
+        """Vectorize every chunk of the knowledge data."""
+        chunks = build_chunks(medical_data)
+        vectorizer = HashingVectorizer(n_features)
+        counts = vectorizer.transform(chunk["text"] for chunk in chunks)
+
+        # Smoothed idf over the chunk collection
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = (np.log((1 + len(chunks)) / (1 + document_frequency)) + 1.0).astype(np.float32)
+        matrix = _normalize_rows(counts * idf)
+        return cls(chunks, matrix.astype(np.float32), idf, version)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["RetrievalIndex"]:
+        """Read an index written by save(); None if it is missing or unreadable."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                chunks = json.loads(str(stored["chunks"]))
+                return cls(chunks, stored["matrix"], stored["idf"], str(stored["version"]))
+        except Exception as e:
+            print(f"⚠️ Could not load retrieval index {path}: {e}")
+            return None
+
+    @classmethod
+    def load_or_build(cls, medical_data: Dict[str, Any], version: str, path: Optional[str] = None,
+                      n_features: int = 16384) -> "RetrievalIndex":
+        """Reuse the index on disk if it matches this knowledge version, else build and save one."""
+        if path:
+            index = cls.load(path)
+            if index is not None and index.version == version and index.matrix.shape[1] == n_features:
+                return index
+
+        index = cls.build(medical_data, version, n_features)
+        if path:
+            index.save(path)
+        return index
+
+    def save(self, path: str):
+        """Write the index atomically as a compressed .npz file."""
+        temp_path = path + ".tmp.npz"
+        try:
+            np.savez_compressed(
+                temp_path,
+                matrix=self.matrix,
+                idf=self.idf,
+                chunks=np.array(json.dumps(self.chunks)),
+                version=np.array(self.version)
+            )
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not save retrieval index {path}: {e}")
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def search_batch(self, queries: List[str], k: int = 3, min_score: float = 0.0) -> List[List[Passage]]:
+        """Top-k passages for each query, best first."""
+        if not queries or not self.chunks:
+            return [[] for _ in queries]
+
+        query_matrix = _normalize_rows(self.vectorizer.transform(queries) * self.idf)
+        scores = query_matrix @ self.matrix.T  # (queries, chunks) cosine similarities
+
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ranked = candidates[np.argsort(-scores[row, candidates])]
+            results.append([
+                Passage(self.chunks[i]["id"], self.chunks[i]["title"], self.chunks[i]["text"], float(scores[row, i]))
+                for i in ranked if scores[row, i] > min_score
+            ])
+        return results
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0) -> List[Passage]:
+        return self.search_batch([query], k, min_score)[0]
+
+    def build_context(self, query: str, k: int = 3, min_score: float = 0.0) -> str:
+        """Prompt-ready block of the passages most relevant to a query, or ""."""
+        passages = self.search(query, k, min_score)
+        if not passages:
+            return ""
+        lines = ["Relevant medical information:"]
+        lines.extend(f"- {passage.text}" for passage in passages)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,435 @@
+"""
+Conversation session state for HealthAI
+Compact per-session state objects in bounded, expiring stores that can be
+kept in process memory, in SQLite or in shared memory across workers
+"""
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import config
+from models.sqlite_connections import ThreadLocalSQLite
+
+try:
+    import fcntl
+except ImportError:  # Windows - the shared memory store is unavailable
+    fcntl = None
+
+
+class ConversationState:
+    """Symptom-flow state of one conversation."""
+    __slots__ = ('stage', 'symptoms', 'symptom_details', 'question_index', 'risk_level', 'last_seen')
+
+    def __init__(self, stage: str = 'initial', symptoms: Optional[List[str]] = None,
+                 symptom_details: Optional[Dict[str, str]] = None, question_index: int = 0,
+                 risk_level: str = 'low'):
+        self.stage = stage  # initial, gathering_symptoms, suggesting
+        self.symptoms = symptoms if symptoms is not None else []
+        self.symptom_details = symptom_details if symptom_details is not None else {}
+        self.question_index = question_index
+        self.risk_level = risk_level
+        self.last_seen = time.monotonic()
+
+    def reset(self):
+        """Start the symptom flow over, in place."""
+        self.stage = 'initial'
+        self.symptoms = []
+        self.symptom_details = {}
+        self.question_index = 0
+        self.risk_level = 'low'
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain-dict view of the state."""
+        return {
+            'stage': self.stage,
+            'symptoms': list(self.symptoms),
+            'symptom_details': dict(self.symptom_details),
+            'question_index': self.question_index,
+            'risk_level': self.risk_level
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ConversationState':
+        """Rebuild a state from to_dict() output."""
+        return cls(
+            stage=data.get('stage', 'initial'),
+            symptoms=data.get('symptoms'),
+            symptom_details=data.get('symptom_details'),
+            question_index=data.get('question_index', 0),
+            risk_level=data.get('risk_level', 'low')
+        )
+
+    def to_bytes(self) -> bytes:
+        """Compact serialized form for shared stores."""
+        return json.dumps(self.to_dict(), separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ConversationState':
+        return cls.from_dict(json.loads(data.decode('utf-8')))
+
+
+class SessionStore(ABC):
+    """Interface for session state backends.
+
+    The conversation manager reads a session's state with get(), changes it
+    in place and writes it back with save(). Concurrent turns of the same
+    session are last-writer-wins; a user normally waits for each reply.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> ConversationState:
+        """Get the state for a session, or a fresh one if missing or expired."""
+
+    @abstractmethod
+    def save(self, session_id: str, state: ConversationState):
+        """Store a session's state and restart its idle timer."""
+
+    def reset(self, session_id: str) -> ConversationState:
+        """Replace a session's state with a fresh one."""
+        state = ConversationState()
+        self.save(session_id, state)
+        return state
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        """Get live-session and eviction gauges."""
+
+
+class InMemorySessionStore(SessionStore):
+    """LRU-bounded session states that expire after a period of inactivity."""
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 3600.0):
+        """
+        Args:
+            max_sessions: Most sessions held at once; the least recently used is evicted beyond this
+            ttl: Seconds of inactivity after which a session starts over
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._states = OrderedDict()  # session_id -> ConversationState, least recently used first
+        self._lock = threading.Lock()
+
+        # Counters
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> ConversationState:
+        """Get the state for a session, creating a fresh one if missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+
+            state = self._states.get(session_id)
+            if state is None:
+                state = ConversationState()
+                self._states[session_id] = state
+                while len(self._states) > self.max_sessions:
+                    self._states.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._states.move_to_end(session_id)
+
+            state.last_seen = now
+            return state
+
+    def save(self, session_id: str, state: ConversationState):
+        """Keep the state object (get() already returned it by reference)."""
+        with self._lock:
+            state.last_seen = time.monotonic()
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+                self.evictions += 1
+
+    def _expire_idle(self, now: float):
+        """Drop idle sessions; they sit at the front of the LRU order."""
+        cutoff = now - self.ttl
+        while self._states:
+            session_id, state = next(iter(self._states.items()))
+            if state.last_seen > cutoff:
+                break
+            del self._states[session_id]
+            self.expirations += 1
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get live-session and eviction gauges."""
+        with self._lock:
+            self._expire_idle(time.monotonic())
+            return {
+                'backend': 'memory',
+                'live_sessions': len(self._states),
+                'max_sessions': self.max_sessions,
+                'ttl_seconds': self.ttl,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session states in a SQLite database in WAL mode, shared by all processes on a host."""
+
+    def __init__(self, db_path: str, ttl: float = 3600.0, cleanup_interval: float = 60.0):
+        """
+        Args:
+            db_path: SQLite database file
+            ttl: Seconds of inactivity after which a session starts over
+            cleanup_interval: How often (seconds) expired rows are deleted
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self._db = ThreadLocalSQLite(db_path, cleanup_interval)
+        self.expirations = 0
+
+        conn = self._db.connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS conversation_states (
+                session_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_conversation_states_updated ON conversation_states (updated_at)')
+        conn.commit()
+
+    def get(self, session_id: str) -> ConversationState:
+        row = self._db.connection().execute(
+            'SELECT state, updated_at FROM conversation_states WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None or row[1] <= time.time() - self.ttl:
+            return ConversationState()
+        return ConversationState.from_bytes(row[0].encode('utf-8'))
+
+    def save(self, session_id: str, state: ConversationState):
+        self._db.connection().execute(
+            'INSERT OR REPLACE INTO conversation_states (session_id, state, updated_at) VALUES (?, ?, ?)',
+            (session_id, state.to_bytes().decode('utf-8'), time.time())
+        )
+        self._db.maybe_cleanup(self._delete_expired)
+
+    def _delete_expired(self, conn):
+        cursor = conn.execute('DELETE FROM conversation_states WHERE updated_at <= ?', (time.time() - self.ttl,))
+        self.expirations += cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        live = self._db.connection().execute(
+            'SELECT COUNT(*) FROM conversation_states WHERE updated_at > ?', (time.time() - self.ttl,)
+        ).fetchone()[0]
+        return {
+            'backend': 'sqlite',
+            'live_sessions': live,
+            'ttl_seconds': self.ttl,
+            'evictions': 0,
+            'expirations': self.expirations
+        }
+
+
+class SharedMemorySessionStore(SessionStore):
+    """Fixed-size session table in POSIX shared memory, shared by all processes on a host.
+
+    The table is split into buckets of a few slots. A session hashes to one
+    bucket, which is guarded by a thread lock plus a byte-range lock on a
+    lock file, so a read or write touches a single bucket and never blocks
+    other sessions. A full bucket evicts its least recently saved slot.
+    """
+
+    # Slot header: session key digest, last save time, payload length
+    _HEADER = struct.Struct('<16sdI')
+    _LOCK_STRIPES = 64
+
+    def __init__(self, name: str = 'healthai_sessions', buckets: int = 4096, slots_per_bucket: int = 4,
+                 slot_size: int = 2048, ttl: float = 3600.0):
+        """
+        Args:
+            name: Shared memory segment name; workers using the same name share sessions
+            buckets: Number of hash buckets
+            slots_per_bucket: Sessions held per bucket before eviction
+            slot_size: Bytes per slot, including the header
+            ttl: Seconds of inactivity after which a session starts over
+        """
+        if fcntl is None:
+            raise RuntimeError("SharedMemorySessionStore requires a POSIX system")
+        from multiprocessing import shared_memory
+
+        self.name = name
+        self.buckets = buckets
+        self.slots_per_bucket = slots_per_bucket
+        self.slot_size = slot_size
+        self.ttl = ttl
+        self.max_payload = slot_size - self._HEADER.size
+        size = buckets * slots_per_bucket * slot_size
+
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+            if self._shm.size < size:
+                raise RuntimeError(f"Shared memory segment '{name}' is smaller than the configured table")
+        self._untrack()
+        self._buf = self._shm.buf
+
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), 'a+b')
+        self._thread_locks = [threading.Lock() for _ in range(self._LOCK_STRIPES)]
+        self.evictions = 0
+
+    def _untrack(self):
+        """Keep the segment alive when this process exits; other workers still use it."""
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        except Exception:
+            pass
+
+    def close(self, unlink: bool = False):
+        """Detach from the segment; with unlink, also remove it and its lock file (no worker may still use it)."""
+        self._buf = None
+        self._shm.close()
+        self._lock_file.close()
+        if unlink:
+            from multiprocessing import resource_tracker
+            # unlink() unregisters the segment again; register it so the tracker stays consistent
+            resource_tracker.register(self._shm._name, 'shared_memory')
+            self._shm.unlink()
+            try:
+                os.remove(self._lock_file.name)
+            except OSError:
+                pass
+
+    def _locate(self, session_id: str):
+        key = hashlib.blake2b(session_id.encode('utf-8'), digest_size=16).digest()
+        bucket = int.from_bytes(key[:8], 'little') % self.buckets
+        return key, bucket
+
+    def _lock_bucket(self, bucket: int):
+        thread_lock = self._thread_locks[bucket % self._LOCK_STRIPES]
+        thread_lock.acquire()
+        try:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, bucket)
+        except Exception:
+            thread_lock.release()
+            raise
+        return thread_lock
+
+    def _unlock_bucket(self, bucket: int, thread_lock: threading.Lock):
+        try:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, bucket)
+        finally:
+            thread_lock.release()
+
+    def _slot_offset(self, bucket: int, slot: int) -> int:
+        return (bucket * self.slots_per_bucket + slot) * self.slot_size
+
+    def get(self, session_id: str) -> ConversationState:
+        key, bucket = self._locate(session_id)
+        lock = self._lock_bucket(bucket)
+        try:
+            for slot in range(self.slots_per_bucket):
+                offset = self._slot_offset(bucket, slot)
+                slot_key, updated_at, length = self._HEADER.unpack_from(self._buf, offset)
+                if slot_key == key:
+                    if updated_at <= time.time() - self.ttl:
+                        break
+                    start = offset + self._HEADER.size
+                    return ConversationState.from_bytes(bytes(self._buf[start:start + length]))
+        finally:
+            self._unlock_bucket(bucket, lock)
+        return ConversationState()
+
+    def save(self, session_id: str, state: ConversationState):
+        payload = self._fit(state)
+        key, bucket = self._locate(session_id)
+        now = time.time()
+        lock = self._lock_bucket(bucket)
+        try:
+            target, oldest_time, empty = None, None, None
+            for slot in range(self.slots_per_bucket):
+                slot_key, updated_at, _ = self._HEADER.unpack_from(self._buf, self._slot_offset(bucket, slot))
+                if slot_key == key:
+                    target = slot
+                    break
+                if empty is None and (updated_at == 0 or updated_at <= now - self.ttl):
+                    empty = slot
+                if oldest_time is None or updated_at < oldest_time:
+                    oldest_time, oldest = updated_at, slot
+
+            if target is None:
+                if empty is not None:
+                    target = empty
+                else:
+                    target = oldest
+                    self.evictions += 1
+
+            offset = self._slot_offset(bucket, target)
+            self._HEADER.pack_into(self._buf, offset, key, now, len(payload))
+            start = offset + self._HEADER.size
+            self._buf[start:start + len(payload)] = payload
+        finally:
+            self._unlock_bucket(bucket, lock)
+
+    def _fit(self, state: ConversationState) -> bytes:
+        """Serialize a state, shortening it until it fits a slot.
+
+        Free-text answers are trimmed, then dropped, then the latest symptoms;
+        raises ValueError if even a state without symptoms doesn't fit.
+        """
+        payload = state.to_bytes()
+        if len(payload) <= self.max_payload:
+            return payload
+
+        # Answers are only kept for context; trim them before giving up
+        data = state.to_dict()
+        data['symptom_details'] = {symptom: answer[:64] for symptom, answer in data['symptom_details'].items()}
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        if len(payload) > self.max_payload:
+            data['symptom_details'] = {}
+            payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        # Still too large (many long symptom names): keep the symptoms reported first
+        while len(payload) > self.max_payload and data['symptoms']:
+            data['symptoms'].pop()
+            payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        if len(payload) > self.max_payload:
+            raise ValueError(f"Session state does not fit a {self.slot_size}-byte slot")
+        return payload
+
+    def get_stats(self) -> Dict[str, Any]:
+        cutoff = time.time() - self.ttl
+        live = 0
+        for index in range(self.buckets * self.slots_per_bucket):
+            _, updated_at, _ = self._HEADER.unpack_from(self._buf, index * self.slot_size)
+            if updated_at > cutoff:
+                live += 1
+        return {
+            'backend': 'shared_memory',
+            'live_sessions': live,
+            'max_sessions': self.buckets * self.slots_per_bucket,
+            'ttl_seconds': self.ttl,
+            'evictions': self.evictions,
+            'expirations': None
+        }
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by config.SESSION_STORE_BACKEND."""
+    backend = config.SESSION_STORE_BACKEND
+    if backend == 'memory':
+        return InMemorySessionStore(max_sessions=config.SESSION_MAX_ACTIVE, ttl=config.SESSION_TIMEOUT)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(config.SESSION_DB_PATH, ttl=config.SESSION_TIMEOUT)
+    if backend == 'shared_memory':
+        return SharedMemorySessionStore(
+            name=config.SESSION_SHM_NAME,
+            buckets=max(1, config.SESSION_MAX_ACTIVE // 4),
+            slots_per_bucket=4,
+            ttl=config.SESSION_TIMEOUT
+        )
+    raise ValueError(f"Unknown session store backend: {backend}")
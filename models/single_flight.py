@@ -0,0 +1,115 @@
+"""
+Request coalescing for HealthAI model calls
+Concurrent calls with the same key share one in-flight call and its result
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """One in-flight call and the outcome its followers wait for."""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls.
+
+    The first caller for a key (the leader) runs the call; callers arriving
+    while it is in flight wait and receive the same result or exception.
+    Nothing is kept once the call finishes - caching is the response
+    cache's job. Threads use do(), coroutines on one event loop do_async().
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.calls = 0  # calls actually made
+        self.coalesced = 0  # callers served by another caller's call
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Tuple[Any, bool]:
+        """Run fn(*args), or wait for the identical call already in flight.
+
+        Returns:
+            (result, shared) - shared is True if another caller's call produced it
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args) -> Tuple[Any, bool]:
+        """Await fn(*args), or the identical call already in flight on this loop."""
+        while True:
+            future = self._async_calls.get(key)
+            if future is None:
+                break
+            with self._lock:
+                self.coalesced += 1
+            try:
+                # shield: a follower giving up must not cancel the leader's call
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not this caller; take over the call
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        with self._lock:
+            self.calls += 1
+        try:
+            result = await fn(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here, so an unawaited future doesn't log a warning
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._async_calls[key]
+        return result, False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get in-flight and coalescing counters."""
+        with self._lock:
+            requests = self.calls + self.coalesced
+            return {
+                'in_flight': len(self._calls) + len(self._async_calls),
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'coalesced_rate': round(self.coalesced / requests, 4) if requests else 0.0
+            }
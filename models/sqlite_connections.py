@@ -0,0 +1,46 @@
+"""
+Shared SQLite access for HealthAI's cross-process stores
+One long-lived autocommit WAL connection per thread, plus periodic cleanup
+run by one thread at a time
+"""
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+
+class ThreadLocalSQLite:
+    """Per-thread connections to one SQLite database in WAL mode."""
+
+    def __init__(self, db_path: str, cleanup_interval: float = 60.0):
+        """
+        Args:
+            db_path: SQLite database file
+            cleanup_interval: Minimum seconds between maybe_cleanup() runs
+        """
+        self.db_path = db_path
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._next_cleanup = time.monotonic() + cleanup_interval
+        self._cleanup_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def maybe_cleanup(self, cleanup: Callable[[sqlite3.Connection], None]):
+        """Run cleanup(connection) every cleanup_interval, from whichever thread gets there first."""
+        now = time.monotonic()
+        if now < self._next_cleanup or not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_cleanup = now + self.cleanup_interval
+            cleanup(self.connection())
+        finally:
+            self._cleanup_lock.release()
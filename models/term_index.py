@@ -0,0 +1,313 @@
+"""
+Compiled multi-pattern matching for HealthAI
+Aho-Corasick automaton over symptoms, causes and emergency terms,
+plus a trigram index for typo-tolerant symptom lookup
+"""
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Terms that raise urgency to moderate when no emergency sign is present
+MODERATE_URGENCY_TERMS = ("fever", "persistent cough", "severe pain", "dizziness", "nausea")
+
+_PARENTHETICAL = re.compile(r"\s*\(([^)]*)\)")
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace so terms and messages line up."""
+    return " ".join(text.lower().split())
+
+
+class TermMatcher:
+    """Aho-Corasick automaton that finds every term occurrence in one pass."""
+
+    def __init__(self):
+        self._goto = [{}]  # node -> {char: node}
+        self._fail = [0]
+        self._output = [[]]  # node -> [(term length, payload)]
+        self._built = False
+
+    def add(self, term: str, payload: Any):
+        """Register a term; payload is returned with every match of it."""
+        term = normalize_text(term)
+        if not term:
+            return
+
+        node = 0
+        for char in term:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][char] = next_node
+            node = next_node
+        self._output[node].append((len(term), payload))
+        self._built = False
+
+    def build(self):
+        """Compute failure links breadth-first and merge outputs along them."""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """
+        Yield (start, end, payload) for every whole-word term occurrence.
+
+        The text is normalized first, so offsets refer to normalize_text(text).
+        A term must start on a word boundary and end on one, optionally
+        followed by a plural "s"/"es" ("headaches" matches "headache").
+        """
+        if not self._built:
+            self.build()
+
+        text = normalize_text(text)
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            for length, payload in output[node]:
+                start = index - length + 1
+                end = index + 1
+                if _is_word_boundary(text, start, end):
+                    yield start, end, payload
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    """Check the match is not part of a longer word."""
+    if start > 0 and text[start - 1].isalnum():
+        return False
+    if end == len(text) or not text[end].isalnum():
+        return True
+    for suffix in ("s", "es"):
+        stop = end + len(suffix)
+        if text.startswith(suffix, end) and (stop == len(text) or not text[stop].isalnum()):
+            return True
+    return False
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """
+    Levenshtein distance between a and b, or None if it exceeds limit.
+
+    Only the diagonal band of width 2 * limit + 1 is computed, and the scan
+    stops as soon as every cell in a row is over the limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+
+    too_far = limit + 1
+    previous = [column if column <= limit else too_far for column in range(len(b) + 1)]
+    for row in range(1, len(a) + 1):
+        current = [too_far] * (len(b) + 1)
+        if row <= limit:
+            current[0] = row
+        low, high = max(1, row - limit), min(len(b), row + limit)
+        for column in range(low, high + 1):
+            cost = 0 if a[row - 1] == b[column - 1] else 1
+            current[column] = min(previous[column] + 1, current[column - 1] + 1, previous[column - 1] + cost)
+        if min(current[low - 1:high + 1]) > limit:
+            return None
+        previous = current
+
+    distance = previous[len(b)]
+    return distance if distance <= limit else None
+
+
+class FuzzyMatcher:
+    """
+    Trigram index over a term vocabulary for typo-tolerant lookup.
+
+    Candidates are found through trigram postings, so only terms sharing
+    enough trigrams with the query are ever compared, and only those get a
+    bounded edit-distance check.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        self._terms: List[Tuple[str, Any]] = []
+        self._limits: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        self.max_words = 1
+        self.max_length = 0
+        # Message words repeat a lot; remember recent lookups
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    @staticmethod
+    def _trigrams(term: str) -> set:
+        padded = f"  {term} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @staticmethod
+    def max_edits(term: str) -> int:
+        """Typos tolerated for a term: none when short, more as it grows."""
+        if len(term) < 5:
+            return 0
+        return 1 if len(term) < 10 else 2
+
+    def add(self, term: str, payload: Any):
+        term = normalize_text(term)
+        if self.max_edits(term) == 0:
+            return
+        term_id = len(self._terms)
+        self._terms.append((term, payload))
+        self._limits.append(self.max_edits(term))
+        for gram in self._trigrams(term):
+            self._postings.setdefault(gram, []).append(term_id)
+        self.max_words = max(self.max_words, term.count(" ") + 1)
+        self.max_length = max(self.max_length, len(term))
+        self.lookup.cache_clear()
+
+    def _lookup(self, query: str) -> Optional[Tuple[str, Any, int]]:
+        """Closest (term, payload, distance) within the term's edit limit, or None."""
+        query = normalize_text(query)
+        # Nothing shorter than 5 letters is within reach of a term, nothing much longer either
+        if len(query) < 5 or len(query) > self.max_length + 2:
+            return None
+        grams = self._trigrams(query)
+        shared = {}
+        for gram in grams:
+            for term_id in self._postings.get(gram, ()):
+                shared[term_id] = shared.get(term_id, 0) + 1
+
+        best = None
+        query_length = len(query)
+        for term_id, count in shared.items():
+            term, payload = self._terms[term_id]
+            limit = self._limits[term_id]
+            # q-gram lemma: each edit destroys at most 3 trigrams
+            if count + 3 * limit <= max(len(term), query_length):
+                continue
+            # Typos rarely hit the first letter; requiring it prunes most false friends
+            if term[0] != query[0]:
+                continue
+            # Short terms only tolerate an extra letter ("feaver"), not a swap ("fewer")
+            if len(term) < 6 and len(query) <= len(term):
+                continue
+            distance = bounded_edit_distance(query, term, limit)
+            if distance is not None and (best is None or distance < best[2]):
+                best = (term, payload, distance)
+        return best
+
+
+class MedicalTermIndex:
+    """Symptom, cause and emergency terms from the knowledge base, compiled once."""
+
+    def __init__(self, medical_data: Dict[str, Any], emergency_keywords: Iterable[str] = ()):
+        self.matcher = TermMatcher()
+        symptoms = medical_data.get("symptoms", {})
+        self.symptom_order = {key: position for position, key in enumerate(symptoms)}
+
+        self.fuzzy = FuzzyMatcher()
+
+        for symptom_key, symptom_data in symptoms.items():
+            names = {symptom_key, symptom_key.replace("_", " ")}
+            names.update(symptom_data.get("aliases", []))
+            for name in names:
+                self.matcher.add(name, ("symptom", symptom_key))
+                self.fuzzy.add(name, ("symptom", symptom_key))
+            for cause in symptom_data.get("common_causes", []):
+                self.matcher.add(cause, ("cause", symptom_key))
+                self.fuzzy.add(cause, ("cause", symptom_key))
+
+        for sign in medical_data.get("emergency_signs", []):
+            self.matcher.add(sign, ("emergency_sign", sign))
+            short_sign = _PARENTHETICAL.sub("", sign)
+            if short_sign != sign:
+                self.matcher.add(short_sign, ("emergency_sign", sign))
+            # Listed signs ("facial drooping, arm weakness") are emergency terms of their own
+            for listed in _PARENTHETICAL.findall(sign):
+                for term in filter(None, (part.strip() for part in listed.split(","))):
+                    self.matcher.add(term, ("emergency_sign", term))
+
+        for keyword in emergency_keywords:
+            self.matcher.add(keyword, ("emergency_keyword", keyword))
+
+        for term in MODERATE_URGENCY_TERMS:
+            self.matcher.add(term, ("moderate", term))
+
+        self.matcher.build()
+
+    def scan(self, text: str) -> Dict[str, List[str]]:
+        """Find all terms in text, grouped by category, without duplicates."""
+        hits = {}
+        for _, _, (category, value) in self.matcher.iter_matches(text):
+            values = hits.setdefault(category, [])
+            if value not in values:
+                values.append(value)
+        return hits
+
+    def detect_symptoms(self, text: str, fuzzy: bool = True) -> List[str]:
+        """
+        Symptom keys mentioned directly or through a common cause, in knowledge order.
+
+        Words not covered by an exact match are then looked up in the trigram
+        index, so misspellings like "headach" or "feaver" are still detected.
+        """
+        detected = set()
+        covered = []
+        for start, end, (category, value) in self.matcher.iter_matches(text):
+            if category in ("symptom", "cause"):
+                detected.add(value)
+                covered.append((start, end))
+
+        if fuzzy:
+            detected.update(self._fuzzy_symptoms(normalize_text(text), covered))
+        return sorted(detected, key=self.symptom_order.get)
+
+    def _fuzzy_symptoms(self, text: str, covered: List[Tuple[int, int]]) -> set:
+        """Fuzzy-match runs of consecutive words outside the exact-match spans."""
+        words = [None if any(start <= match.start() < end for start, end in covered) else match.group()
+                 for match in _WORD.finditer(text)]
+        found = set()
+        for i in range(len(words)):
+            for size in range(1, self.fuzzy.max_words + 1):
+                window = words[i:i + size]
+                if len(window) < size or None in window:
+                    break
+                query = " ".join(window)
+                if len(query) > self.fuzzy.max_length + 2:
+                    break
+                match = self.fuzzy.lookup(query)
+                if match:
+                    found.add(match[1][1])
+        return found
+
+    def find_emergencies(self, text: str) -> List[str]:
+        """
+        Emergency signs and keywords mentioned in text, each named once.
+
+        Case variants are merged ("Difficulty breathing" / "difficulty
+        breathing") and hits contained in a longer hit are dropped
+        ("chest pain" within "Severe chest pain").
+        """
+        hits = self.scan(text)
+        found = hits.get("emergency_sign", []) + hits.get("emergency_keyword", [])
+        kept = []
+        for term in sorted(found, key=len, reverse=True):
+            words = f" {' '.join(_WORD.findall(term.lower()))} "
+            if not any(words in f" {' '.join(_WORD.findall(longer.lower()))} " for longer in kept):
+                kept.append(term)
+        return sorted(kept, key=found.index)
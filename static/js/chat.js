@@ -4,6 +4,7 @@ class HealthAIChat {
     constructor() {
         this.sessionId = this.generateSessionId();
         this.isLoading = false;
+        this.useStreaming = typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
         this.messageInput = document.getElementById('messageInput');
         this.sendButton = document.getElementById('sendButton');
         this.chatMessages = document.getElementById('chatMessages');
@@ -82,37 +83,11 @@ class HealthAIChat {
         this.showLoading();
         
         try {
-            // Send to backend
-            const response = await fetch('/api/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    message: message,
-                    session_id: this.sessionId
-                })
-            });
-
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-
-            const data = await response.json();
-            
-            // Add bot response to chat
-            this.addMessage(data.response, 'bot');
-            
-            // Handle medication suggestions and recommendations
-            if (data.medications && data.medications.length > 0) {
-                this.displayMedications(data.medications, data.recommendations);
+            if (this.useStreaming) {
+                await this.sendStreamingMessage(message);
+            } else {
+                await this.sendBufferedMessage(message);
             }
-            
-            // Handle next question suggestions
-            if (data.next_question) {
-                this.addSuggestionButtons([data.next_question]);
-            }
-            
         } catch (error) {
             console.error('Error sending message:', error);
             this.addMessage('I apologize, but I encountered an error. Please try again or contact support if the problem persists.', 'bot');
@@ -121,6 +96,120 @@ class HealthAIChat {
         }
     }
 
+    async sendBufferedMessage(message) {
+        // Send to backend
+        const response = await fetch('/api/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                message: message,
+                session_id: this.sessionId
+            })
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const data = await response.json();
+        
+        // Add bot response to chat
+        this.addMessage(data.response, 'bot');
+        this.handleResponseExtras(data);
+    }
+
+    async sendStreamingMessage(message) {
+        // Stream the response as Server-Sent Events and render tokens as they arrive
+        const response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({
+                message: message,
+                session_id: this.sessionId
+            })
+        });
+
+        if (!response.ok || !response.body) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        let meta = {};
+        let text = '';
+        let messageText = null;
+
+        await this.readEventStream(response, (event, data) => {
+            if (event === 'meta') {
+                meta = data;
+            } else if (event === 'token') {
+                text += data.text;
+                if (!messageText) {
+                    // First token arrived - swap the spinner for the message
+                    this.hideLoading();
+                    messageText = this.addMessage(text, 'bot');
+                } else {
+                    messageText.innerHTML = this.formatMessage(text);
+                    this.scrollToBottom();
+                }
+            } else if (event === 'error') {
+                console.error('Stream error:', data.error);
+            }
+        });
+
+        if (!messageText) {
+            throw new Error('Empty response stream');
+        }
+        this.handleResponseExtras(meta);
+    }
+
+    async readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                const dataLines = [];
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                });
+
+                if (dataLines.length > 0) {
+                    onEvent(event, JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+
+    handleResponseExtras(data) {
+        // Handle medication suggestions and recommendations
+        if (data.medications && data.medications.length > 0) {
+            this.displayMedications(data.medications, data.recommendations);
+        }
+        
+        // Handle next question suggestions
+        if (data.next_question) {
+            this.addSuggestionButtons([data.next_question]);
+        }
+    }
+
     sendQuickMessage(symptom) {
         const quickMessages = {
             'headache': 'I have a headache. Can you help me understand what might be causing it?',
@@ -164,6 +253,7 @@ class HealthAIChat {
         
         this.chatMessages.appendChild(messageDiv);
         this.scrollToBottom();
+        return messageText;
     }
 
     formatMessage(text) {
@@ -7,6 +7,13 @@ Tests the basic functionality of the HealthAI application
 import sys
 import os
 import json
+import tempfile
+
+import config
+
+# The chat tests post through the real app; keep their turns out of the tracked healthai.db
+_test_db_dir = tempfile.TemporaryDirectory(prefix='healthai-test-')
+config.DATABASE_PATH = os.path.join(_test_db_dir.name, 'healthai.db')
 
 def test_imports():
     """Test if all required modules can be imported."""
@@ -127,6 +134,1084 @@ def test_flask_app():
         print(f"❌ Flask app test failed: {e}")
         return False
 
+def test_chat_stream_endpoint():
+    """Test the SSE event order and bad-body handling of the chat endpoints."""
+    print("\nTesting chat stream endpoint...")
+    
+    try:
+        from app import app
+        
+        with app.test_client() as client:
+            response = client.post('/api/chat/stream', json={'message': 'I have a headache', 'session_id': 'sse-test'})
+            body = response.get_data(as_text=True)
+            events = [line[len('event: '):] for line in body.splitlines() if line.startswith('event: ')]
+            if response.status_code != 200 or response.mimetype != 'text/event-stream' or \
+                    events[0] != 'meta' or events[-1] != 'done' or set(events[1:-1]) != {'token'}:
+                print(f"❌ /api/chat/stream returned {response.status_code} with events {events}")
+                return False
+            done = json.loads(body.rsplit('data: ', 1)[1])
+            if not done['response']:
+                print("❌ 'done' event carries no response")
+                return False
+            
+            # Same 400s as the async serving mode
+            for path in ('/api/chat', '/api/chat/stream'):
+                for payload in ('not json', '["a list"]', '{"message": "  "}'):
+                    response = client.post(path, data=payload, content_type='application/json')
+                    if response.status_code != 400 or 'error' not in response.get_json():
+                        print(f"❌ {path} with body {payload!r} returned {response.status_code}")
+                        return False
+        
+        print("✅ /api/chat/stream emits meta, token and done events; bad bodies get 400")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat stream test failed: {e}")
+        return False
+
+def test_health_endpoints():
+    """Test liveness and readiness endpoints."""
+    print("\nTesting health endpoints...")
+    
+    try:
+        from app import app
+        
+        with app.test_client() as client:
+            response = client.get('/healthz')
+            if response.status_code == 200 and 'ai_model' in response.get_json():
+                print("✅ /healthz reports model load state")
+            else:
+                print(f"❌ /healthz returned status {response.status_code}")
+                return False
+            
+            response = client.get('/readyz')
+            if response.status_code in (200, 503):
+                print(f"✅ /readyz returned {response.status_code} ({response.get_json()['mode']})")
+            else:
+                print(f"❌ /readyz returned status {response.status_code}")
+                return False
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Health endpoint test failed: {e}")
+        return False
+
+def test_batch_scheduler():
+    """Test that concurrent prompts are batched and answered individually."""
+    print("\nTesting micro-batch scheduler...")
+    
+    try:
+        import threading
+        from models.batch_scheduler import MicroBatchScheduler
+        
+        scheduler = MicroBatchScheduler(lambda prompts: [p.upper() for p in prompts],
+                                        max_batch_size=4, max_wait_ms=50)
+        results = {}
+        threads = [
+            threading.Thread(target=lambda i=i: results.__setitem__(i, scheduler.submit(f"prompt {i}")))
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        stats = scheduler.get_stats()
+        if all(results[i] == f"PROMPT {i}" for i in range(4)) and stats['total_batches'] < 4:
+            print(f"✅ 4 prompts served in {stats['total_batches']} batch(es)")
+            return True
+        
+        print(f"❌ Unexpected batching result: {results}, {stats}")
+        return False
+        
+    except Exception as e:
+        print(f"❌ Batch scheduler test failed: {e}")
+        return False
+
+def test_response_cache():
+    """Test normalized keys, LRU eviction and TTL expiry of the response cache."""
+    print("\nTesting response cache...")
+    
+    try:
+        import time
+        from models.response_cache import ResponseCache
+        
+        cache = ResponseCache(max_size=2, ttl=60)
+        cache.put(cache.make_key('model', 'What is a cold?'), 'answer')
+        cache.put(cache.make_key('model', 'fever'), 'fever answer')
+        if cache.get(cache.make_key('model', '  what is a COLD ')) != 'answer':
+            print("❌ Normalized prompt did not hit the cache")
+            return False
+        
+        cache.put(cache.make_key('model', 'cough'), 'cough answer')
+        if cache.get(cache.make_key('model', 'fever')) is not None or cache.get_stats()['evictions'] != 1:
+            print("❌ Least recently used entry was not evicted")
+            return False
+        
+        short_lived = ResponseCache(max_size=2, ttl=0.01)
+        short_lived.put('key', 'value')
+        time.sleep(0.02)
+        if short_lived.get('key') is not None:
+            print("❌ Expired entry was served")
+            return False
+        
+        print(f"✅ Response cache working: {cache.get_stats()}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Response cache test failed: {e}")
+        return False
+
+def tiny_llama(words):
+    """Randomly initialised tiny Llama model and word-level tokenizer over the given words (offline).
+
+    The large initializer range keeps greedy decoding from collapsing onto one token,
+    and the model config has no pad id, so padding has a real embedding and any
+    attention to it shows up in the output.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    vocab = {'<pad>': 0, '<s>': 1, '</s>': 2, '<unk>': 3}
+    for word in words:
+        vocab.setdefault(word, len(vocab))
+    backend = Tokenizer(models.WordLevel(vocab, unk_token='<unk>'))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, pad_token='<pad>', bos_token='<s>',
+                                        eos_token='</s>', unk_token='<unk>', padding_side='left',
+                                        model_input_names=['input_ids', 'attention_mask'])
+
+    torch.manual_seed(0)
+    model_config = LlamaConfig(vocab_size=len(vocab), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                               num_attention_heads=4, max_position_embeddings=256,
+                               bos_token_id=1, eos_token_id=2, initializer_range=0.3)
+    return LlamaForCausalLM(model_config).eval(), tokenizer
+
+def test_prefix_cache():
+    """Test that generating on the cached prompt prefix matches plain generation."""
+    print("\nTesting prompt prefix cache...")
+
+    try:
+        import torch
+        from models.prefix_cache import PrefixKVCache
+
+        prefix = "You are a careful medical assistant . Answer briefly and safely . "
+        suffixes = ["User : headache", "User : I have had a fever and a cough since yesterday",
+                    "User : my knee hurts when I walk up stairs"]
+        prompts = [prefix + suffix for suffix in suffixes]
+        model, tokenizer = tiny_llama(" ".join(prompts).split())
+        # Special tokens are suppressed so every row generates all 12 tokens
+        generate_kwargs = {'max_new_tokens': 12, 'do_sample': False, 'pad_token_id': tokenizer.pad_token_id,
+                           'suppress_tokens': tokenizer.all_special_ids}
+
+        with torch.no_grad():
+            plain_inputs = tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False)
+            plain = model.generate(**plain_inputs, **generate_kwargs)
+            plain = plain[:, plain_inputs['input_ids'].shape[1]:]
+
+            cache = PrefixKVCache(model, tokenizer, prefix)
+            cache.warmup(runs=1)
+            cached_inputs, prompt_length = cache.prepare(prompts)
+            cached = model.generate(**cached_inputs, **generate_kwargs)[:, prompt_length:]
+
+        if not torch.equal(plain, cached):
+            print(f"❌ Prefix-cached greedy output differs:\n{plain.tolist()}\n{cached.tolist()}")
+            return False
+
+        print(f"✅ Greedy output identical with and without the prefix cache: {cache.get_stats()['prefix_tokens']} "
+              f"prefix tokens, {len(prompts)} prompts of different lengths")
+        return True
+
+    except Exception as e:
+        print(f"❌ Prefix cache test failed: {e}")
+        return False
+
+def test_model_precision():
+    """Test precision settings and that an int8 model is quantized and still generates."""
+    print("\nTesting model precision...")
+
+    try:
+        import torch
+        from models.qwen_model import QwenMedicalAssistant
+
+        model, tokenizer = tiny_llama("I have a headache and a fever".split())
+        saved_name = config.AI_MODEL_NAME
+        with tempfile.TemporaryDirectory() as tmp:
+            model.save_pretrained(tmp)
+            tokenizer.save_pretrained(tmp)
+            config.AI_MODEL_NAME = tmp
+            try:
+                assistant = QwenMedicalAssistant(precision='int8')
+            finally:
+                config.AI_MODEL_NAME = saved_name
+
+        if assistant.load_state != 'ready' or assistant.precision != 'int8':
+            print(f"❌ int8 model did not load: {assistant.get_load_status()}")
+            return False
+        linears = [type(module) for module in assistant.model.modules()
+                   if isinstance(module, (torch.nn.Linear, torch.ao.nn.quantized.dynamic.Linear))]
+        if not linears or any(kind is not torch.ao.nn.quantized.dynamic.Linear for kind in linears):
+            print(f"❌ Linear layers not all dynamically quantized: {set(linears)}")
+            return False
+        if not isinstance(assistant._generate_batch([assistant._build_prompt("I have a headache")])[0], str):
+            print("❌ int8 model did not generate")
+            return False
+
+        # On CPU: "auto" and unknown values load float32, bf16 loads bfloat16
+        resolved = {value: assistant._resolve_precision(value) for value in ('auto', 'BF16', 'fp32', 'bogus')}
+        if resolved != {'auto': 'fp32', 'BF16': 'bf16', 'fp32': 'fp32', 'bogus': 'fp32'}:
+            print(f"❌ Unexpected precision mapping: {resolved}")
+            return False
+        assistant.precision = 'bf16'
+        if assistant._load_dtype() is not torch.bfloat16:
+            print(f"❌ bf16 loads as {assistant._load_dtype()}")
+            return False
+
+        print(f"✅ int8 replaced {len(linears)} Linear layers with dynamic quantized ones and generates; "
+              f"precision settings map to {resolved}")
+        return True
+
+    except Exception as e:
+        print(f"❌ Model precision test failed: {e}")
+        return False
+
+def test_term_index():
+    """Test single-pass symptom and emergency detection."""
+    print("\nTesting term index...")
+    
+    try:
+        from models.term_index import TermMatcher
+        from models.conversation_manager import ConversationManager
+        
+        matcher = TermMatcher()
+        for term in ['flu', 'chest pain', 'pain']:
+            matcher.add(term, term)
+        found = [payload for _, _, payload in matcher.iter_matches('Fluid intake, chest  pain and flu symptoms')]
+        if sorted(found) != ['chest pain', 'flu', 'pain']:
+            print(f"❌ Unexpected matches: {found}")
+            return False
+        
+        manager = ConversationManager()
+        detected = manager._detect_symptoms('I have headaches and a fever')
+        if detected != ['headache', 'fever']:
+            print(f"❌ Unexpected symptoms detected: {detected}")
+            return False
+        
+        # Aliases and typos go through the trigram index
+        detected = manager._detect_symptoms('headach, a feaver and a stomach ache')
+        if detected != ['headache', 'fever', 'abdominal_pain']:
+            print(f"❌ Fuzzy symptoms not detected: {detected}")
+            return False
+        if manager._detect_symptoms('I never felt fewer problems on the couch'):
+            print("❌ Fuzzy matching too loose")
+            return False
+        if not manager.term_index.find_emergencies('I have severe chest pain'):
+            print("❌ Emergency not detected")
+            return False
+        
+        print("✅ Term index matching whole words in one pass")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Term index test failed: {e}")
+        return False
+
+def test_emergency_triage():
+    """Test that emergency messages short-circuit before any model call."""
+    print("\nTesting emergency triage...")
+    
+    try:
+        from models.conversation_manager import ConversationManager
+        
+        manager = ConversationManager()
+        cases = {
+            'I have severe chest pain and difficulty breathing': ['Severe chest pain', 'Difficulty breathing'],
+            'My father cannot speak properly and his face is drooping': ['cannot speak', 'face is drooping'],
+            'She has facial drooping and arm weakness': ['facial drooping', 'arm weakness'],
+            'I have had a mild headache since this morning': [],
+        }
+        for message, expected in cases.items():
+            found = manager.term_index.find_emergencies(message)
+            if found != expected:
+                print(f"❌ find_emergencies({message!r}) = {found}, expected {expected}")
+                return False
+            
+            result = manager.process_message('triage-test', message)
+            is_emergency = result.get('stage') == 'emergency'
+            if is_emergency != bool(expected):
+                print(f"❌ {message!r} went to stage {result.get('stage')}")
+                return False
+            # Each sign is named once in the reply
+            if expected and result['response'].lower().count('chest pain') > 1:
+                print("❌ Emergency reply repeats overlapping terms")
+                return False
+        
+        print("✅ Chest pain and stroke messages take the triage fast path, others do not")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Emergency triage test failed: {e}")
+        return False
+
+def test_conversation_writer():
+    """Test that queued chat turns are written in batches and flushed on close."""
+    print("\nTesting conversation writer...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from models.conversation_store import ConversationWriter
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'test.db')
+            writer = ConversationWriter(db_path, batch_size=10, flush_interval=0.05)
+            for i in range(25):
+                writer.enqueue(f'session_{i % 3}', f'message {i}', f'response {i}')
+            writer.close()
+            
+            conn = sqlite3.connect(db_path)
+            messages = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+            sessions = conn.execute('SELECT COUNT(*) FROM chat_sessions').fetchone()[0]
+            conn.close()
+        
+        if messages == 25 and sessions == 3:
+            print(f"✅ 25 messages written in {writer.get_stats()['batches_written']} batches")
+            return True
+        
+        print(f"❌ Expected 25 messages and 3 sessions, found {messages} and {sessions}")
+        return False
+        
+    except Exception as e:
+        print(f"❌ Conversation writer test failed: {e}")
+        return False
+
+def test_history_paging():
+    """Test keyset paging of session history, including timestamp ties."""
+    print("\nTesting history paging...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        import app as app_module
+        from models.conversation_store import ConversationHistory, init_schema
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'history.db')
+            conn = sqlite3.connect(db_path)
+            init_schema(conn)
+            # Three messages share each timestamp, so pages must split ties by id
+            timestamps = ['2024-01-01 10:00:00'] * 3 + ['2024-01-01 10:00:01'] * 3 + ['2024-01-01 10:00:02']
+            for number, timestamp in enumerate(timestamps):
+                conn.execute('INSERT INTO messages (session_id, message, response, timestamp) VALUES (?, ?, ?, ?)',
+                             ('paged', f'm{number}', f'r{number}', timestamp))
+            conn.execute('INSERT INTO messages (session_id, message, response, timestamp) VALUES (?, ?, ?, ?)',
+                         ('other', 'x', 'y', '2024-01-01 10:00:01'))
+            conn.commit()
+            conn.close()
+            expected = [f'm{number}' for number in range(len(timestamps))]
+            
+            history = ConversationHistory(db_path)
+            
+            # Newest page first, then older pages through next_cursor
+            pages = [history.get_messages('paged', limit=3)]
+            while pages[-1]['next_cursor']:
+                pages.append(history.get_messages('paged', limit=3, before=pages[-1]['next_cursor']))
+            older = [message['message'] for page in reversed(pages) for message in page['messages']]
+            if older != expected or [len(page['messages']) for page in pages] != [3, 3, 1]:
+                print(f"❌ Paging back returned {older}")
+                return False
+            
+            # And forward again from the oldest page through prev_cursor
+            page = pages[-1]
+            newer = [message['message'] for message in page['messages']]
+            while page['prev_cursor']:
+                page = history.get_messages('paged', limit=3, after=page['prev_cursor'])
+                newer.extend(message['message'] for message in page['messages'])
+            if newer != expected:
+                print(f"❌ Paging forward returned {newer}")
+                return False
+            
+            saved = app_module.conversation_history
+            app_module.conversation_history = history
+            try:
+                with app_module.app.test_client() as client:
+                    first = client.get('/api/sessions/paged/messages?limit=4').get_json()
+                    second = client.get(f"/api/sessions/paged/messages?limit=4&before={first['next_cursor']}")
+                    malformed = client.get('/api/sessions/paged/messages?before=not-a-cursor')
+            finally:
+                app_module.conversation_history = saved
+            
+            pages = [message['message'] for message in second.get_json()['messages'] + first['messages']]
+            if pages != expected or second.get_json()['next_cursor'] is not None:
+                print(f"❌ History endpoint pages returned {pages}")
+                return False
+            if malformed.status_code != 400 or 'error' not in malformed.get_json():
+                print(f"❌ Malformed cursor returned {malformed.status_code}")
+                return False
+        
+        print("✅ History pages split timestamp ties and reject malformed cursors")
+        return True
+        
+    except Exception as e:
+        print(f"❌ History paging test failed: {e}")
+        return False
+
+def test_session_store():
+    """Test LRU eviction and idle expiry of conversation states."""
+    print("\nTesting session store...")
+    
+    try:
+        import time
+        from models.session_store import InMemorySessionStore
+        
+        store = InMemorySessionStore(max_sessions=2, ttl=60)
+        store.get('a').stage = 'gathering_symptoms'
+        store.get('b')
+        store.get('a')
+        store.get('c')  # evicts 'b', the least recently used
+        stats = store.get_stats()
+        if store.get('a').stage != 'gathering_symptoms' or stats['evictions'] != 1:
+            print(f"❌ Unexpected eviction result: {stats}")
+            return False
+        
+        idle = InMemorySessionStore(max_sessions=10, ttl=0.01)
+        idle.get('a').stage = 'suggesting'
+        time.sleep(0.02)
+        if idle.get('a').stage != 'initial' or idle.get_stats()['expirations'] != 1:
+            print("❌ Idle session did not expire")
+            return False
+        
+        print(f"✅ Session store bounded: {stats}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Session store test failed: {e}")
+        return False
+
+def test_shared_session_stores():
+    """Test round trips and idle expiry of the SQLite and shared-memory session stores."""
+    print("\nTesting shared session stores...")
+    
+    try:
+        import tempfile
+        import time
+        import uuid
+        from models.session_store import ConversationState, SQLiteSessionStore, SharedMemorySessionStore
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'sessions.db')
+            shm_name = f"healthai_test_{uuid.uuid4().hex[:12]}"
+            # A second instance on the same database or segment stands in for another worker
+            backends = [
+                (SQLiteSessionStore(db_path, ttl=0.2, cleanup_interval=0),
+                 SQLiteSessionStore(db_path, ttl=0.2, cleanup_interval=0)),
+                (SharedMemorySessionStore(name=shm_name, buckets=8, slots_per_bucket=2, ttl=0.2),
+                 SharedMemorySessionStore(name=shm_name, buckets=8, slots_per_bucket=2, ttl=0.2)),
+            ]
+            try:
+                for writer, reader in backends:
+                    backend = type(writer).__name__
+                    state = ConversationState(stage='gathering_symptoms', symptoms=['headache', 'fever'],
+                                              symptom_details={'headache': 'since yesterday'}, question_index=2)
+                    writer.save('round-trip', state)
+                    if reader.get('round-trip').to_dict() != state.to_dict():
+                        print(f"❌ {backend} round trip returned {reader.get('round-trip').to_dict()}")
+                        return False
+                    if reader.get('unknown').stage != 'initial':
+                        print(f"❌ {backend} returned state for an unknown session")
+                        return False
+                    
+                    time.sleep(0.25)
+                    if reader.get('round-trip').stage != 'initial' or reader.get_stats()['live_sessions'] != 0:
+                        print(f"❌ {backend} idle session did not expire: {reader.get_stats()}")
+                        return False
+                
+                # The SQLite store also deletes expired rows
+                sqlite_store = backends[0][0]
+                sqlite_store.save('other', ConversationState())
+                if sqlite_store.get_stats()['expirations'] != 1:
+                    print(f"❌ Expired SQLite rows not deleted: {sqlite_store.get_stats()}")
+                    return False
+
+                # A state too large for a slot is cut down to fit, never written past it
+                shm_store = backends[1][0]
+                symptoms = [f"symptom {number} " + "x" * 100 for number in range(40)]
+                shm_store.save('too-large', ConversationState(stage='gathering_symptoms', symptoms=symptoms,
+                                                              symptom_details={name: "y" * 500 for name in symptoms}))
+                shm_store.save('neighbour', ConversationState(stage='assessment'))
+                stored = shm_store.get('too-large')
+                if stored.stage != 'gathering_symptoms' or not stored.symptoms or \
+                        stored.symptoms != symptoms[:len(stored.symptoms)] or stored.symptom_details:
+                    print(f"❌ Oversized state stored as {stored.to_dict()}")
+                    return False
+                if shm_store.get('neighbour').stage != 'assessment':
+                    print("❌ Oversized state overwrote another session")
+                    return False
+            finally:
+                backends[1][1].close()
+                backends[1][0].close(unlink=True)
+        
+        print("✅ SQLite and shared-memory session stores round-trip and expire idle sessions")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Shared session store test failed: {e}")
+        return False
+
+def test_knowledge_reload():
+    """Test that an edited knowledge file swaps in a new snapshot."""
+    print("\nTesting knowledge reload...")
+    
+    try:
+        import json
+        import os
+        import tempfile
+        from models.knowledge_store import KnowledgeStore
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'knowledge.json')
+            with open(path, 'w') as f:
+                json.dump({'symptoms': {'headache': {'common_causes': ['stress']}}}, f)
+            store = KnowledgeStore(path, poll_interval=0)
+            old = store.current
+            
+            with open(path, 'w') as f:
+                json.dump({'symptoms': {'rash': {'common_causes': ['allergy']}}}, f)
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+            if not store.reload_if_changed() or store.current.version == old.version:
+                print("❌ Edited knowledge file was not reloaded")
+                return False
+            
+            # Readers holding the old snapshot keep a consistent view
+            if old.term_index.detect_symptoms("lots of stress") != ['headache']:
+                print("❌ Old snapshot changed after reload")
+                return False
+            if store.current.term_index.detect_symptoms("allergy season") != ['rash']:
+                print("❌ New snapshot indexes were not rebuilt")
+                return False
+            
+            # A broken edit is reported once and the current snapshot stays in place
+            current = store.current
+            with open(path, 'w') as f:
+                f.write('{"symptoms": ')
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2))
+            for _ in range(3):
+                store.reload_if_changed()
+            if store.reload_errors != 1 or store.current is not current:
+                print(f"❌ Invalid knowledge file handled badly: {store.get_stats()}")
+                return False
+        
+        print(f"✅ Knowledge reloaded: {old.version} -> {store.current.version}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Knowledge reload test failed: {e}")
+        return False
+
+def test_question_bank():
+    """Test the pre-rendered follow-up questions and the flow that asks them."""
+    print("\nTesting question bank...")
+    
+    try:
+        from models.conversation_manager import ConversationManager
+        from models.question_bank import QuestionBank
+        
+        with open('data/medical_knowledge.json', 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        bank = QuestionBank(data)
+        headache = data['follow_up_questions']['headache']
+        
+        first = bank.first_prompt('headache')
+        if first.question != headache['questions'][0] or not first.response.startswith(headache['intro']):
+            print(f"❌ Unexpected opening prompt: {first}")
+            return False
+        if [prompt.question for prompt in bank.prompts_for('headache')] != headache['questions']:
+            print("❌ Headache prompts out of order")
+            return False
+        default = data['follow_up_questions']['default']['questions']
+        if bank.question_count('rash') != len(default) or bank.prompts_for('rash')[0].question != default[0]:
+            print("❌ Symptom without questions did not get the default set")
+            return False
+        try:
+            bank._prompts['headache'] = ()
+            print("❌ Question bank is mutable")
+            return False
+        except TypeError:
+            pass
+        
+        # The symptom flow asks the bank's questions in order
+        manager = ConversationManager()
+        asked = [manager.process_message('bank-test', 'I have a headache')['response']]
+        asked.append(manager.process_message('bank-test', 'Since yesterday')['response'])
+        if asked != [first.response, bank.prompts_for('headache')[1].response]:
+            print(f"❌ Symptom flow asked {asked}")
+            return False
+        
+        print(f"✅ Question bank serves {len(headache['questions'])} headache questions in order")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Question bank test failed: {e}")
+        return False
+
+def test_retrieval_index():
+    """Test passage ranking and the on-disk index cache."""
+    print("\nTesting retrieval index...")
+    
+    try:
+        import tempfile
+        from models.retrieval_index import RetrievalIndex
+        
+        with open('data/medical_knowledge.json', 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = RetrievalIndex.build(data, version='v1', n_features=4096)
+        
+        queries = ['How should I treat a burn?', 'my head hurts a lot', 'zzzz qqqq']
+        results = index.search_batch(queries, k=1, min_score=0.05)
+        top = [[passage.chunk_id for passage in passages] for passages in results]
+        if top != [['first_aid:burns'], ['symptom:headache'], []]:
+            print(f"❌ Unexpected top passages: {top}")
+            return False
+        context = index.build_context('How should I treat a burn?', k=1, min_score=0.05)
+        if 'First aid for burns' not in context or index.build_context('zzzz qqqq', min_score=0.05) != "":
+            print(f"❌ Unexpected prompt context: {context!r}")
+            return False
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'retrieval.npz')
+            index.save(path)
+            loaded = RetrievalIndex.load_or_build(data, 'v1', path, n_features=4096)
+            if loaded.version != 'v1' or len(loaded) != len(index) or (loaded.matrix != index.matrix).any():
+                print("❌ Saved index did not load back")
+                return False
+            # A new knowledge version rebuilds and replaces the file
+            RetrievalIndex.load_or_build(data, 'v2', path, n_features=4096)
+            if RetrievalIndex.load(path).version != 'v2':
+                print("❌ Stale index was reused")
+                return False
+        
+        print(f"✅ Retrieval index ranks {len(index)} passages and caches them on disk")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Retrieval index test failed: {e}")
+        return False
+
+def test_medication_catalog():
+    """Test deduplicated suggestions and pairwise catalog checks."""
+    print("\nTesting medication catalog...")
+    
+    try:
+        from models.medication_catalog import MedicationCatalog
+        
+        catalog = MedicationCatalog({'medication_catalog': {
+            'ingredients': {'acetaminophen': {'class': 'analgesic'}, 'ibuprofen': {'class': 'nsaid'},
+                            'aspirin': {'class': 'nsaid'}},
+            'products': {
+                'tylenol': {'name': 'Tylenol', 'ingredients': ['acetaminophen']},
+                'advil': {'name': 'Advil', 'ingredients': ['ibuprofen']},
+                'bayer': {'name': 'Bayer', 'ingredients': ['aspirin']},
+                'cold_combo': {'name': 'Cold Combo', 'ingredients': ['acetaminophen', 'phenylephrine']}
+            },
+            'interactions': [{'ingredients': ['ibuprofen', 'aspirin'], 'warning': 'Bleeding risk'}],
+            'symptom_treatments': {
+                'headache': {'medications': [{'product': 'tylenol'}, {'product': 'advil'}]},
+                'fever': {'medications': [{'product': 'tylenol'}, {'product': 'cold_combo'}]}
+            }
+        }})
+        
+        suggestions = catalog.suggest(['headache', 'fever'])
+        names = [med['name'] for med in suggestions.medications]
+        if names != ['Tylenol', 'Advil'] or suggestions.skipped != ['Cold Combo']:
+            print(f"❌ Suggestions not deduplicated: {names}, skipped {suggestions.skipped}")
+            return False
+        
+        if not catalog.is_duplicate('advil', 'bayer') or not catalog.interacts('bayer', 'advil'):
+            print("❌ Same-class pair not flagged")
+            return False
+        if catalog.interaction_warnings('advil', 'bayer') != ['Bleeding risk']:
+            print("❌ Interaction warning missing")
+            return False
+        
+        print(f"✅ Medication catalog checks passed: {catalog.check(['tylenol', 'advil', 'bayer', 'cold_combo'])}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Medication catalog test failed: {e}")
+        return False
+
+def test_context_builder():
+    """Test that prompt context stays within budget as a conversation grows."""
+    print("\nTesting conversation context...")
+    
+    try:
+        from models.context_builder import ConversationContextBuilder, estimate_tokens
+        
+        builder = ConversationContextBuilder(max_tokens=200, summary_max_tokens=50, max_turns=6)
+        if builder.build('new-session'):
+            print("❌ New session should have no context")
+            return False
+        
+        largest = 0
+        for i in range(50):
+            builder.record_turn('s1', f"Question {i} about my headache. It started today.", "Try resting. " * 20)
+            context = builder.build('s1')
+            largest = max(largest, estimate_tokens(context))
+        
+        if largest > 200 or 'Question 49' not in context or 'Question 45' not in context:
+            print(f"❌ Context not bounded or missing turns ({largest} tokens)")
+            return False
+
+        # A slow history load must not hold up sessions already in memory
+        import threading
+
+        class SlowHistory:
+            def __init__(self):
+                self.release = threading.Event()
+
+            def get_messages(self, session_id, limit=50):
+                if session_id == 'slow':
+                    self.release.wait(5)
+                return {'messages': [{'message': f"Earlier {session_id} question", 'response': "Earlier answer"}]}
+
+        history = SlowHistory()
+        loading = ConversationContextBuilder(history, max_tokens=200)
+        loading.record_turn('fast', "Hello", "Hi")
+        slow = threading.Thread(target=loading.build, args=('slow',))
+        slow.start()
+        try:
+            done = threading.Event()
+            record = lambda: (loading.record_turn('fast', "Again", "Hi"), done.set())
+            threading.Thread(target=record, daemon=True).start()
+            if not done.wait(1):
+                print("❌ A slow history load blocked another session")
+                return False
+        finally:
+            history.release.set()
+            slow.join()
+        if 'Earlier slow question' not in loading.build('slow') or loading.get_stats()['history_loads'] != 2:
+            print(f"❌ Slow session was not loaded once from history: {loading.get_stats()}")
+            return False
+
+        print(f"✅ Context bounded at {largest} tokens: {builder.get_stats()}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Context builder test failed: {e}")
+        return False
+
+def test_metrics_endpoint():
+    """Test per-stage timings and response paths in the Prometheus output."""
+    print("\nTesting metrics endpoint...")
+    
+    try:
+        from app import app
+        from models.conversation_manager import ConversationManager
+        
+        manager = ConversationManager()
+        manager.process_message('metrics-test', "I have a headache")
+        manager.process_message('metrics-test', "I can't breathe")
+        
+        with app.test_client() as client:
+            response = client.get('/metrics')
+            text = response.get_data(as_text=True)
+        
+        expected = [
+            '# TYPE healthai_chat_stage_seconds histogram',
+            'healthai_chat_stage_seconds_count{stage="detection"}',
+            'healthai_chat_stage_seconds_bucket{stage="triage",le="+Inf"}',
+            'healthai_responses_total{path="rules",source="triage"}',
+            'healthai_responses_total{path="rules",source="symptom_flow"}'
+        ]
+        missing = [line for line in expected if line not in text]
+        if response.status_code != 200 or missing:
+            print(f"❌ /metrics returned {response.status_code}, missing {missing}")
+            return False
+        
+        print(f"✅ /metrics exports {text.count('# TYPE')} metric families")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Metrics test failed: {e}")
+        return False
+
+def test_rate_limiter():
+    """Test token buckets and the 429 response."""
+    print("\nTesting rate limiter...")
+    
+    try:
+        import tempfile
+        import app as app_module
+        from models.rate_limiter import InMemoryRateLimiter, SQLiteRateLimiter
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            limiters = [InMemoryRateLimiter(60, burst=3), SQLiteRateLimiter(os.path.join(tmp, 'limits.db'), 60, burst=3)]
+            for limiter in limiters:
+                decisions = [limiter.acquire('ip:10.0.0.1') for _ in range(4)]
+                if [d.allowed for d in decisions] != [True, True, True, False] or not 0 < decisions[-1].retry_after <= 1:
+                    print(f"❌ {type(limiter).__name__} decisions: {decisions}")
+                    return False
+                if not limiter.acquire('ip:10.0.0.2').allowed:
+                    print("❌ Buckets are not independent per key")
+                    return False
+        
+        # Drain the test client's IP bucket, then expect a 429 before any model work
+        saved = app_module.rate_limiter
+        app_module.rate_limiter = InMemoryRateLimiter(60, burst=1)
+        try:
+            app_module.rate_limiter.acquire('ip:127.0.0.1')
+            with app_module.app.test_client() as client:
+                response = client.post('/api/chat', json={'message': 'Hello', 'session_id': 'rate-test'})
+        finally:
+            app_module.rate_limiter = saved
+        
+        if response.status_code != 429 or response.headers.get('Retry-After') != '1':
+            print(f"❌ Expected 429 with Retry-After, got {response.status_code} {dict(response.headers)}")
+            return False
+        
+        print("✅ Token buckets limit per key and /api/chat returns 429 with Retry-After")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Rate limiter test failed: {e}")
+        return False
+
+def test_request_coalescing():
+    """Test that concurrent identical calls share one in-flight call."""
+    print("\nTesting request coalescing...")
+    
+    try:
+        import threading
+        import time
+        from models.single_flight import SingleFlight
+        
+        flight = SingleFlight()
+        calls = []
+        
+        def slow_answer(question):
+            calls.append(question)
+            time.sleep(0.2)
+            return f"answer to {question}"
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('flu', slow_answer, 'flu')))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if len(calls) != 1 or {result for result, _ in results} != {"answer to flu"}:
+            print(f"❌ Expected one call and one answer, got calls={calls} results={results}")
+            return False
+        if sum(shared for _, shared in results) != 7 or flight.get_stats()['in_flight'] != 0:
+            print(f"❌ Unexpected coalescing stats: {flight.get_stats()}")
+            return False
+        
+        # Nothing is kept once the call finishes
+        flight.do('flu', slow_answer, 'flu')
+        if len(calls) != 2:
+            print("❌ A finished call was reused")
+            return False
+        
+        print("✅ Concurrent identical calls share one in-flight call")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Request coalescing test failed: {e}")
+        return False
+
+def test_circuit_breaker():
+    """Test that the circuit opens, refuses calls and closes after a good trial."""
+    print("\nTesting circuit breaker...")
+    
+    try:
+        import time
+        from models.circuit_breaker import CircuitBreaker
+        from models.free_ai_model import FreeAIModel
+        
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.1)
+        for _ in range(2):
+            breaker.allow_request()
+            breaker.record_failure()
+        if breaker.state != 'open' or breaker.allow_request():
+            print(f"❌ Circuit should be open and refusing calls: {breaker.get_stats()}")
+            return False
+        
+        time.sleep(0.15)
+        if not breaker.allow_request() or breaker.allow_request():
+            print("❌ Half-open circuit should allow exactly one trial call")
+            return False
+        breaker.record_success()
+        if breaker.state != 'closed':
+            print(f"❌ A successful trial should close the circuit: {breaker.get_stats()}")
+            return False
+        
+        # An open circuit answers from the fallback without calling the API
+        free_ai = FreeAIModel()
+        free_ai.breaker = CircuitBreaker('test_free_ai', failure_threshold=1, reset_timeout=60)
+        free_ai.breaker.record_failure()
+        free_ai.api_url = "http://127.0.0.1:9/unreachable"
+        started = time.perf_counter()
+        response = free_ai.get_response("I have a fever")
+        if "Fever" not in response or time.perf_counter() - started > 0.5 or free_ai.http.get_stats()['total_requests']:
+            print("❌ Open circuit did not serve the fallback immediately")
+            return False
+
+        # A call given up on at the budget must not hold its pool worker past it
+        if free_ai.http.timeout[1] > free_ai.request_budget:
+            print(f"❌ Read timeout {free_ai.http.timeout[1]}s outlasts the {free_ai.request_budget}s request budget")
+            return False
+
+        print("✅ Circuit opens on failures, serves the fallback at once and closes after a good trial")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Circuit breaker test failed: {e}")
+        return False
+
+def test_http_client_deadline():
+    """Test that a pooled API call gives up its worker at the deadline."""
+    print("\nTesting HTTP client deadline...")
+
+    try:
+        import time
+        import requests
+        from benchmark_chat import InferenceStub
+        from models.http_client import PooledHTTPClient
+
+        stub = InferenceStub(latency='fixed:1500').start()
+        client = PooledHTTPClient(pool_size=1, read_timeout=5, max_retries=2, backoff_base=0.01)
+        try:
+            started = time.monotonic()
+            future = client.post_async(f"{stub.base_url}/slow", json={'inputs': 'hi'}, deadline=started + 0.5)
+            try:
+                future.result(timeout=3)
+                print("❌ Slow call should have timed out")
+                return False
+            except requests.exceptions.Timeout:
+                pass
+            elapsed = time.monotonic() - started
+        finally:
+            client.close()
+            stub.stop()
+
+        if elapsed > 1.0:
+            print(f"❌ Worker was held {elapsed:.2f}s past a 0.5s deadline")
+            return False
+
+        attempts = client.get_stats()['total_attempts']
+        print(f"✅ Worker released {elapsed:.2f}s into a 0.5s deadline after {attempts} attempt(s)")
+        return True
+
+    except Exception as e:
+        print(f"❌ HTTP client deadline test failed: {e}")
+        return False
+
+def test_async_model_client():
+    """Test the async Inference API path against a local stub, across event loops."""
+    print("\nTesting async model client...")
+
+    try:
+        import asyncio
+        from benchmark_chat import STUB_REPLY, InferenceStub
+        from models.free_ai_model import FreeAIModel
+
+        async def stream(model, message):
+            return "".join([token async for token in model.stream_response_async(message)])
+
+        stub = InferenceStub(latency='fixed:0').start()
+        free_ai = FreeAIModel()
+        free_ai.api_url = f"{stub.base_url}/{free_ai.model_name}"
+        expected = STUB_REPLY.split('.')[0]
+        try:
+            # Each asyncio.run() is a new event loop, as in tests or a restarted server
+            answers = [asyncio.run(free_ai.get_response_async("What helps with a cold?")),
+                       asyncio.run(free_ai.get_response_async("How much sleep do adults need?")),
+                       asyncio.run(stream(free_ai, "Is it safe to exercise with a cold?"))]
+            asyncio.run(free_ai.async_http.close())
+        finally:
+            stub.stop()
+
+        if any(expected not in answer for answer in answers):
+            print(f"❌ Async answers did not come from the API: {answers}")
+            return False
+        stats = free_ai.get_stats()['async']
+        if stub.requests != 3 or stats['total_requests'] != 3 or stats['total_failures']:
+            print(f"❌ Expected 3 API calls, stub saw {stub.requests}: {stats}")
+            return False
+
+        print("✅ Async model calls and streams reach the API from successive event loops")
+        return True
+
+    except Exception as e:
+        print(f"❌ Async model client test failed: {e}")
+        return False
+
+def asgi_request(application, method, path, body=b'', client=('10.0.0.99', 40000)):
+    """Send one request straight to an ASGI app; returns (status, headers, body)."""
+    import asyncio
+    
+    messages = []
+    
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    
+    async def send(message):
+        messages.append(message)
+    
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+             'headers': [(b'content-type', b'application/json')], 'client': client, 'server': ('testserver', 80)}
+    asyncio.run(application(scope, receive, send))
+    start = next(message for message in messages if message['type'] == 'http.response.start')
+    content = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+    return start['status'], dict(start['headers']), content
+
+def test_asgi_app():
+    """Test the async chat routes of the ASGI app."""
+    print("\nTesting ASGI app...")
+    
+    try:
+        import asgi
+        
+        body = json.dumps({'message': 'I have a headache', 'session_id': 'asgi-test'}).encode()
+        status, _, content = asgi_request(asgi.application, 'POST', '/api/chat', body)
+        data = json.loads(content)
+        if status != 200 or data.get('stage') != 'gathering_symptoms' or not data.get('response'):
+            print(f"❌ /api/chat returned {status}: {data}")
+            return False
+        
+        body = json.dumps({'message': 'I have a fever', 'session_id': 'asgi-stream'}).encode()
+        status, headers, content = asgi_request(asgi.application, 'POST', '/api/chat/stream', body)
+        events = [line[len('event: '):] for line in content.decode().splitlines() if line.startswith('event: ')]
+        if status != 200 or not headers[b'content-type'].startswith(b'text/event-stream') or \
+                events[0] != 'meta' or events[-1] != 'done' or 'token' not in events:
+            print(f"❌ /api/chat/stream returned {status} with events {events}")
+            return False
+        
+        for path in ('/api/chat', '/api/chat/stream'):
+            for body in (b'not json', b'["a list"]', b'{"message": "   "}'):
+                status, _, content = asgi_request(asgi.application, 'POST', path, body)
+                if status != 400 or 'error' not in json.loads(content):
+                    print(f"❌ {path} with body {body!r} returned {status}")
+                    return False
+        
+        # Other routes go through the Flask app
+        status, _, _ = asgi_request(asgi.application, 'GET', '/healthz')
+        if status != 200:
+            print(f"❌ /healthz through the ASGI app returned {status}")
+            return False
+        
+        print("✅ ASGI chat, stream and bad-body handling work")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ASGI app test failed: {e}")
+        return False
+
 def main():
     """Run all tests."""
     print("🏥 HealthAI Application Test Suite")
@@ -136,7 +1221,31 @@ def main():
         test_imports,
         test_medical_database,
         test_models,
-        test_flask_app
+        test_flask_app,
+        test_chat_stream_endpoint,
+        test_health_endpoints,
+        test_batch_scheduler,
+        test_response_cache,
+        test_prefix_cache,
+        test_model_precision,
+        test_term_index,
+        test_emergency_triage,
+        test_conversation_writer,
+        test_history_paging,
+        test_session_store,
+        test_shared_session_stores,
+        test_knowledge_reload,
+        test_question_bank,
+        test_medication_catalog,
+        test_retrieval_index,
+        test_context_builder,
+        test_metrics_endpoint,
+        test_rate_limiter,
+        test_request_coalescing,
+        test_circuit_breaker,
+        test_http_client_deadline,
+        test_async_model_client,
+        test_asgi_app
     ]
     
     passed = 0